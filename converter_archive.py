@@ -0,0 +1,332 @@
+"""Persistent index of finished conversions, so repeat requests skip all the work.
+
+Rows map (video ID, encoding settings) to an output file together with its size,
+modification time and SHA-256. A lookup only trusts a row while the file is
+still there with the recorded size and mtime; stale rows are dropped.
+
+Finished outputs are also kept in a content-addressed store, one file per
+SHA-256, linked rather than copied from the output. A request for a video that
+was already converted into another folder (or whose output has since been
+deleted) is met by reflinking or hardlinking the stored file into place; data
+is only copied when the target is on another filesystem.
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no reflinks, hardlinks still work on NTFS
+    fcntl = None
+
+from converter_engine import SETTINGS_DIR, reserve_path
+
+
+ARCHIVE_FILE = os.path.join(SETTINGS_DIR, "archive.db")
+STORE_DIR = os.path.join(SETTINGS_DIR, "store")
+
+# Read size used when hashing outputs
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Space the store may use for files no output links to any more; least recently used go first
+DEFAULT_STORE_LIMIT = 2 * 1024 * 1024 * 1024
+
+# Linux ioctl that makes one file share another's blocks copy-on-write (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+# How place() made an output available
+PLACED_EXISTING = "existing"
+PLACED_REFLINK = "reflink"
+PLACED_HARDLINK = "hardlink"
+PLACED_COPY = "copy"
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def same_dir(a, b):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def reflink(src, dest):
+    """Clone src into dest without copying data; raises OSError where the filesystem cannot"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dest)
+
+
+def link_file(src, dest, allow_copy=True):
+    """Give the existing file dest src's content as cheaply as possible
+
+    Tries a reflink (independent copy sharing the same blocks), then a hardlink
+    (same file under a second name), then a plain copy. Returns which one was
+    used; without allow_copy, raises OSError instead of copying.
+    """
+    try:
+        reflink(src, dest)
+        return PLACED_REFLINK
+    except OSError:
+        pass
+
+    tmp_path = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.link")
+    try:
+        os.link(src, tmp_path)
+        os.replace(tmp_path, dest)
+        return PLACED_HARDLINK
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not allow_copy:
+            raise
+
+    shutil.copy2(src, dest)
+    return PLACED_COPY
+
+
+def same_device(path, folder):
+    try:
+        return os.stat(path).st_dev == os.stat(folder).st_dev
+    except OSError:
+        return False
+
+
+class DownloadArchive:
+    def __init__(self, path=ARCHIVE_FILE, store_dir=STORE_DIR, store_limit=DEFAULT_STORE_LIMIT):
+        self.path = path
+        # Content-addressed copies of finished outputs; None disables the store
+        self.store_dir = store_dir
+        self.store_limit = store_limit
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # One connection shared by all workers, serialised by a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS outputs (
+                    video_id TEXT NOT NULL,
+                    settings_key TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    title TEXT,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, settings_key, path)
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    settings_key TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    title TEXT,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS blobs_by_video ON blobs (video_id, settings_key)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, video_id, settings_key, save_path=None):
+        """Return the best still-valid entry for a video, preferring one already in save_path
+
+        Falls back to the stored copy when no recorded output is left. Entries
+        carry the stored copy's path as 'blob' when there is one, for place().
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, title, size, mtime, sha256 FROM outputs WHERE video_id = ? AND settings_key = ?",
+                (video_id, settings_key),
+            ).fetchall()
+
+        valid = []
+        for path, title, size, mtime, sha256 in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_size != size or abs(stat.st_mtime - mtime) > 1e-3:
+                self.forget(video_id, settings_key, path)
+                continue
+            valid.append({'path': path, 'title': title, 'size': size, 'sha256': sha256})
+
+        blob = self._stored(video_id, settings_key)
+        for entry in valid:
+            entry['blob'] = blob['path'] if blob and blob['sha256'] == entry['sha256'] else None
+
+        if save_path:
+            for entry in valid:
+                if same_dir(os.path.dirname(entry['path']), save_path):
+                    return entry
+        if valid:
+            return valid[0]
+        if blob:
+            return {'path': blob['path'], 'title': blob['title'], 'size': blob['size'], 'sha256': blob['sha256'],
+                    'blob': blob['path'], 'name': blob['name']}
+        return None
+
+    def _stored(self, video_id, settings_key):
+        """The newest intact stored copy for a video, checked against its hash if it changed on disk"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT sha256, path, name, title, size, mtime FROM blobs WHERE video_id = ? AND settings_key = ? "
+                "ORDER BY last_used DESC",
+                (video_id, settings_key),
+            ).fetchall()
+
+        for sha256, path, name, title, size, mtime in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._drop_blob(sha256, path)
+                continue
+            if stat.st_size != size or abs(stat.st_mtime - mtime) > 1e-3:
+                # A hardlinked output was edited in place; only keep the blob if the bytes are unchanged
+                try:
+                    intact = file_sha256(path) == sha256
+                except OSError:
+                    intact = False
+                if not intact:
+                    self._drop_blob(sha256, path)
+                    continue
+                with self._lock, self._db:
+                    self._db.execute("UPDATE blobs SET mtime = ? WHERE sha256 = ?", (stat.st_mtime, sha256))
+            return {'sha256': sha256, 'path': path, 'name': name, 'title': title, 'size': size}
+        return None
+
+    def _drop_blob(self, sha256, path):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def store(self, video_id, settings_key, path, title=None, sha256=None):
+        """Add a finished output to the content-addressed store; returns the stored path or None
+
+        Only reflinks and hardlinks are used, so storing never duplicates data;
+        an output on another filesystem than the store is simply not stored.
+        """
+        if not self.store_dir:
+            return None
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        blob_dir = os.path.join(self.store_dir, sha256[:2])
+        blob_path = os.path.join(blob_dir, sha256 + os.path.splitext(path)[1])
+        if not os.path.exists(blob_path):
+            os.makedirs(blob_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=blob_dir, prefix='.', suffix='.part')
+            os.close(fd)
+            try:
+                link_file(path, tmp_path, allow_copy=False)
+                os.replace(tmp_path, blob_path)
+            except OSError:
+                os.remove(tmp_path)
+                return None
+
+        stat = os.stat(blob_path)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, video_id, settings_key, blob_path, os.path.basename(path), title, stat.st_size,
+                 stat.st_mtime, now),
+            )
+        self.prune_store()
+        return blob_path
+
+    def prune_store(self, limit=None):
+        """Delete least recently used stored files no output links to until they fit in limit bytes"""
+        limit = self.store_limit if limit is None else limit
+        with self._lock:
+            rows = self._db.execute("SELECT sha256, path FROM blobs ORDER BY last_used").fetchall()
+
+        # Hardlinked blobs still shared with an output take no space of their own
+        unshared = []
+        for sha256, path in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._drop_blob(sha256, path)
+                continue
+            if stat.st_nlink <= 1:
+                unshared.append((sha256, path, stat.st_size))
+
+        total = sum(size for _, _, size in unshared)
+        for sha256, path, size in unshared:
+            if total <= limit:
+                break
+            self._drop_blob(sha256, path)
+            total -= size
+
+    def record(self, video_id, settings_key, path, title=None, sha256=None):
+        """Remember a finished output and store it; hashes the file unless sha256 is given"""
+        stat = os.stat(path)
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, settings_key, os.path.abspath(path), title, stat.st_size, stat.st_mtime,
+                 sha256, time.time()),
+            )
+        self.store(video_id, settings_key, path, title, sha256)
+        return sha256
+
+    def forget(self, video_id, settings_key, path):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM outputs WHERE video_id = ? AND settings_key = ? AND path = ?",
+                (video_id, settings_key, path),
+            )
+
+    def verify(self, entry):
+        """Re-hash an entry's file and compare it with the recorded checksum"""
+        try:
+            return file_sha256(entry['path']) == entry['sha256']
+        except OSError:
+            return False
+
+    def place(self, entry, save_path, filename=None):
+        """Make an archived output available in save_path; returns (path, how it was placed)
+
+        The source is whichever of the recorded output and the stored copy sits
+        on the same filesystem as save_path, so it can be linked instead of copied.
+        """
+        if entry['path'] != entry.get('blob') and same_dir(os.path.dirname(entry['path']), save_path):
+            return entry['path'], PLACED_EXISTING
+
+        sources = [path for path in (entry['path'], entry.get('blob')) if path]
+        source = next((path for path in sources if same_device(path, save_path)), sources[0])
+        dest = reserve_path(save_path, filename or entry.get('name') or os.path.basename(entry['path']))
+        try:
+            method = link_file(source, dest)
+        except Exception:
+            os.remove(dest)
+            raise
+        if entry.get('blob'):
+            with self._lock, self._db:
+                self._db.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), entry['sha256']))
+        return dest, method
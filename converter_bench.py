@@ -0,0 +1,489 @@
+"""Offline benchmark for the conversion pipeline.
+
+    python converter_bench.py -n 20 -j 4
+    python converter_bench.py -n 20 --stream -f opus
+    python converter_bench.py --tk             # also measure Tk event-loop lag
+
+A local HTTP server serves synthetic WAV audio (with Range support) and a
+stand-in extractor registered with yt-dlp resolves watch URLs to it, so the
+real download, encode and finalize code runs without touching YouTube. With
+--stub, or when yt-dlp is not installed, converter_stub's YoutubeDL stand-in
+fetches from the same server instead.
+
+Each run appends one JSON line to bench_output.txt with the commit, settings
+and results, so runs are comparable across commits.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import array
+import struct
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from converter_engine import Converter, DownloadQueue, DEFAULT_CODEC, DEFAULT_QUALITY
+from converter_ffmpeg import OUTPUT_CODECS
+from converter_metrics import snapshot
+from converter_stub import StubYoutubeDL
+
+
+BENCH_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_output.txt")
+
+# Synthetic source audio: CD-quality stereo WAV, a 440 Hz tone
+SAMPLE_RATE = 44100
+CHANNELS = 2
+DEFAULT_AUDIO_SECONDS = 30
+
+DEFAULT_JOBS = 10
+
+# Bytes the media server writes per send
+SERVE_CHUNK_SIZE = 64 * 1024
+
+# Milliseconds between Tk event-loop lag probes
+TK_PROBE_MS = 10
+
+# Converter options the --tk run copies from the headless converter, so both measure the same work
+BENCH_CONVERTER_SETTINGS = (
+    'ydl_class', 'archive', 'info_cache', 'streaming', 'codec', 'quality', 'split_chapters', 'segment_encoding',
+    'concurrent_fragments', 'http_chunk_size',
+)
+
+RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+def synthetic_wav(seconds):
+    """A WAV file of the given length, built in memory"""
+    one_second = array.array('h', (
+        int(8000 * math.sin(2 * math.pi * 440 * (n // CHANNELS) / SAMPLE_RATE))
+        for n in range(SAMPLE_RATE * CHANNELS)
+    ))
+    if sys.byteorder != 'little':
+        one_second.byteswap()
+    pcm = one_second.tobytes() * int(seconds)
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(pcm), b'WAVE', b'fmt ', 16, 1, CHANNELS, SAMPLE_RATE,
+        SAMPLE_RATE * CHANNELS * 2, CHANNELS * 2, 16, b'data', len(pcm),
+    )
+    return header + pcm
+
+
+# Serves the same synthetic audio under /media/<video id>.wav
+class MediaServer:
+    def __init__(self, audio_seconds=DEFAULT_AUDIO_SECONDS, bandwidth=None):
+        self.audio_seconds = audio_seconds
+        self.data = synthetic_wav(audio_seconds)
+        # Per-connection bytes per second, to simulate a slower network
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def media_url(self, video_id):
+        return f"{self.url}/media/{video_id}.wav"
+
+    def info(self, video_id, webpage_url=None):
+        """Info dict for a video, in the shape yt-dlp produces after format selection"""
+        return {
+            'id': video_id,
+            'title': f"Bench {video_id}",
+            'webpage_url': webpage_url or f"https://www.youtube.com/watch?v={video_id}",
+            'duration': self.audio_seconds,
+            'url': self.media_url(video_id),
+            'protocol': 'http',
+            'format_id': 'wav',
+            'ext': 'wav',
+            'acodec': 'pcm_s16le',
+            'vcodec': 'none',
+            'filesize': len(self.data),
+        }
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                server.requests += 1
+                if not self.path.startswith('/media/'):
+                    self.send_error(404)
+                    return
+                data = server.data
+                start, end = 0, len(data) - 1
+                match = RANGE_RE.match(self.headers.get('Range') or '')
+                if match:
+                    start = int(match.group(1))
+                    if match.group(2):
+                        end = min(int(match.group(2)), end)
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'audio/wav')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                if not send_body:
+                    return
+
+                position = start
+                started = time.time()
+                try:
+                    while position <= end:
+                        chunk = data[position:min(position + SERVE_CHUNK_SIZE, end + 1)]
+                        self.wfile.write(chunk)
+                        position += len(chunk)
+                        if server.bandwidth:
+                            ahead = (position - start) / server.bandwidth - (time.time() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+def ytdlp_class(media_server):
+    """yt_dlp.YoutubeDL with only a stand-in extractor that points at media_server"""
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class BenchIE(InfoExtractor):
+        IE_NAME = 'bench'
+        _VALID_URL = r'https?://(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/)(?P<id>[\w-]{11})'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            info = media_server.info(video_id, url)
+            fmt = {key: info.pop(key) for key in ('url', 'format_id', 'ext', 'acodec', 'vcodec', 'filesize')}
+            info.pop('protocol')
+            info['formats'] = [fmt]
+            return info
+
+    class BenchYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, params=None):
+            # No default extractors, so nothing can reach the real site
+            super().__init__(params, auto_init=False)
+            self.add_info_extractor(BenchIE())
+
+    return BenchYoutubeDL
+
+
+def stub_class(media_server):
+    """converter_stub's YoutubeDL stand-in, fetching from media_server over HTTP"""
+
+    class BenchStubYoutubeDL(StubYoutubeDL):
+        def _video_info(self, url):
+            info = super()._video_info(url)
+            info.update(media_server.info(info['id'], url))
+            return info
+
+        def _download(self, info):
+            outtmpl = self.params.get('outtmpl') or '%(title)s.%(ext)s'
+            if isinstance(outtmpl, dict):
+                outtmpl = outtmpl.get('default')
+            filepath = outtmpl % info
+            os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+
+            started = time.time()
+            downloaded = 0
+            total = info['filesize']
+            with urllib.request.urlopen(info['url']) as response, open(filepath + '.part', 'wb') as f:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    elapsed = max(time.time() - started, 1e-6)
+                    speed = downloaded / elapsed
+                    self._hook({
+                        'status': 'downloading',
+                        'downloaded_bytes': downloaded,
+                        'total_bytes': total,
+                        'speed': speed,
+                        'eta': int((total - downloaded) / speed),
+                        'filename': filepath,
+                    })
+            os.replace(filepath + '.part', filepath)
+            self._hook({'status': 'finished', 'downloaded_bytes': downloaded, 'total_bytes': total,
+                        'filename': filepath})
+            info['requested_downloads'] = [{'filepath': filepath}]
+
+    return BenchStubYoutubeDL
+
+
+def bench_urls(count):
+    run = f"{int(time.time()) % 0x10000:04x}"
+    return [f"https://www.youtube.com/watch?v=bn{run}{index:05d}" for index in range(count)]
+
+
+def peak_memory():
+    """Resident set high-water marks in KiB for this process and its children, if known"""
+    if resource is None:
+        return None, None
+    scale = 1024 if sys.platform == 'darwin' else 1
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return own, children
+
+
+def git_revision():
+    """Short commit hash of the working tree and whether it has local changes"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    return commit or None, bool(dirty)
+
+
+def run_headless(download_queue, urls, save_path):
+    for url in urls:
+        download_queue.submit(url, save_path)
+    download_queue.wait()
+    return None
+
+
+def run_with_tk(converter, args, urls, save_path):
+    """Drive the real GUI while measuring how late Tk timer callbacks fire"""
+    import tkinter as tk
+    import youtube_mp3_converter
+
+    # The app loads and saves its settings in a scratch folder, so the user's own
+    # settings neither shape the run nor get overwritten by it
+    settings_dir = tempfile.mkdtemp(prefix="converter_bench_settings_")
+    saved_paths = youtube_mp3_converter.SETTINGS_DIR, youtube_mp3_converter.SETTINGS_FILE
+    youtube_mp3_converter.SETTINGS_DIR = settings_dir
+    youtube_mp3_converter.SETTINGS_FILE = os.path.join(settings_dir, "settings.json")
+    try:
+        return _drive_tk(youtube_mp3_converter.ModernYouTubeDownloader, tk, converter, args, urls, save_path)
+    finally:
+        youtube_mp3_converter.SETTINGS_DIR, youtube_mp3_converter.SETTINGS_FILE = saved_paths
+        shutil.rmtree(settings_dir, ignore_errors=True)
+
+
+def _drive_tk(app_class, tk, converter, args, urls, save_path):
+    root = tk.Tk()
+    app = app_class(root)
+    # Marking start-up as done keeps the app away from the user's archive, info cache and
+    # journal, and from resuming their unfinished jobs
+    app.started = True
+    # Everything else that shapes the run matches the headless converter
+    for name in BENCH_CONVERTER_SETTINGS:
+        setattr(app.converter, name, getattr(converter, name))
+    app.converter.governor.set_limit(None)
+    app.download_queue.shortest_first = False
+    app.download_queue.set_max_workers(args.workers)
+    # No message boxes at the end of the batch
+    app.show_batch_result = lambda batch: None
+
+    app.save_entry.delete(0, tk.END)
+    app.save_entry.insert(0, save_path)
+    app.link_entry.insert(0, " ".join(urls))
+
+    lags = []
+    expected = [None]
+
+    def probe():
+        now = time.time()
+        if expected[0] is not None:
+            lags.append(max(0.0, now - expected[0]) * 1000)
+        if app.download_queue.is_idle() and not app.progress_bus.pending():
+            root.quit()
+            return
+        expected[0] = now + TK_PROBE_MS / 1000
+        root.after(TK_PROBE_MS, probe)
+
+    root.after(0, app.start_conversion)
+    root.after(TK_PROBE_MS, probe)
+    try:
+        root.mainloop()
+    finally:
+        sys.stdout = app.original_stdout
+        app.log_sink.close_file()
+        root.destroy()
+    return app.download_queue, lags
+
+
+def run(args):
+    media_server = MediaServer(args.audio_seconds, args.bandwidth * 1024 if args.bandwidth else None)
+    media_server.start()
+
+    ydl_class, extractor = None, 'yt-dlp'
+    if not args.stub:
+        try:
+            ydl_class = ytdlp_class(media_server)
+        except ImportError:
+            print("yt-dlp is not installed; using the stub extractor")
+    if ydl_class is None:
+        ydl_class, extractor = stub_class(media_server), 'stub'
+
+    save_path = tempfile.mkdtemp(prefix="converter_bench_")
+    converter = Converter(quiet=not args.verbose, ydl_class=ydl_class, streaming=args.stream,
+                          codec=args.codec, quality=args.quality)
+    download_queue = DownloadQueue(converter, max_workers=args.workers)
+    urls = bench_urls(args.jobs)
+
+    lags = None
+    started = time.time()
+    try:
+        if args.tk:
+            try:
+                download_queue, lags = run_with_tk(converter, args, urls, save_path)
+            except Exception as e:
+                print(f"Tk measurement unavailable ({e}); running headless")
+                run_headless(download_queue, urls, save_path)
+        else:
+            run_headless(download_queue, urls, save_path)
+        wall = time.time() - started
+    finally:
+        download_queue.close()
+        media_server.stop()
+        shutil.rmtree(save_path, ignore_errors=True)
+
+    jobs = download_queue.jobs()
+    summary = snapshot(jobs)
+    done = summary['counts']['done']
+    own_rss, children_rss = peak_memory()
+    commit, dirty = git_revision()
+    lag_summary = None
+    if lags is not None:
+        lag_summary = {
+            'samples': len(lags),
+            'p50_ms': round(sorted(lags)[len(lags) // 2], 2) if lags else None,
+            'p95_ms': round(sorted(lags)[int(len(lags) * 0.95)], 2) if lags else None,
+            'max_ms': round(max(lags), 2) if lags else None,
+        }
+
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'jobs': args.jobs,
+            'workers': args.workers,
+            'codec': args.codec,
+            'quality': args.quality,
+            'stream': args.stream,
+            'audio_seconds': args.audio_seconds,
+            'bandwidth_kib': args.bandwidth,
+            'extractor': extractor,
+            'tk': lags is not None,
+        },
+        'results': {
+            'wall_seconds': round(wall, 3),
+            'done': done,
+            'failed': summary['counts']['failed'],
+            'jobs_per_second': round(done / wall, 3) if wall else None,
+            'bytes_per_second': round(summary['bytes_downloaded'] / wall, 1) if wall else None,
+            'audio_seconds_per_second': round(done * args.audio_seconds / wall, 2) if wall else None,
+            'job_seconds': summary['job_seconds'],
+            'stage_seconds': summary['stage_seconds'],
+            'peak_rss_kib': own_rss,
+            'children_peak_rss_kib': children_rss,
+            'tk_lag': lag_summary,
+            'http_requests': media_server.requests,
+        },
+    }
+
+
+def print_report(report):
+    settings, results = report['settings'], report['results']
+    print(f"Commit {report['commit'] or 'unknown'}{' (modified)' if report['dirty'] else ''}, "
+          f"{settings['extractor']} extractor, {settings['jobs']} jobs x {settings['audio_seconds']}s audio, "
+          f"{settings['workers']} workers, {settings['codec']}{' streaming' if settings['stream'] else ''}")
+    print(f"  wall {results['wall_seconds']:.2f}s, {results['done']} done, {results['failed']} failed")
+    print(f"  throughput {results['jobs_per_second']} jobs/s, "
+          f"{(results['bytes_per_second'] or 0) / 1024 / 1024:.2f} MB/s, "
+          f"{results['audio_seconds_per_second']}x real time")
+    for stage, stats in results['stage_seconds'].items():
+        if stats['count']:
+            print(f"  {stage:<9} p50 {stats['p50'] * 1000:8.1f} ms   p95 {stats['p95'] * 1000:8.1f} ms")
+    if results['peak_rss_kib'] is not None:
+        print(f"  peak RSS {results['peak_rss_kib'] / 1024:.1f} MiB "
+              f"(children {results['children_peak_rss_kib'] / 1024:.1f} MiB)")
+    if results['tk_lag']:
+        lag = results['tk_lag']
+        print(f"  Tk lag p50 {lag['p50_ms']} ms, p95 {lag['p95_ms']} ms, max {lag['max_ms']} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the converter offline against a local media server.")
+    parser.add_argument('-n', '--jobs', type=int, default=DEFAULT_JOBS, metavar='N', help="number of videos to convert")
+    parser.add_argument('-j', '--workers', type=int, default=3, metavar='N', help="concurrent downloads")
+    parser.add_argument('-f', '--format', dest='codec', choices=OUTPUT_CODECS, default=DEFAULT_CODEC,
+                        help="output format")
+    parser.add_argument('-b', '--quality', default=DEFAULT_QUALITY, metavar='KBPS', help="output bitrate")
+    parser.add_argument('--stream', action='store_true', help="encode while downloading")
+    parser.add_argument('--audio-seconds', type=int, default=DEFAULT_AUDIO_SECONDS, metavar='S',
+                        help=f"length of each synthetic video (default: {DEFAULT_AUDIO_SECONDS})")
+    parser.add_argument('--bandwidth', type=int, metavar='KIB',
+                        help="limit each connection to this many KiB/s")
+    parser.add_argument('--stub', action='store_true', help="use the stub extractor even if yt-dlp is installed")
+    parser.add_argument('--tk', action='store_true', help="run through the GUI and measure Tk event-loop lag")
+    parser.add_argument('--label', help="free-form note stored with the results")
+    parser.add_argument('-o', '--output', default=BENCH_OUTPUT, metavar='FILE',
+                        help="append the results as a JSON line to FILE ('-' to skip)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print the engine's log output")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    if args.output != '-':
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+        print(f"Results appended to {args.output}")
+    return 1 if report['results']['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
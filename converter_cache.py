@@ -0,0 +1,152 @@
+"""Cache of yt-dlp info dicts, so a video's metadata is only resolved once.
+
+The memory tier is a size-bounded LRU. The optional disk tier keeps one JSON
+file per video so separate runs of the CLI share the work. Both tiers expire
+entries after a TTL, since the signed media URLs inside an info dict stop
+working after a few hours.
+"""
+import os
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from converter_engine import SETTINGS_DIR
+
+
+INFO_CACHE_DIR = os.path.join(SETTINGS_DIR, "info_cache")
+
+# Signed stream URLs last about six hours; stay well inside that
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_DISK_ENTRIES = 2048
+
+
+class InfoCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, video_id):
+        """Return a private copy of the cached info dict, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None:
+                stored_at, info = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(video_id)
+                    self.hits += 1
+                    return copy.deepcopy(info)
+                del self._entries[video_id]
+                self.expirations += 1
+
+        stored_at, info = self._read_disk(video_id)
+        if info is not None and now - stored_at <= self.ttl:
+            with self._lock:
+                self.disk_hits += 1
+                self._store(video_id, stored_at, info)
+            return copy.deepcopy(info)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, video_id, info):
+        """Cache a JSON-serialisable info dict (see YoutubeDL.sanitize_info)"""
+        stored_at = time.time()
+        info = copy.deepcopy(info)
+        with self._lock:
+            self._store(video_id, stored_at, info)
+        self._write_disk(video_id, stored_at, info)
+
+    def invalidate(self, video_id):
+        with self._lock:
+            self._entries.pop(video_id, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(video_id))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    def _store(self, video_id, stored_at, info):
+        # Called with the lock held
+        self._entries[video_id] = (stored_at, info)
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, video_id):
+        return os.path.join(self.disk_dir, f"{video_id}.json")
+
+    def _read_disk(self, video_id):
+        if not self.disk_dir:
+            return 0, None
+        try:
+            with open(self._disk_path(video_id), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['stored_at'], data['info']
+        except (OSError, ValueError, KeyError):
+            return 0, None
+
+    def _write_disk(self, video_id, stored_at, info):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(video_id)
+        try:
+            # Write then rename so concurrent readers never see half a file
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'info': info}, f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not write info cache entry: {e}")
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop expired files and the oldest ones beyond max_disk_entries"""
+        now = time.time()
+        try:
+            files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+            files = [(os.path.getmtime(path), path) for path in files]
+        except OSError:
+            return
+        files.sort()
+        excess = len(files) - self.max_disk_entries
+        for index, (mtime, path) in enumerate(files):
+            if index < excess or now - mtime > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,197 @@
+"""Command-line batch converter; runs without tkinter or a display.
+
+Examples:
+    python converter_cli.py https://youtu.be/VIDEO_ID
+    python converter_cli.py -i urls.txt -o ~/Music -j 4
+    cat urls.txt | python converter_cli.py -i -
+    python converter_cli.py --watch ~/url-drop
+
+URL lists are read lazily and fed to the queue with backpressure, so they
+can be arbitrarily long; repeated videos are only converted once.
+
+Exit status is 0 when every job succeeded, 1 when any job failed,
+2 for usage errors and 130 when interrupted.
+"""
+import os
+import sys
+import json
+import argparse
+
+from converter_archive import DownloadArchive
+from converter_cache import DEFAULT_TTL, INFO_CACHE_DIR, InfoCache
+from converter_engine import (
+    Converter, DownloadQueue, DEFAULT_CODEC, DEFAULT_CONCURRENT_FRAGMENTS, DEFAULT_MAX_WORKERS, DEFAULT_QUALITY, JOB_DONE, JOB_FAILED,
+    default_save_path, read_settings,
+)
+from converter_ffmpeg import HTTP_CHUNK_SIZE, OUTPUT_CODECS
+from converter_ingest import DEFAULT_MAX_PENDING, UrlIngester
+from converter_journal import JobJournal
+from converter_metrics import prometheus_text, snapshot
+from converter_network import DEFAULT_MAX_PER_HOST, BandwidthGovernor, HostBreaker, HostLimiter, parse_size
+from converter_retry import DEFAULT_MAX_RETRIES
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def build_parser(settings):
+    parser = argparse.ArgumentParser(
+        description="Convert YouTube videos, playlists and channels to MP3 without the GUI."
+    )
+    parser.add_argument('urls', nargs='*', metavar='URL', help="video, playlist or channel URL")
+    parser.add_argument('-i', '--input', action='append', default=[], metavar='FILE',
+                        help="read URLs from FILE, one per line ('-' for stdin); may be repeated")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="keep converting URLs from text files dropped into DIR until interrupted")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING, metavar='N',
+                        help=f"jobs read ahead of the downloads when ingesting lists (default: {DEFAULT_MAX_PENDING})")
+    parser.add_argument('-o', '--output', default=settings.get('save_location') or default_save_path(),
+                        metavar='DIR', help="save location (default: the GUI's save location)")
+    parser.add_argument('-j', '--workers', type=int, default=settings.get('max_workers') or DEFAULT_MAX_WORKERS,
+                        metavar='N', help="number of conversions to run at the same time")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print the final result of each job")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print yt-dlp debug output")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="always download again, even if a video was already converted")
+    parser.add_argument('-f', '--format', dest='codec', choices=OUTPUT_CODECS,
+                        default=settings.get('codec') or DEFAULT_CODEC,
+                        help="output format; m4a/opus remux without re-encoding when the source allows it")
+    parser.add_argument('-b', '--quality', type=int, default=int(settings.get('quality') or DEFAULT_QUALITY),
+                        metavar='KBPS', help=f"output bitrate when transcoding (default: {DEFAULT_QUALITY})")
+    parser.add_argument('--stream', action='store_true', default=bool(settings.get('streaming')),
+                        help="encode while downloading instead of after the download finishes")
+    parser.add_argument('--split-chapters', action='store_true', default=bool(settings.get('split_chapters')),
+                        help="save videos that have chapters as one file per chapter, in a folder per video")
+    parser.add_argument('--segment-encode', action='store_true', default=bool(settings.get('segment_encoding')),
+                        help="encode long MP3s as segments on every core and join them gaplessly")
+    parser.add_argument('--shortest-first', action='store_true', default=bool(settings.get('shortest_first')),
+                        help="run short videos ahead of long ones queued at about the same time")
+    parser.add_argument('--info-cache-ttl', type=int, default=DEFAULT_TTL, metavar='SECONDS',
+                        help=f"reuse resolved video information for this long; 0 disables (default: {DEFAULT_TTL})")
+    parser.add_argument('--limit-rate', type=parse_size, default=settings.get('bandwidth_limit'), metavar='RATE',
+                        help="total download bandwidth shared fairly by all jobs, e.g. 500K or 4M (bytes/s)")
+    parser.add_argument('--max-host-connections', type=int, default=DEFAULT_MAX_PER_HOST, metavar='N',
+                        help=f"connections open to one host at a time (default: {DEFAULT_MAX_PER_HOST})")
+    parser.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES, metavar='N',
+                        help=f"retries per job after network errors or throttling (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument('--concurrent-fragments', type=int,
+                        default=settings.get('concurrent_fragments') or DEFAULT_CONCURRENT_FRAGMENTS, metavar='N',
+                        help=f"DASH/HLS fragments fetched in parallel per job (default: {DEFAULT_CONCURRENT_FRAGMENTS})")
+    parser.add_argument('--http-chunk-size', type=parse_size,
+                        default=settings.get('http_chunk_size') or HTTP_CHUNK_SIZE, metavar='SIZE',
+                        help="size of each ranged HTTP request, e.g. 10M (default: 10M)")
+    parser.add_argument('--resume', action='store_true',
+                        help="also queue jobs left unfinished by an earlier run (crash, Ctrl+C, network loss)")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="do not record jobs in the journal used by --resume")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write timing and throughput metrics in Prometheus text format to FILE")
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help="write a JSON snapshot of the metrics, including every job's, to FILE")
+    return parser
+
+
+def main(argv=None):
+    settings = read_settings()
+    parser = build_parser(settings)
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.retries < 0:
+        parser.error("--retries must not be negative")
+
+    for path in args.input:
+        if path != '-' and not os.path.isfile(path):
+            print(f"Error: No such file: {path}", file=sys.stderr)
+            return EXIT_USAGE
+    if args.watch and not os.path.isdir(args.watch):
+        print(f"Error: No such directory: {args.watch}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not args.urls and not args.input and not args.watch and not args.resume:
+        parser.print_usage(sys.stderr)
+        print("Error: no URLs given", file=sys.stderr)
+        return EXIT_USAGE
+
+    save_path = os.path.abspath(os.path.expanduser(args.output))
+    archive = None if args.no_archive else DownloadArchive()
+    info_cache = InfoCache(ttl=args.info_cache_ttl, disk_dir=INFO_CACHE_DIR) if args.info_cache_ttl > 0 else None
+    converter = Converter(verbose=args.verbose, quiet=args.quiet, archive=archive, info_cache=info_cache,
+                          streaming=args.stream, codec=args.codec, quality=args.quality,
+                          split_chapters=args.split_chapters, segment_encoding=args.segment_encode,
+                          governor=BandwidthGovernor(args.limit_rate) if args.limit_rate else None,
+                          host_limiter=HostLimiter(args.max_host_connections),
+                          breaker=HostBreaker(),
+                          concurrent_fragments=args.concurrent_fragments, http_chunk_size=args.http_chunk_size)
+    journal = None if args.no_journal else JobJournal()
+    download_queue = DownloadQueue(converter, max_workers=args.workers, journal=journal,
+                                   shortest_first=args.shortest_first, max_retries=args.retries)
+    if args.resume:
+        resumed = download_queue.resume()
+        if not args.quiet:
+            print(f"Resuming {len(resumed)} unfinished job(s)")
+
+    ingester = UrlIngester(download_queue, save_path, max_pending=args.max_pending,
+                           on_invalid=lambda url: print(f"Error: Invalid YouTube URL: {url}", file=sys.stderr))
+    try:
+        ingester.feed(args.urls)
+        for path in args.input:
+            ingester.feed_file(path)
+        if args.watch:
+            if not args.quiet:
+                print(f"Watching {args.watch} for URL lists (Ctrl+C to stop)")
+            ingester.watch(args.watch)
+        download_queue.wait()
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    finally:
+        download_queue.close()
+
+    failed = ingester.invalid
+    for job in download_queue.jobs():
+        if job.state == JOB_DONE and job.output_path:
+            label = "CACHED" if job.cached else "OK    "
+            conversion = f" ({job.conversion})" if job.conversion else ""
+            print(f"{label} #{job.id} {job.output_path}{conversion}")
+        elif job.state == JOB_FAILED:
+            print(f"FAILED #{job.id} {job.url} ({job.error_class}): {job.error}", file=sys.stderr)
+            failed += 1
+
+    if ingester.duplicates and not args.quiet:
+        print(f"Skipped {ingester.duplicates} repeated URL(s)")
+
+    if info_cache and not args.quiet:
+        stats = info_cache.stats()
+        print(f"Info cache: {stats['hits'] + stats['disk_hits']} hits, {stats['misses']} misses")
+
+    jobs = download_queue.jobs()
+    if not args.quiet:
+        timing = snapshot(jobs)['job_seconds']
+        if timing['count']:
+            print(f"Job time: p50 {timing['p50']:.2f}s, p95 {timing['p95']:.2f}s over {timing['count']} job(s)")
+    try:
+        if args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(prometheus_text(jobs, info_cache.stats() if info_cache else None))
+        if args.metrics_json:
+            with open(args.metrics_json, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'summary': snapshot(jobs),
+                    'jobs': [dict(job.metrics.to_dict(), id=job.id, url=job.url, state=job.state) for job in jobs],
+                }, f, indent=2)
+    except OSError as e:
+        print(f"Error writing metrics: {e}", file=sys.stderr)
+
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
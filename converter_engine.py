@@ -0,0 +1,1776 @@
+"""Download and conversion engine shared by the GUI and the command line.
+
+Nothing in this module touches tkinter, so it can run on machines without a display.
+"""
+import os
+import re
+import json
+import math
+import time
+import errno
+import heapq
+import queue
+import shutil
+import logging
+import tempfile
+import itertools
+import threading
+import contextlib
+import concurrent.futures
+from urllib.parse import urlsplit
+
+from converter_ffmpeg import (
+    CONVERSION_COPY, CONVERSION_REMUX, CONVERSION_TRANSCODE, HTTP_CHUNK_SIZE, ORIGINAL, encode_mp3_segment,
+    format_selector, output_extension, plan_conversion, source_codec, stream_transcode, streamable_format,
+    transcode_file,
+)
+from converter_mp3 import SAMPLES_PER_FRAME, SAMPLE_RATES, join_segments
+from converter_network import site_of
+from converter_retry import (
+    DEFAULT_MAX_RETRIES, ERROR_LABELS, ERROR_THROTTLED, RETRYABLE_ERRORS, classify_error, retry_delay,
+)
+
+
+# Settings live next to the GUI settings file
+SETTINGS_DIR = os.path.join(os.path.expanduser("~"), ".youtube_mp3_converter")
+SETTINGS_FILE = os.path.join(SETTINGS_DIR, "settings.json")
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# States a job never leaves
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Default number of downloads that run at the same time
+DEFAULT_MAX_WORKERS = 3
+
+# Threads resolving video information ahead of the downloads
+DEFAULT_EXTRACT_WORKERS = 2
+
+# Seconds an idle stage worker waits before checking whether it should exit
+STAGE_IDLE_POLL = 0.5
+
+# Seconds between cancellation checks while a job waits for its encoder
+CANCEL_POLL = 0.2
+
+# File in a job's scratch space that tells its running encoders to stop
+STOP_MARKER = ".stop"
+
+# Shortest-job-first: a job is scheduled as if it had arrived this many seconds
+# later per second of audio, so short jobs overtake long ones that arrived at
+# about the same time while a long job is never held back indefinitely
+SHORTEST_FIRST_DELAY = 0.05
+
+# Bytes per second of audio assumed when only a job's file size is known
+SOURCE_BYTES_PER_SECOND = 16000
+
+# Extracted jobs that may wait per download slot; a few give the scheduler a choice
+FETCH_LOOKAHEAD = 4
+
+# Accepted input URLs
+YOUTUBE_URL_RE = re.compile(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+$')
+
+# Playlist and channel pages expand into one job per entry
+COLLECTION_URL_RE = re.compile(
+    r'^(https?://)?(www\.|m\.|music\.)?youtube\.com/(playlist\?|channel/|c/|user/|@)'
+)
+
+# Buffer size for the cross-device copy fallback
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Video IDs inside watch, youtu.be, shorts, embed and live URLs
+VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/|/v/)([\w-]{11})(?![\w-])')
+
+# Output encoding (see converter_ffmpeg.OUTPUT_CODECS); part of the archive key
+# so outputs made with other settings never match
+DEFAULT_CODEC = "mp3"
+DEFAULT_QUALITY = "192"
+
+# Fragments of a DASH/HLS download fetched in parallel
+DEFAULT_CONCURRENT_FRAGMENTS = 4
+
+# Download protocols that fetch many fragments rather than one file
+FRAGMENTED_PROTOCOLS = ('http_dash_segments', 'm3u8', 'm3u8_native', 'ism', 'f4m')
+
+# Idle YoutubeDL sessions kept for reuse, across all option sets
+DEFAULT_SESSION_POOL_SIZE = 8
+
+# Options that differ per job; everything else identifies a session's option set
+PER_JOB_OPTIONS = ('outtmpl', 'progress_hooks', 'ratelimit')
+
+# How deep nested collections (channel -> tab -> playlist) are followed
+MAX_COLLECTION_DEPTH = 3
+
+# A video needs at least this many chapters to be split
+MIN_CHAPTERS = 2
+
+# Segmented MP3 encoding: audio at least this long (seconds) is cut into segments
+# of at least SEGMENT_MIN_SECONDS, up to SEGMENTS_PER_CORE per CPU so a slow
+# segment does not hold the others up. Each segment starts SEGMENT_PREROLL_FRAMES
+# early so the encoder has settled by its first kept frame.
+SEGMENT_MIN_DURATION = 600
+SEGMENT_MIN_SECONDS = 60
+SEGMENTS_PER_CORE = 2
+SEGMENT_PREROLL_FRAMES = 4
+
+# Sample rate for segments when the source's cannot be stored in MPEG-1 Layer III
+SEGMENT_SAMPLE_RATE = 44100
+
+
+# yt_dlp accounts for most of the start-up time, so it is imported on first
+# use (or ahead of time by warm_up()) instead of with this module
+_yt_dlp = None
+_yt_dlp_seconds = None
+_yt_dlp_lock = threading.Lock()
+
+
+# Raised inside a worker when its job has been cancelled
+class JobCancelled(Exception):
+    pass
+
+
+def is_valid_url(url):
+    """Return True for URLs the converter accepts"""
+    return bool(YOUTUBE_URL_RE.match(url))
+
+
+def is_collection_url(url):
+    """Return True for playlist and channel URLs"""
+    return bool(COLLECTION_URL_RE.match(url))
+
+
+def extract_video_id(url):
+    """Return the 11-character video ID in a URL, or None"""
+    match = VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def clean_title(title):
+    """Turn a video title into a safe file name"""
+    title = re.sub(r'[^\w\s.-]', '_', title)
+    return re.sub(r'\s+', ' ', title).strip()
+
+
+def reserve_path(folder, filename):
+    """Atomically claim an unused name in folder, adding _1, _2, ... on collisions
+
+    An empty placeholder file is created with O_EXCL, so two jobs finishing at
+    the same moment can never pick the same name. The caller replaces it.
+    """
+    base_name, ext = os.path.splitext(filename)
+    counter = 0
+    while True:
+        name = filename if counter == 0 else f"{base_name}_{counter}{ext}"
+        path = os.path.join(folder, name)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            counter += 1
+            continue
+        os.close(fd)
+        return path
+
+
+def reserve_dir(folder, name):
+    """Atomically create an unused subfolder of folder, adding _1, _2, ... on collisions"""
+    counter = 0
+    while True:
+        path = os.path.join(folder, name if counter == 0 else f"{name}_{counter}")
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            counter += 1
+            continue
+        return path
+
+
+def chapter_list(info):
+    """(start, end, title) for each chapter in an info dict; empty if there are too few to split"""
+    chapters = []
+    for number, chapter in enumerate(info.get('chapters') or [], 1):
+        start = chapter.get('start_time')
+        end = chapter.get('end_time')
+        if start is None or end is None or end <= start:
+            continue
+        chapters.append((float(start), float(end), chapter.get('title') or f"Chapter {number}"))
+    return chapters if len(chapters) >= MIN_CHAPTERS else []
+
+
+def finalize_output(src, folder, filename):
+    """Move a finished file into folder under a unique name and return the final path"""
+    dest = reserve_path(folder, filename)
+    try:
+        move_output(src, dest)
+    except Exception:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    return dest
+
+
+def move_output(src, dest):
+    """Move a finished file to dest, replacing whatever is there
+
+    Within one filesystem this is a single atomic rename. Across devices the
+    file is streamed into a hidden temporary next to the destination and then
+    renamed, so a partially copied file never appears under the final name.
+    """
+    try:
+        os.replace(src, dest)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    tmp_path = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.part")
+    try:
+        with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dest)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(src)
+
+
+def move_chapters(outputs, folder):
+    """Move (src, filename) chapter files into folder, replacing same-named files from an earlier try"""
+    for src, filename in outputs:
+        move_output(src, os.path.join(folder, filename))
+
+
+def job_cost(job, work=None):
+    """Seconds of audio a job converts, from its metadata; 0 while unknown"""
+    if job.metrics.audio_seconds:
+        return job.metrics.audio_seconds
+    if work is not None and work.info:
+        size = work.info.get('filesize') or work.info.get('filesize_approx')
+        if size:
+            return size / SOURCE_BYTES_PER_SECOND
+    return 0
+
+
+def default_save_path():
+    """The user's Downloads folder"""
+    return os.path.join(os.path.expanduser("~"), "Downloads")
+
+
+def read_settings():
+    """Return the saved settings dict, or an empty dict if there are none"""
+    if not os.path.exists(SETTINGS_FILE):
+        return {}
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading settings: {e}")
+        return {}
+
+
+def load_yt_dlp():
+    """Import yt_dlp on first use and return the module"""
+    global _yt_dlp, _yt_dlp_seconds
+    with _yt_dlp_lock:
+        if _yt_dlp is None:
+            started = time.perf_counter()
+            import yt_dlp
+            _yt_dlp_seconds = time.perf_counter() - started
+            _yt_dlp = yt_dlp
+    return _yt_dlp
+
+
+def yt_dlp_import_seconds():
+    """How long importing yt_dlp took, or None if it has not been loaded yet"""
+    return _yt_dlp_seconds
+
+
+def warm_up(on_ready=None):
+    """Import yt_dlp on a background thread so the first conversion does not wait for it"""
+    def run():
+        try:
+            load_yt_dlp()
+        except Exception as e:
+            print(f"Warning: Could not load yt-dlp: {e}")
+            return
+        if on_ready:
+            on_ready()
+
+    thread = threading.Thread(target=run, name='yt-dlp-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+# Where a job's time went and how fast its bytes arrived
+class JobMetrics:
+    def __init__(self):
+        self.stage_seconds = {}
+        self.bytes_downloaded = 0
+        self.peak_speed = 0.0
+        self.retries = 0
+        self.audio_seconds = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def add_retry(self):
+        """Count a retry made by the queue; the next attempt's transfer starts a fresh byte count"""
+        with self._lock:
+            self.retries += 1
+            # Otherwise its restart from zero would be counted again by record_progress
+            self.bytes_downloaded = 0
+
+    def record_progress(self, d):
+        """Fold one progress_hook dict into the byte and speed counters"""
+        downloaded = d.get('downloaded_bytes')
+        with self._lock:
+            if downloaded is not None:
+                # A transfer that starts over from zero is a retry inside the downloader
+                if downloaded < self.bytes_downloaded and d['status'] == 'downloading':
+                    self.retries += 1
+                self.bytes_downloaded = downloaded
+            if d.get('speed'):
+                self.peak_speed = max(self.peak_speed, d['speed'])
+
+    def average_speed(self):
+        """Bytes per second over the fetch stage"""
+        seconds = self.stage_seconds.get('fetch')
+        return self.bytes_downloaded / seconds if seconds else None
+
+    def encode_speed(self):
+        """Seconds of audio encoded per second of wall time"""
+        seconds = self.stage_seconds.get('encode')
+        return self.audio_seconds / seconds if seconds and self.audio_seconds else None
+
+    def to_dict(self):
+        with self._lock:
+            stage_seconds = {name: round(value, 4) for name, value in self.stage_seconds.items()}
+        average = self.average_speed()
+        encode = self.encode_speed()
+        return {
+            'stage_seconds': stage_seconds,
+            'bytes_downloaded': self.bytes_downloaded,
+            'average_speed': round(average, 1) if average else None,
+            'peak_speed': round(self.peak_speed, 1) if self.peak_speed else None,
+            'encode_speed': round(encode, 2) if encode else None,
+            'audio_seconds': self.audio_seconds,
+            'retries': self.retries,
+        }
+
+
+# A single URL submitted for conversion
+class DownloadJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, save_path, parent=None, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY,
+                 split_chapters=False):
+        self.id = next(DownloadJob._ids)
+        self.url = url
+        self.save_path = save_path
+        self.parent = parent
+        # Encoding settings are fixed when the job is submitted
+        self.codec = codec
+        self.quality = str(quality)
+        # Save one file per chapter (in a folder named after the video) instead of one file
+        self.split_chapters = split_chapters
+        # Jobs with a higher priority are scheduled first
+        self.priority = 0
+        self.state = JOB_QUEUED
+        self.percent = 0.0
+        self.status_text = "Queued"
+        self.progress = {}
+        self.title = None
+        self.video_id = extract_video_id(url)
+        self.cached = False
+        self.stage = None
+        self.conversion = None
+        self.dedupe_key = None
+        self.journal_key = None
+        self.output_path = None
+        self.error = None
+        # converter_retry class of the error, and how many times the job has been tried
+        self.error_class = None
+        self.attempts = 1
+        # Bytes per second this job may currently download at; None when unlimited
+        self.rate_limit = None
+        self.children = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.metrics = JobMetrics()
+        self.cancel_event = threading.Event()
+
+    def __repr__(self):
+        return f"<DownloadJob #{self.id} {self.state} {self.url}>"
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancel() has been requested"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job #{self.id} was cancelled")
+
+    def to_dict(self):
+        """JSON-friendly snapshot of the job"""
+        return {
+            'id': self.id,
+            'url': self.url,
+            'save_path': self.save_path,
+            'parent': self.parent.id if self.parent else None,
+            'state': self.state,
+            'stage': self.stage,
+            'codec': self.codec,
+            'quality': self.quality,
+            'split_chapters': self.split_chapters,
+            'priority': self.priority,
+            'percent': round(self.percent, 1),
+            'status_text': self.status_text,
+            'progress': dict(self.progress),
+            'rate_limit': self.rate_limit,
+            'title': self.title,
+            'video_id': self.video_id,
+            'cached': self.cached,
+            'conversion': self.conversion,
+            'output_path': self.output_path,
+            'error': self.error,
+            'error_class': self.error_class,
+            'attempts': self.attempts,
+            'children': [child.id for child in self.children],
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'metrics': self.metrics.to_dict(),
+        }
+
+
+# Hand-off point between worker threads and a UI thread. Workers publish as
+# often as they like; only the newest status per job is kept, and the UI
+# drains everything that changed since its last frame in one go.
+class ProgressBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seq = itertools.count()
+
+    def publish(self, job, status=None, changed=False):
+        """Record that a job's status, progress or state moved; safe from any thread"""
+        with self._lock:
+            event = self._pending.get(job.id)
+            if event is None:
+                event = self._pending[job.id] = {'job': job, 'status': None, 'changed': False}
+            if status is not None:
+                event['status'] = status
+            # A state change is never coalesced away by later progress updates
+            event['changed'] = event['changed'] or changed
+            event['seq'] = next(self._seq)
+
+    def drain(self):
+        """Return the pending events, oldest first, and start collecting afresh"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return sorted(pending.values(), key=lambda event: event['seq'])
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+
+# Per-job working state handed from one pipeline stage to the next
+class JobWork:
+    def __init__(self, job):
+        self.job = job
+        self.temp_dir = None
+        self.info = None
+        self.source_path = None
+        self.encoded_path = None
+        self.ffmpeg_location = None
+        # converter_network.BandwidthShare while the job is downloading
+        self.bandwidth = None
+        self.codec = DEFAULT_CODEC
+        self.quality = DEFAULT_QUALITY
+        self.conversion = None
+        # (start, end, title) per chapter when the job is split, and the (path, filename) of each encoded chapter
+        self.chapters = []
+        self.chapter_outputs = []
+
+
+# A pooled YoutubeDL plus the hook of the job currently borrowing it
+class PooledSession:
+    def __init__(self, key, ydl):
+        self.key = key
+        self.ydl = ydl
+        self.progress_hook = None
+        outtmpl = ydl.params.get('outtmpl')
+        self.base_outtmpl = outtmpl.get('default') if isinstance(outtmpl, dict) else outtmpl
+        # Registered once; forwards to whichever job holds the session
+        ydl.add_progress_hook(self.dispatch)
+
+    def dispatch(self, d):
+        hook = self.progress_hook
+        if hook is not None:
+            hook(d)
+
+    def set_outtmpl(self, outtmpl):
+        params = self.ydl.params
+        if isinstance(params.get('outtmpl'), dict):
+            params['outtmpl']['default'] = outtmpl
+        else:
+            params['outtmpl'] = {'default': outtmpl}
+
+
+# Long-lived YoutubeDL instances grouped by option set. Reusing one keeps its
+# extractor setup, cookies and keep-alive connections; a session is only ever
+# lent to one job at a time, and per-job hooks and output templates are reset
+# when it comes back.
+class YoutubeDLPool:
+    def __init__(self, max_idle=DEFAULT_SESSION_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def option_key(ydl_class, params):
+        shared = sorted((name, repr(value)) for name, value in params.items() if name not in PER_JOB_OPTIONS)
+        return (ydl_class, tuple(shared))
+
+    @contextlib.contextmanager
+    def session(self, ydl_class, params):
+        """Borrow a YoutubeDL for params; per-job options in params apply only while borrowed"""
+        key = self.option_key(ydl_class, params)
+        pooled = None
+        with self._lock:
+            for index in range(len(self._idle) - 1, -1, -1):
+                if self._idle[index].key == key:
+                    pooled = self._idle.pop(index)
+                    self.reused += 1
+                    break
+        if pooled is None:
+            shared = {name: value for name, value in params.items() if name not in PER_JOB_OPTIONS}
+            pooled = PooledSession(key, ydl_class(shared))
+            with self._lock:
+                self.created += 1
+
+        hooks = params.get('progress_hooks') or []
+        pooled.progress_hook = (lambda d: [hook(d) for hook in hooks]) if hooks else None
+        if params.get('outtmpl'):
+            pooled.set_outtmpl(params['outtmpl'])
+        if params.get('ratelimit'):
+            pooled.ydl.params['ratelimit'] = params['ratelimit']
+        else:
+            pooled.ydl.params.pop('ratelimit', None)
+
+        healthy = False
+        try:
+            yield pooled.ydl
+            healthy = True
+        finally:
+            pooled.progress_hook = None
+            pooled.ydl.params.pop('ratelimit', None)
+            if pooled.base_outtmpl is not None:
+                pooled.set_outtmpl(pooled.base_outtmpl)
+            # A session that saw an error may hold broken connections; start afresh next time
+            if healthy:
+                self._release(pooled)
+            else:
+                self._discard(pooled)
+
+    def _release(self, pooled):
+        evicted = []
+        with self._lock:
+            self._idle.append(pooled)
+            while len(self._idle) > self.max_idle:
+                evicted.append(self._idle.pop(0))
+        for stale in evicted:
+            self._discard(stale)
+
+    def _discard(self, pooled):
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            print(f"Warning: Could not close downloader session: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'created': self.created, 'reused': self.reused}
+
+    def close(self):
+        """Close every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+
+# Runs the download and conversion steps for a job
+class Converter:
+    def __init__(self, logger=None, on_status=None, on_progress=None, verbose=False, quiet=False,
+                 ydl_class=None, archive=None, info_cache=None, streaming=False, transcoder=None,
+                 codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY, split_chapters=False, segment_encoding=False,
+                 log_sink=None, governor=None, host_limiter=None, breaker=None,
+                 concurrent_fragments=DEFAULT_CONCURRENT_FRAGMENTS, http_chunk_size=HTTP_CHUNK_SIZE):
+        self.logger = logger
+        # Optional converter_logging.LogSink; messages go there instead of stdout, and without one
+        # only INFO and up are printed (DEBUG too when verbose). converter_logging imports this
+        # module, so it is imported here rather than at the top
+        import converter_logging
+        self.log_sink = log_sink
+        self.log_source = converter_logging.SOURCE_ENGINE
+        self.log_level = logging.DEBUG if verbose else converter_logging.DEFAULT_LEVELS[self.log_source]
+        # Output codec (mp3, m4a, opus or original) and bitrate in kbps
+        self.codec = codec
+        self.quality = str(quality)
+        # Save videos with chapters as one file per chapter
+        self.split_chapters = split_chapters
+        # Encode long MP3s as segments on all encoder processes, then join them
+        self.segment_encoding = segment_encoding
+        # Optional DownloadArchive; finished outputs are reused instead of re-downloaded
+        self.archive = archive
+        # Optional InfoCache; skips extract_info for recently resolved videos
+        self.info_cache = info_cache
+        # Pipe downloaded bytes straight into ffmpeg instead of encoding after the download
+        self.streaming = streaming
+        # Encoder with transcode_file's signature, used instead of ffmpeg (the stub modes pass
+        # converter_stub.stub_transcode); module level, so it can run in the process pool
+        self.transcoder = transcoder
+        # Optional converter_network.BandwidthGovernor and HostLimiter shared by all jobs
+        self.governor = governor
+        self.host_limiter = host_limiter
+        # Optional converter_network.HostBreaker; holds requests to a site that is throttling us
+        self.breaker = breaker
+        # Parallel fragment downloads for DASH/HLS, and the size of each ranged HTTP request
+        self.concurrent_fragments = concurrent_fragments
+        self.http_chunk_size = http_chunk_size
+        # Anything with the YoutubeDL interface; the server's --stub mode swaps in a stand-in.
+        # Left unset, yt_dlp.YoutubeDL is looked up when the first job needs it.
+        self._ydl_class = ydl_class
+        # Downloader sessions shared by back-to-back jobs with the same options
+        self.sessions = YoutubeDLPool()
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.verbose = verbose
+        self.quiet = quiet
+
+    @property
+    def ydl_class(self):
+        if self._ydl_class is None:
+            self._ydl_class = load_yt_dlp().YoutubeDL
+        return self._ydl_class
+
+    @ydl_class.setter
+    def ydl_class(self, ydl_class):
+        self._ydl_class = ydl_class
+
+    def log(self, msg, level=logging.INFO):
+        if self.log_sink is not None:
+            self.log_sink.emit(self.log_source, level, msg)
+        elif not self.quiet and level >= self.log_level:
+            print(msg)
+
+    def status(self, job, text):
+        job.status_text = text
+        if self.on_status:
+            self.on_status(job, text)
+
+    def encoding_key(self, codec=None, quality=None):
+        """Identifies the encoding settings an output was produced with"""
+        codec = codec or self.codec
+        if codec == ORIGINAL:
+            return ORIGINAL
+        return f"{codec}-{quality or self.quality}"
+
+    def output_key(self, job):
+        """Identifies what a job produces: its encoding, and whether it is split into chapters"""
+        key = self.encoding_key(job.codec, job.quality)
+        return f"{key}-chapters" if job.split_chapters else key
+
+    def reuse_archived(self, job):
+        """Finish the job from the archive if this video was already converted; returns True on a hit"""
+        # The archive holds single files; a split job always produces its chapters afresh
+        if not self.archive or not job.video_id or job.split_chapters:
+            return False
+        try:
+            settings_key = self.encoding_key(job.codec, job.quality)
+            entry = self.archive.lookup(job.video_id, settings_key, job.save_path)
+            if not entry:
+                return False
+            output_path, placed = self.archive.place(entry, job.save_path)
+            if output_path != entry['path']:
+                self.archive.record(job.video_id, settings_key, output_path, entry['title'],
+                                    sha256=entry['sha256'])
+        except Exception as e:
+            self.log(f"Warning: Could not use download archive: {e}")
+            return False
+
+        job.title = entry['title']
+        job.output_path = output_path
+        job.cached = True
+        job.percent = 100
+        self.log(f"[#{job.id}] Already converted, reusing ({placed}): {output_path}")
+        self.status(job, f"[#{job.id}] Already converted")
+        return True
+
+    def resolve_info(self, ydl, job):
+        """Return the info dict for a job's video, from the cache when possible"""
+        if self.info_cache and job.video_id:
+            info_dict = self.info_cache.get(job.video_id)
+            if info_dict is not None:
+                self.log(f"[#{job.id}] Using cached video information")
+                return info_dict
+
+        host = urlsplit(job.url if '//' in job.url else '//' + job.url).hostname
+        self.wait_for_host(job, host)
+        try:
+            info_dict = ydl.extract_info(job.url, download=False)
+        except BaseException as e:
+            self.record_request(host, e)
+            raise
+        self.record_request(host)
+        if self.info_cache and info_dict.get('id'):
+            self.info_cache.put(info_dict['id'], ydl.sanitize_info(info_dict))
+        return info_dict
+
+    def wait_for_host(self, job, host):
+        """Hold a request while the breaker for host's site is open"""
+        if self.breaker is None or not host:
+            return
+        paused = self.breaker.paused(host)
+        if paused:
+            self.status(job, f"[#{job.id}] Waiting for {host} to stop throttling ({paused:.0f}s)...")
+        if not self.breaker.wait(host, job.cancel_event):
+            job.check_cancelled()
+
+    def record_request(self, host, error=None):
+        """Tell the breaker how a request to host went"""
+        if self.breaker is None or not host:
+            return
+        if error is None:
+            self.breaker.record_success(host)
+        elif classify_error(error) == ERROR_THROTTLED:
+            cooldown = self.breaker.record_throttled(host)
+            if cooldown:
+                self.log(f"Throttled by {site_of(host)}; pausing requests to it for {cooldown:.0f}s")
+        else:
+            self.breaker.record_failure(host)
+
+    def ydl_params(self, **params):
+        """Options common to every YoutubeDL instance"""
+        params.setdefault('verbose', self.verbose)
+        if self.logger:
+            params['logger'] = self.logger
+        elif self.quiet:
+            params.setdefault('quiet', True)
+            params.setdefault('no_warnings', True)
+            # yt-dlp still draws progress bars when only quiet is set
+            params.setdefault('noprogress', True)
+        return params
+
+    def progress_hook(self, job, d):
+        """Progress hook for yt-dlp"""
+        # Raising here aborts the transfer inside yt-dlp
+        job.check_cancelled()
+
+        prefix = f"[#{job.id}] "
+        if d['status'] == 'downloading':
+            # Print detailed info to console
+            if 'speed' in d and d['speed'] is not None:
+                speed_mb = d['speed'] / 1024 / 1024
+                eta = d.get('eta', 'unknown')
+                self.log(f"{prefix}Download speed: {speed_mb:.2f} MB/s | ETA: {eta} seconds", logging.DEBUG)
+
+            if d.get('speed'):
+                rate = f"{d['speed'] / 1024 / 1024:.2f} MB/s"
+                if job.rate_limit:
+                    rate += f" of {job.rate_limit / 1024 / 1024:.2f} MB/s allowed"
+                self.status(job, f"{prefix}Downloading... {rate}")
+            else:
+                self.status(job, f"{prefix}Downloading... Please wait")
+
+            if 'total_bytes' in d and d['total_bytes']:
+                job.percent = d['downloaded_bytes'] / d['total_bytes'] * 100
+                self.log(f"{prefix}Progress: {job.percent:.1f}%", logging.DEBUG)
+            elif 'total_bytes_estimate' in d and d['total_bytes_estimate']:
+                job.percent = d['downloaded_bytes'] / d['total_bytes_estimate'] * 100
+                self.log(f"{prefix}Progress: {job.percent:.1f}% (estimated)", logging.DEBUG)
+
+        elif d['status'] == 'finished':
+            self.log(f"{prefix}Download complete. Converting...")
+            self.status(job, f"{prefix}Processing audio... Please wait")
+            job.percent = 100
+
+        job.metrics.record_progress(d)
+        job.progress = {
+            'status': d['status'],
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'rate_limit': job.rate_limit,
+            'eta': d.get('eta'),
+        }
+        if self.on_progress:
+            self.on_progress(job, d)
+
+    def expand_collection(self, url, depth=0):
+        """Flat-extract a playlist or channel into its entry URLs without resolving formats"""
+        ydl_opts = self.ydl_params(extract_flat='in_playlist', skip_download=True)
+        with self.sessions.session(self.ydl_class, ydl_opts) as ydl:
+            info_dict = ydl.extract_info(url, download=False)
+
+        urls = []
+        for entry in info_dict.get('entries') or []:
+            if not entry:
+                continue
+            entry_url = entry.get('url') or entry.get('webpage_url')
+            if not entry_url and entry.get('id'):
+                entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            if not entry_url:
+                continue
+
+            # Channels list their tabs (Videos, Shorts, ...) as nested playlists
+            nested = entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab' or is_collection_url(entry_url)
+            if nested:
+                if depth + 1 < MAX_COLLECTION_DEPTH:
+                    urls.extend(self.expand_collection(entry_url, depth + 1))
+            else:
+                urls.append(entry_url)
+        return urls
+
+    def prepare(self, job):
+        """Check the save folder and the archive; returns the job's JobWork, or None if already done"""
+        save_path = job.save_path
+
+        # Make sure save path exists
+        if not os.path.exists(save_path):
+            try:
+                os.makedirs(save_path, exist_ok=True)
+                self.log(f"Created save directory: {save_path}")
+            except Exception as e:
+                self.log(f"Error creating save directory: {e}")
+                raise Exception(f"Cannot create save directory: {save_path}")
+
+        # Check write permissions
+        if not os.access(save_path, os.W_OK):
+            raise Exception(f"No write permission to save location: {save_path}")
+
+        if self.reuse_archived(job):
+            return None
+
+        self.log(f"[#{job.id}] Starting download from: {job.url}")
+        self.log(f"[#{job.id}] Save location: {save_path}")
+
+        work = JobWork(job)
+        work.codec = job.codec
+        work.quality = job.quality
+        # Scratch space lives inside the save folder so finalizing is a rename, not a copy.
+        # It is named after the video and encoding, so a retry after a crash or a dropped
+        # connection finds the previous attempt's partial download and encoded output.
+        if job.video_id:
+            work.temp_dir = self.scratch_dir(job)
+            if os.path.isdir(work.temp_dir) and os.listdir(work.temp_dir):
+                self.log(f"[#{job.id}] Resuming from previous attempt: {work.temp_dir}")
+            os.makedirs(work.temp_dir, exist_ok=True)
+            # A failed attempt may have left its stop marker behind
+            if os.path.exists(os.path.join(work.temp_dir, STOP_MARKER)):
+                os.remove(os.path.join(work.temp_dir, STOP_MARKER))
+        else:
+            work.temp_dir = tempfile.mkdtemp(prefix="_temp_youtube_dl_", dir=save_path)
+        self.log(f"Created temporary directory: {work.temp_dir}")
+        return work
+
+    def scratch_dir(self, job):
+        """A job's per-video scratch directory, which later attempts resume from; None without a video ID"""
+        if not job.video_id:
+            return None
+        return os.path.join(job.save_path, f"_temp_youtube_dl_{job.video_id}_{self.output_key(job)}")
+
+    def encoded_output_path(self, work):
+        """Where a job's encoded file goes; it only exists once encoding has completed"""
+        return os.path.join(work.temp_dir, f"{work.job.video_id or work.job.id}.out.{output_extension(work.codec)}")
+
+    def download_params(self, work, **params):
+        """yt-dlp options for fetching a job's source audio"""
+        params.setdefault('format', format_selector(work.codec))
+        # Each playlist entry is its own job, so never follow &list= here
+        params.setdefault('noplaylist', True)
+        params.setdefault('concurrent_fragment_downloads', self.concurrent_fragments)
+        if self.http_chunk_size:
+            params.setdefault('http_chunk_size', self.http_chunk_size)
+        return self.ydl_params(**params)
+
+    def download_endpoint(self, work):
+        """Host a job's download connects to and how many connections it will open"""
+        formats = work.info.get('requested_formats') or [work.info]
+        first = formats[0]
+        host = urlsplit(first.get('fragment_base_url') or first.get('url') or '').hostname
+        connections = 0
+        for fmt in formats:
+            fragmented = fmt.get('fragments') or fmt.get('protocol') in FRAGMENTED_PROTOCOLS
+            connections += self.concurrent_fragments if fragmented else 1
+        return host, connections
+
+    def download_progress(self, work, d):
+        """Progress hook for a job's download; also feeds the bandwidth governor"""
+        self.progress_hook(work.job, d)
+        if work.bandwidth is not None:
+            work.bandwidth.report(d.get('speed'))
+
+    def extract(self, work):
+        """Stage 1: resolve the video's metadata and pick its audio format"""
+        job = work.job
+        self.status(job, f"[#{job.id}] Getting video information...")
+        self.log(f"[#{job.id}] Retrieving video information...")
+        with self.sessions.session(self.ydl_class, self.download_params(work)) as ydl:
+            work.info = self.resolve_info(ydl, job)
+            work.ffmpeg_location = ydl.params.get('ffmpeg_location')
+        job.title = work.info.get('title', 'Unknown')
+        job.video_id = work.info.get('id') or job.video_id
+        job.metrics.audio_seconds = work.info.get('duration')
+        work.conversion = plan_conversion(work.codec, source_codec(work.info))
+        self.log(f"[#{job.id}] Source codec {source_codec(work.info) or 'unknown'}, "
+                 f"output {work.codec}: {work.conversion}")
+        if job.split_chapters:
+            work.chapters = chapter_list(work.info)
+            if work.chapters:
+                self.log(f"[#{job.id}] Splitting into {len(work.chapters)} chapters")
+            else:
+                self.log(f"[#{job.id}] No chapters; saving a single file")
+
+    def fetch(self, work):
+        """Stage 2: download the source audio into scratch space (or stream-encode it)"""
+        job = work.job
+        if (work.conversion != CONVERSION_COPY and not work.chapters
+                and os.path.exists(self.encoded_output_path(work))):
+            # An earlier attempt got as far as encoding; only finalizing is left
+            work.encoded_path = self.encoded_output_path(work)
+            job.percent = 100
+            self.log(f"[#{job.id}] Already encoded by a previous attempt")
+            return
+
+        ydl_opts = self.download_params(
+            work,
+            outtmpl=os.path.join(work.temp_dir, '%(id)s.%(ext)s'),
+            progress_hooks=[lambda d: self.download_progress(work, d)],
+        )
+
+        # Wait for free connections to the media host, then join the shared bandwidth budget
+        host, connections = self.download_endpoint(work)
+        self.wait_for_host(job, host)
+        taken = 0
+        # Everything after the wait reports back to the breaker, so a probe slot is never left taken
+        try:
+            if self.host_limiter and host:
+                taken = self.host_limiter.acquire(host, connections, job.cancel_event)
+                if not taken:
+                    job.check_cancelled()
+            if self.governor:
+                work.bandwidth = self.governor.acquire(job)
+            with self.sessions.session(self.ydl_class, ydl_opts) as ydl:
+                if work.bandwidth is not None:
+                    # yt-dlp reads ratelimit on every block, so a new share applies mid-download
+                    work.bandwidth.on_rate(lambda rate: ydl.params.__setitem__('ratelimit', rate))
+                stream_format = None
+                # A stand-in encoder works on whole files, and chapters and segments are cut from the
+                # downloaded file, so none of them is ever stream-encoded
+                if (self.streaming and work.conversion != CONVERSION_COPY and self.transcoder is None
+                        and not work.chapters and not self.segment_plan(work)):
+                    stream_format = streamable_format(work.info)
+                try:
+                    if stream_format:
+                        self.stream_convert(work, stream_format)
+                    else:
+                        work.info = ydl.process_ie_result(work.info, download=True)
+                except Exception as e:
+                    # Expired or revoked stream URLs must be resolved again next time
+                    if self.info_cache and re.search(r'HTTP Error (403|404|410)', str(e)):
+                        self.info_cache.invalidate(work.info.get('id') or job.video_id)
+                    raise
+                finally:
+                    # Let go of the share while the session is still ours; once it is back in the
+                    # pool a rebalance must not write this job's rate into another job's download
+                    if work.bandwidth is not None:
+                        work.bandwidth.release()
+                        work.bandwidth = None
+        except BaseException as e:
+            self.record_request(host, e)
+            raise
+        else:
+            self.record_request(host)
+        finally:
+            if work.bandwidth is not None:
+                work.bandwidth.release()
+                work.bandwidth = None
+            if taken:
+                self.host_limiter.release(host, taken)
+
+        if work.encoded_path:
+            return
+
+        for download in work.info.get('requested_downloads') or []:
+            filepath = download.get('filepath')
+            if filepath and os.path.exists(filepath):
+                work.source_path = filepath
+                break
+
+        # Fall back to scanning the job's own temp directory
+        if not work.source_path:
+            for file in os.listdir(work.temp_dir):
+                if not file.endswith(('.part', '.ytdl')):
+                    work.source_path = os.path.join(work.temp_dir, file)
+                    break
+
+        if not work.source_path:
+            raise FileNotFoundError(f"Downloaded audio not found in temporary directory: {work.temp_dir}")
+        self.log(f"[#{job.id}] Downloaded: {job.title}")
+
+    def stream_convert(self, work, fmt):
+        """Fetch the audio stream and encode it on the fly"""
+        job = work.job
+        self.log(f"[#{job.id}] Streaming format {fmt.get('format_id')} into the encoder")
+        output_path = self.encoded_output_path(work)
+        stream_transcode(
+            fmt, output_path + '.part', work.codec, work.quality,
+            progress_hook=lambda d: self.download_progress(work, d),
+            cancel_event=job.cancel_event,
+            throttle=work.bandwidth.throttle if work.bandwidth is not None else None,
+            chunk_size=self.http_chunk_size or HTTP_CHUNK_SIZE,
+            ffmpeg_location=work.ffmpeg_location,
+            remux=work.conversion == CONVERSION_REMUX,
+        )
+        os.replace(output_path + '.part', output_path)
+        work.encoded_path = output_path
+
+    def encode(self, work, executor=None):
+        """Stage 3: encode the downloaded source, in executor if one is given"""
+        if work.encoded_path:
+            return
+        if work.chapters:
+            self.encode_chapters(work, executor)
+            return
+        job = work.job
+        if work.conversion == CONVERSION_COPY:
+            # The downloaded stream is the output
+            work.encoded_path = work.source_path
+            return
+
+        remux = work.conversion == CONVERSION_REMUX
+        segments = self.segment_plan(work) if executor is not None else None
+        if segments:
+            self.encode_segments(work, executor, *segments)
+            return
+        if remux:
+            self.status(job, f"[#{job.id}] Remuxing to {work.codec.upper()} (no re-encode)...")
+        else:
+            self.status(job, f"[#{job.id}] Converting to {work.codec.upper()}...")
+        output_path = self.encoded_output_path(work)
+        transcoder = self.transcoder or transcode_file
+        # Encode under a temporary name so a finished-looking output is always complete
+        self.run_encodes(work, executor, [(transcoder, (work.source_path, output_path + '.part', work.codec,
+                                                         work.quality, work.ffmpeg_location, remux))])
+        os.replace(output_path + '.part', output_path)
+        work.encoded_path = output_path
+
+    def run_encodes(self, work, executor, calls, on_done=None):
+        """Run encoder calls (function, args) in executor and return their results in order
+
+        Without an executor they run on a thread of their own, so this one can
+        still watch for cancellation. on_done(index, result) is called as each
+        finishes. When the job is cancelled, or one call fails, the rest are
+        stopped: pool processes cannot see the job's cancel event, so they are
+        told through a marker file in the scratch space. Every call has stopped
+        writing there before the exception is raised.
+        """
+        job = work.job
+        stop_path = os.path.join(work.temp_dir, STOP_MARKER)
+        own_pool = None
+        if executor is None:
+            executor = own_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        futures = [executor.submit(function, *args, stop_path=stop_path) for function, args in calls]
+        results = []
+        try:
+            for index, future in enumerate(futures):
+                while True:
+                    try:
+                        result = future.result(timeout=CANCEL_POLL)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        job.check_cancelled()
+                results.append(result)
+                if on_done:
+                    on_done(index, result)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            try:
+                open(stop_path, 'w').close()
+            except OSError:
+                pass
+            concurrent.futures.wait(futures)
+            # Encoders stopped by a cancellation fail with InterruptedError; report the cancellation
+            job.check_cancelled()
+            raise
+        finally:
+            if own_pool is not None:
+                own_pool.shutdown(wait=False)
+        return results
+
+    def segment_plan(self, work):
+        """(sample rate, first frame of each segment) for a segmented MP3 encode, or None to encode in one go"""
+        duration = work.info.get('duration') or 0
+        # Segments are joined frame by frame, so they need ffmpeg's real MP3 output
+        if (not self.segment_encoding or work.codec != 'mp3' or work.conversion != CONVERSION_TRANSCODE
+                or duration < SEGMENT_MIN_DURATION or self.transcoder is not None):
+            return None
+        count = min(SEGMENTS_PER_CORE * (os.cpu_count() or 1), int(duration // SEGMENT_MIN_SECONDS))
+        if count < 2:
+            return None
+        sample_rate = work.info.get('asr')
+        if sample_rate not in SAMPLE_RATES:
+            sample_rate = SEGMENT_SAMPLE_RATE
+        total_frames = math.ceil(duration * sample_rate / SAMPLES_PER_FRAME)
+        return sample_rate, [total_frames * index // count for index in range(count)]
+
+    def encode_segments(self, work, executor, sample_rate, starts):
+        """Encode an MP3 as time segments in parallel and join them frame-exactly"""
+        job = work.job
+        self.status(job, f"[#{job.id}] Converting to MP3 in {len(starts)} segments...")
+        segments = []
+        calls = []
+        for index, first in enumerate(starts):
+            preroll = min(SEGMENT_PREROLL_FRAMES, first)
+            # The last segment runs to the end of the input, whatever its exact length
+            count = starts[index + 1] - first if index + 1 < len(starts) else None
+            path = os.path.join(work.temp_dir, f"{job.video_id or job.id}.seg{index:03d}.mp3")
+            segments.append((path, preroll, count))
+            calls.append((encode_mp3_segment, (
+                work.source_path, path, work.quality, sample_rate, (first - preroll) * SAMPLES_PER_FRAME,
+                None if count is None else preroll + count, work.ffmpeg_location,
+            )))
+        self.run_encodes(work, executor, calls)
+
+        output_path = self.encoded_output_path(work)
+        try:
+            frames = join_segments(segments, output_path + '.part')
+        finally:
+            for path, _, _ in segments:
+                if os.path.exists(path):
+                    os.remove(path)
+        os.replace(output_path + '.part', output_path)
+        work.encoded_path = output_path
+        self.log(f"[#{job.id}] Joined {len(segments)} segments ({frames} frames)")
+
+    def encode_chapters(self, work, executor=None):
+        """Cut every chapter out of the one downloaded source and encode them side by side"""
+        job = work.job
+        remux = work.conversion in (CONVERSION_REMUX, CONVERSION_COPY)
+        ext = output_extension(work.codec, os.path.splitext(work.source_path)[1].lstrip('.'))
+        self.status(job, f"[#{job.id}] Encoding {len(work.chapters)} chapters...")
+        work.chapter_outputs = []
+        tasks = []
+        for number, (start, end, title) in enumerate(work.chapters, 1):
+            base = os.path.join(work.temp_dir, f"{job.video_id or job.id}.ch{number:03d}")
+            output_path = f"{base}.{ext}"
+            work.chapter_outputs.append((output_path, f"{number:02d} - {clean_title(title) or 'Chapter'}.{ext}"))
+            # Chapters finished by an earlier attempt are kept
+            if not os.path.exists(output_path):
+                # The temporary name keeps the extension so ffmpeg can pick the container from it
+                tasks.append((output_path, (work.source_path, f"{base}.part.{ext}", work.codec, work.quality,
+                                            work.ffmpeg_location, remux, start, end - start)))
+
+        self.run_encodes(work, executor, [(self.transcoder or transcode_file, args) for _, args in tasks],
+                         on_done=lambda index, result: os.replace(result, tasks[index][0]))
+        work.encoded_path = work.chapter_outputs[0][0]
+
+    def finalize(self, work):
+        """Stage 4: move the encoded file into the save folder and record it"""
+        job = work.job
+        if work.chapters:
+            self.finalize_chapters(work)
+            return
+
+        ext = output_extension(work.codec, os.path.splitext(work.encoded_path)[1].lstrip('.'))
+
+        # Move the output into the save folder under a free name
+        try:
+            output_path = self.save_output(work, f"{clean_title(job.title or 'Unknown')}.{ext}")
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.log(f"Error saving file: {e}")
+            raise Exception(f"Failed to save {ext.upper()} file: {e}")
+        self.log(f"Saved {ext.upper()} file to: {output_path}")
+
+        job.output_path = output_path
+        job.conversion = work.conversion
+        self.log(f"[#{job.id}] ✓ Conversion completed successfully! ({work.conversion})")
+
+        if self.archive and job.video_id:
+            try:
+                self.archive.record(job.video_id, self.encoding_key(work.codec, work.quality), output_path,
+                                    job.title)
+            except Exception as e:
+                self.log(f"Warning: Could not update download archive: {e}")
+
+    def finalize_chapters(self, work):
+        """Move a split job's chapter files into a new folder named after the video"""
+        job = work.job
+        try:
+            output_path = self.save_chapters(work, clean_title(job.title or 'Unknown') or 'Unknown')
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.log(f"Error saving chapters: {e}")
+            raise Exception(f"Failed to save chapter files: {e}")
+        self.log(f"Saved {len(work.chapter_outputs)} chapter files to: {output_path}")
+
+        job.output_path = output_path
+        job.conversion = work.conversion
+        self.log(f"[#{job.id}] ✓ Conversion completed successfully! ({work.conversion}, "
+                 f"{len(work.chapter_outputs)} chapters)")
+
+    def save_output(self, work, filename):
+        """Put the encoded file into the job's save folder as filename (or a free variant of it)"""
+        return finalize_output(work.encoded_path, work.job.save_path, filename)
+
+    def save_chapters(self, work, folder_name):
+        """Put the chapter files into a new subfolder folder_name (or a free variant of it)"""
+        folder = reserve_dir(work.job.save_path, folder_name)
+        move_chapters(work.chapter_outputs, folder)
+        return folder
+
+    def cleanup(self, work, keep_partial=False):
+        """Remove a job's scratch space; with keep_partial, leave any downloaded data for a retry"""
+        if not work.temp_dir:
+            return
+        if keep_partial and os.path.isdir(work.temp_dir) and os.listdir(work.temp_dir):
+            self.log(f"Keeping partial download for a later retry: {work.temp_dir}")
+            return
+        shutil.rmtree(work.temp_dir, ignore_errors=True)
+        self.log(f"Removed temporary directory: {work.temp_dir}")
+
+    def convert(self, job):
+        """Run every stage for one video in the calling thread; raises on failure"""
+        work = self.prepare(job)
+        if work is None:
+            return
+        try:
+            for step in (self.extract, self.fetch, self.encode, self.finalize):
+                job.check_cancelled()
+                started = time.time()
+                try:
+                    step(work)
+                finally:
+                    job.metrics.add_stage(step.__name__, time.time() - started)
+        except JobCancelled:
+            self.cleanup(work)
+            raise
+        except Exception:
+            self.cleanup(work, keep_partial=True)
+            raise
+        self.cleanup(work)
+
+
+# One pipeline stage: a resizable set of worker threads fed by its own queue.
+# A bounded inbox makes the previous stage block when this one falls behind.
+class Stage:
+    def __init__(self, name, handler, workers, maxsize=0, key=None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        # Waiting items are taken lowest key(item) first, and in arrival order without a key
+        self.key = key
+        self.inbox = queue.PriorityQueue(maxsize)
+        self._seq = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        # Entries are lists so reorder() can update their keys in place
+        self.inbox.put([self.key(item) if self.key else 0, next(self._seq), item])
+
+    def reorder(self):
+        """Recompute the order of the waiting items, e.g. after a priority changed"""
+        if self.key is None:
+            return
+        with self.inbox.mutex:
+            for entry in self.inbox.queue:
+                entry[0] = self.key(entry[2])
+            heapq.heapify(self.inbox.queue)
+
+    def remove(self, match):
+        """Take the waiting items match(item) is true for out of the queue and return them"""
+        with self.inbox.mutex:
+            taken = [entry[2] for entry in self.inbox.queue if match(entry[2])]
+            if taken:
+                self.inbox.queue[:] = [entry for entry in self.inbox.queue if not match(entry[2])]
+                heapq.heapify(self.inbox.queue)
+                # Wake the stage in front, which may be blocked on a full inbox
+                self.inbox.not_full.notify(len(taken))
+        return taken
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def resize(self, workers):
+        """Change the worker count; surplus workers exit when they are next idle"""
+        self.workers = max(1, int(workers))
+        self.start()
+
+    def busy(self):
+        return self.inbox.qsize()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._threads) > self.workers:
+                    self._threads.remove(threading.current_thread())
+                    return
+            try:
+                item = self.inbox.get(timeout=STAGE_IDLE_POLL)[2]
+            except queue.Empty:
+                continue
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"Error in {self.name} stage: {e}")
+
+
+# Staged conversion pipeline: extract -> fetch -> encode -> finalize.
+# Fetching is network-bound and gets many threads; encoding is CPU-bound and
+# runs in a process pool sized to the machine's cores. Each stage takes the
+# highest-priority job first, and with shortest_first the shortest among equals.
+# A job that fails for a passing reason (see converter_retry) goes back to the
+# extract stage after a backoff, without holding a worker while it waits.
+class DownloadQueue:
+    def __init__(self, converter=None, max_workers=DEFAULT_MAX_WORKERS, on_change=None,
+                 encode_workers=None, extract_workers=DEFAULT_EXTRACT_WORKERS, journal=None,
+                 shortest_first=False, max_retries=DEFAULT_MAX_RETRIES):
+        self.converter = converter or Converter()
+        self.on_change = on_change
+        # Run short jobs (by duration or file size from their metadata) ahead of long ones
+        self.shortest_first = shortest_first
+        # Retries per job for network errors and throttling
+        self.max_retries = max(0, int(max_retries))
+        # Backoff timers of jobs waiting to be retried, by job id
+        self._retrying = {}
+        # Optional converter_journal.JobJournal; unfinished jobs survive a restart
+        self.journal = journal
+        self.max_workers = max(1, int(max_workers))
+        self.encode_workers = max(1, int(encode_workers or os.cpu_count() or 1))
+        self._jobs = []
+        # Unfinished jobs by (video ID, encoding, folder), so duplicates collapse into one job
+        self._active = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._executor = None
+        self._executor_failed = False
+
+        self._extract = Stage('extract', self._run_extract, extract_workers, key=self._schedule_key)
+        self._fetch = Stage('fetch', self._run_fetch, self.max_workers,
+                            maxsize=self.max_workers * FETCH_LOOKAHEAD, key=self._schedule_key)
+        self._encode = Stage('encode', self._run_encode, self.encode_workers, maxsize=self.encode_workers,
+                             key=self._schedule_key)
+        self._finalize = Stage('finalize', self._run_finalize, 1, key=self._schedule_key)
+        self._stages = (self._extract, self._fetch, self._encode, self._finalize)
+        self._started = False
+
+    def submit(self, url, save_path, parent=None, codec=None, quality=None, split_chapters=None, priority=0):
+        """Queue a URL for conversion and return its job
+
+        codec, quality and split_chapters default to the converter's current settings. If the
+        same video is already queued or running for the same folder and
+        settings, that job is returned instead of queueing a duplicate.
+        Jobs with a higher priority are taken first by every stage.
+        """
+        if split_chapters is None:
+            split_chapters = self.converter.split_chapters
+        job = DownloadJob(url, save_path, parent=parent, codec=codec or self.converter.codec,
+                          quality=quality or self.converter.quality, split_chapters=split_chapters)
+        job.priority = priority
+        key = self._dedupe_key(job)
+        with self._lock:
+            existing = self._active.get(key) if key else None
+            if existing is None or existing.state in FINISHED_STATES:
+                existing = None
+                if key:
+                    self._active[key] = job
+                    job.dedupe_key = key
+                self._jobs.append(job)
+                self._spawn_workers()
+        if existing is not None:
+            # Asking again for a queued video with a higher priority raises the queued job's
+            if priority > existing.priority:
+                self.set_priority(existing.id, priority)
+            return existing
+        self._journal_add(job)
+        self._extract.put(job)
+        self._notify(job)
+        return job
+
+    def set_priority(self, job_id, priority):
+        """Change a job's priority (and its playlist entries'); returns the job, or None if unknown"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.priority = priority
+        for child in job.children:
+            child.priority = priority
+        for stage in self._stages:
+            stage.reorder()
+        return job
+
+    def set_max_workers(self, count):
+        """Resize the pool of download (fetch) workers"""
+        self.max_workers = max(1, int(count))
+        self._fetch.resize(self.max_workers)
+
+    def resume(self):
+        """Queue again every job the journal says was left unfinished; returns the jobs"""
+        if self.journal is None:
+            return []
+        try:
+            self._expire_journal()
+            entries = self.journal.pending()
+        except Exception as e:
+            self.converter.log(f"Warning: Could not read job journal: {e}")
+            return []
+        jobs = []
+        for entry in entries:
+            try:
+                self.journal.mark_resumed(entry['key'])
+            except Exception as e:
+                self.converter.log(f"Warning: Could not update job journal: {e}")
+            self.converter.log(f"Resuming unfinished job: {entry['url']}")
+            jobs.append(self.submit(entry['url'], entry['save_path'], codec=entry['codec'],
+                                    quality=entry['quality'], split_chapters=bool(entry['split_chapters'])))
+        return jobs
+
+    def _expire_journal(self):
+        """Forget jobs that used up their resumes, along with the partial data kept for them"""
+        for entry in self.journal.expired():
+            job = DownloadJob(entry['url'], entry['save_path'], codec=entry['codec'], quality=entry['quality'],
+                              split_chapters=bool(entry['split_chapters']))
+            scratch_dir = self.converter.scratch_dir(job)
+            if scratch_dir and os.path.isdir(scratch_dir):
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            self.journal.remove(entry['key'])
+            self.converter.log(f"Giving up on job after {entry['attempts']} resumes: {entry['url']}")
+
+    def stage_sizes(self):
+        """Number of items waiting in front of each stage"""
+        return {stage.name: stage.busy() for stage in self._stages}
+
+    def close(self):
+        """Shut down the encoder process pool and the pooled downloader sessions"""
+        with self._lock:
+            retrying, self._retrying = self._retrying, {}
+        for timer in retrying.values():
+            timer.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.converter.sessions.close()
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if unknown"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with self._lock:
+            # Queued jobs are skipped by the worker that eventually dequeues them
+            if job.state == JOB_QUEUED:
+                job.state = JOB_CANCELLED
+                job.finished_at = time.time()
+                cancelled = True
+            else:
+                cancelled = False
+        if cancelled:
+            self._journal_finish(job)
+            self._notify(job)
+        else:
+            # A running job waiting between stages ends now rather than when a worker frees up;
+            # one a worker already holds stops at its next cancellation check
+            for stage in self._stages:
+                for work in stage.remove(lambda item: isinstance(item, JobWork) and item.job is job):
+                    self._finish(job, work, JobCancelled(f"Job #{job.id} was cancelled"))
+            # So does one waiting out a retry backoff
+            with self._lock:
+                timer = self._retrying.pop(job.id, None)
+            if timer is not None:
+                timer.cancel()
+                self._finish(job, timer.args[0], JobCancelled(f"Job #{job.id} was cancelled"))
+        # Cancelling a playlist cancels every entry it expanded into
+        for child in job.children:
+            if child.state not in FINISHED_STATES:
+                self.cancel(child.id)
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id, or None"""
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def jobs(self):
+        """Return a snapshot of all submitted jobs"""
+        with self._lock:
+            return list(self._jobs)
+
+    def forget(self, job):
+        """Drop a finished job from jobs(), so long-running callers do not accumulate them"""
+        with self._lock:
+            if job.state in FINISHED_STATES and job in self._jobs:
+                self._jobs.remove(job)
+
+    def counts(self):
+        """Return the number of jobs in each state"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0, JOB_CANCELLED: 0}
+        for job in self.jobs():
+            counts[job.state] += 1
+        return counts
+
+    def is_idle(self):
+        """True when nothing is queued or running"""
+        counts = self.counts()
+        return counts[JOB_QUEUED] == 0 and counts[JOB_RUNNING] == 0
+
+    def wait(self, timeout=None):
+        """Block until the queue is idle; returns False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while any(job.state in (JOB_QUEUED, JOB_RUNNING) for job in self._jobs):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Wake up periodically so Ctrl+C is handled promptly
+                self._changed.wait(0.5 if remaining is None else min(remaining, 0.5))
+        return True
+
+    def _schedule_key(self, item):
+        """Stage order: cancelled jobs first, then by priority, then by (adjusted) arrival"""
+        work = item if isinstance(item, JobWork) else None
+        job = work.job if work else item
+        if job.cancel_event.is_set():
+            return (float('-inf'), 0)
+        arrival = job.created_at
+        if self.shortest_first:
+            arrival += job_cost(job, work) * SHORTEST_FIRST_DELAY
+        return (-job.priority, arrival)
+
+    def _dedupe_key(self, job):
+        if not job.video_id:
+            return None
+        folder = os.path.normcase(os.path.abspath(job.save_path))
+        return (job.video_id, self.converter.output_key(job), folder)
+
+    def _journal_add(self, job):
+        if self.journal is None:
+            return
+        folder = os.path.normcase(os.path.abspath(job.save_path))
+        job.journal_key = '|'.join((job.video_id or job.url, self.converter.output_key(job), folder))
+        try:
+            self.journal.add(job.journal_key, job)
+        except Exception as e:
+            self.converter.log(f"Warning: Could not update job journal: {e}")
+
+    def _journal_finish(self, job):
+        """Drop finished jobs from the journal; ones that failed for a passing reason stay for a restart"""
+        if self.journal is None or not job.journal_key:
+            return
+        try:
+            if job.state == JOB_FAILED and job.error_class in RETRYABLE_ERRORS:
+                self.journal.update(job.journal_key, job)
+            else:
+                self.journal.remove(job.journal_key)
+        except Exception as e:
+            self.converter.log(f"Warning: Could not update job journal: {e}")
+
+    def _spawn_workers(self):
+        # Called with the lock held; stage workers are started lazily on first submit
+        if not self._started:
+            self._started = True
+            for stage in self._stages:
+                stage.start()
+
+    def _encoder_pool(self):
+        """Process pool for encoding, created on first use; None if processes are unavailable"""
+        with self._lock:
+            if self._executor is None and not self._executor_failed:
+                try:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.encode_workers)
+                except (OSError, NotImplementedError, ImportError) as e:
+                    # Fall back to encoding on the stage's own threads
+                    self.converter.log(f"Warning: Encoder process pool unavailable: {e}")
+                    self._executor_failed = True
+            return self._executor
+
+    def _run_extract(self, job):
+        if isinstance(job, JobWork):
+            # A retry; the job keeps its scratch space and runs its steps again from extract
+            work = job
+            work.job.stage = 'extract'
+            self._notify(work.job)
+            self._advance(work, self.converter.extract, self._fetch)
+            return
+        with self._lock:
+            # Cancelled while it was waiting
+            if job.state != JOB_QUEUED:
+                return
+            job.state = JOB_RUNNING
+        job.started_at = time.time()
+        job.stage = 'extract'
+        self._notify(job)
+
+        work = None
+        try:
+            if is_collection_url(job.url):
+                self._fan_out(job)
+                self._finish(job, None)
+                return
+            started = time.time()
+            try:
+                work = self.converter.prepare(job)
+            finally:
+                job.metrics.add_stage('prepare', time.time() - started)
+            if work is None:
+                self._finish(job, None)
+                return
+        except Exception as e:
+            self._finish(job, work, e)
+            return
+        self._advance(work, self.converter.extract, self._fetch)
+
+    def _run_fetch(self, work):
+        work.job.stage = 'fetch'
+        self._advance(work, self.converter.fetch, self._encode)
+
+    def _run_encode(self, work):
+        work.job.stage = 'encode'
+        self._advance(work, lambda w: self.converter.encode(w, self._encoder_pool()), self._finalize)
+
+    def _run_finalize(self, work):
+        work.job.stage = 'finalize'
+        self._advance(work, self.converter.finalize, None)
+
+    def _advance(self, work, step, next_stage):
+        """Run one stage's step and hand the work on, or finish the job"""
+        job = work.job
+        stage = job.stage
+        started = time.time()
+        error = None
+        try:
+            job.check_cancelled()
+            step(work)
+            job.check_cancelled()
+        except Exception as e:
+            error = e
+        job.metrics.add_stage(stage, time.time() - started)
+        if error is not None:
+            if not self._retry_later(work, error):
+                self._finish(job, work, error)
+            return
+        if next_stage is None:
+            self._finish(work.job, work)
+        else:
+            # Blocks while the next stage is full, which throttles this one
+            next_stage.put(work)
+
+    def _retry_later(self, work, error):
+        """Queue the job again after a backoff if error is worth retrying; returns False if it is not"""
+        job = work.job
+        error_class = classify_error(error)
+        if (isinstance(error, JobCancelled) or error_class not in RETRYABLE_ERRORS
+                or job.attempts > self.max_retries or job.cancel_event.is_set()):
+            return False
+        delay = retry_delay(job.attempts - 1, error_class)
+        job.attempts += 1
+        job.metrics.add_retry()
+        job.stage = 'retry'
+        self.converter.log(f"[#{job.id}] {ERROR_LABELS[error_class]}: {error}")
+        self.converter.status(job, f"[#{job.id}] {ERROR_LABELS[error_class]}; retrying in {delay:.0f}s "
+                                   f"(attempt {job.attempts} of {self.max_retries + 1})")
+        timer = threading.Timer(delay, self._retry_now, (work,))
+        timer.daemon = True
+        with self._lock:
+            self._retrying[job.id] = timer
+        timer.start()
+        if job.cancel_event.is_set():
+            # Cancelled before the timer was registered, so cancel() could not cut the wait short
+            timer.cancel()
+            self._retry_now(work)
+        self._notify(job)
+        return True
+
+    def _retry_now(self, work):
+        with self._lock:
+            if self._retrying.pop(work.job.id, None) is None:
+                # cancel() has already wound it up
+                return
+        # Blocks while the extract stage is full, on the timer's own thread
+        self._extract.put(work)
+
+    def _finish(self, job, work, error=None):
+        if error is not None and not isinstance(error, JobCancelled):
+            job.error_class = classify_error(error)
+        if work is not None:
+            # A job that failed for a passing reason keeps its partial download so a later run can resume it;
+            # only jobs with a video ID find their scratch directory again
+            keep_partial = job.error_class in RETRYABLE_ERRORS and bool(job.video_id)
+            self.converter.cleanup(work, keep_partial=keep_partial)
+        if error is None:
+            job.state = JOB_DONE
+        elif isinstance(error, JobCancelled):
+            job.state = JOB_CANCELLED
+            self.converter.log(f"Job #{job.id} cancelled")
+        else:
+            job.error = str(error)
+            job.state = JOB_FAILED
+            self.converter.log(f"Error in job #{job.id}: {error}")
+        job.stage = None
+        job.finished_at = time.time()
+        with self._lock:
+            if job.dedupe_key and self._active.get(job.dedupe_key) is job:
+                del self._active[job.dedupe_key]
+        self._journal_finish(job)
+        self._notify(job)
+
+    def _fan_out(self, job):
+        """Replace a playlist/channel job with one queued job per entry"""
+        self.converter.status(job, f"[#{job.id}] Reading playlist...")
+        self.converter.log(f"[#{job.id}] Expanding playlist: {job.url}")
+
+        seen = set()
+        for entry_url in self.converter.expand_collection(job.url):
+            job.check_cancelled()
+            if entry_url in seen:
+                continue
+            seen.add(entry_url)
+            job.children.append(self.submit(entry_url, job.save_path, parent=job, codec=job.codec,
+                                            quality=job.quality, split_chapters=job.split_chapters,
+                                            priority=job.priority))
+
+        if not job.children:
+            raise Exception(f"No videos found in playlist: {job.url}")
+        self.converter.log(f"[#{job.id}] Queued {len(job.children)} playlist entries")
+
+    def _notify(self, job):
+        with self._changed:
+            self._changed.notify_all()
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                print(f"Error in job listener: {e}")
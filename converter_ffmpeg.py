@@ -0,0 +1,313 @@
+"""Direct ffmpeg helpers; the engine encodes with these instead of yt-dlp's postprocessors.
+
+Streaming mode fetches the selected audio format with ranged HTTP requests and
+pipes the bytes straight into ffmpeg's stdin, so encoding runs while the
+download is still in progress and the source is never written to disk.
+"""
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+
+
+# Bytes per ranged request; YouTube throttles long un-ranged reads
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+
+# Bytes read from the socket and written to ffmpeg at a time
+PIPE_BLOCK_SIZE = 64 * 1024
+
+# Seconds before a stalled HTTP read is abandoned
+HTTP_TIMEOUT = 30
+
+# Seconds between checks for a stop marker while ffmpeg runs
+STOP_POLL = 0.2
+
+STREAMABLE_PROTOCOLS = ('http', 'https')
+
+# Output formats: file extension, ffmpeg encoder and muxer, the source codecs
+# that can be stream-copied into the container as-is, and the preferred source
+# format so yt-dlp picks a copyable stream when one exists
+OUTPUT_FORMATS = {
+    'mp3': {
+        'ext': 'mp3', 'encoder': 'libmp3lame', 'muxer': 'mp3', 'copy_codecs': ('mp3',),
+        'format': 'bestaudio/best',
+    },
+    'm4a': {
+        'ext': 'm4a', 'encoder': 'aac', 'muxer': 'ipod', 'copy_codecs': ('aac', 'mp4a', 'alac'),
+        'format': 'bestaudio[acodec^=mp4a]/bestaudio/best',
+    },
+    'opus': {
+        'ext': 'opus', 'encoder': 'libopus', 'muxer': 'opus', 'copy_codecs': ('opus',),
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    },
+}
+
+# Keep the downloaded stream exactly as it is
+ORIGINAL = 'original'
+OUTPUT_CODECS = tuple(OUTPUT_FORMATS) + (ORIGINAL,)
+
+# How a job's output was produced
+CONVERSION_TRANSCODE = 'transcode'
+CONVERSION_REMUX = 'remux'
+CONVERSION_COPY = 'copy'
+
+
+# Raised when ffmpeg is missing or exits with an error
+class FFmpegError(Exception):
+    pass
+
+
+def find_ffmpeg(location=None):
+    """Path to the ffmpeg binary, honouring yt-dlp's ffmpeg_location option"""
+    if location:
+        found = shutil.which('ffmpeg', path=location) or shutil.which(location)
+    else:
+        found = shutil.which('ffmpeg')
+    if not found:
+        raise FFmpegError("ffmpeg not found; install it or set ffmpeg_location")
+    return found
+
+
+def source_codec(info):
+    """Normalised audio codec of the selected format, e.g. 'opus' or 'mp4a'"""
+    fmt = streamable_format(info) or info
+    acodec = (fmt.get('acodec') or info.get('acodec') or '').lower()
+    if acodec in ('', 'none'):
+        return None
+    return acodec.split('.')[0]
+
+
+def format_selector(codec):
+    """yt-dlp format string that prefers a stream the output can hold without re-encoding"""
+    return OUTPUT_FORMATS.get(codec, {}).get('format', 'bestaudio/best')
+
+
+def output_extension(codec, source_ext=None):
+    if codec == ORIGINAL:
+        return source_ext or 'bin'
+    return OUTPUT_FORMATS[codec]['ext']
+
+
+def plan_conversion(codec, acodec):
+    """Pick copy, remux or transcode for a requested codec and the source's audio codec"""
+    if codec == ORIGINAL:
+        return CONVERSION_COPY
+    if acodec and acodec in OUTPUT_FORMATS[codec]['copy_codecs']:
+        return CONVERSION_REMUX
+    return CONVERSION_TRANSCODE
+
+
+def encoder_args(codec, quality, remux=False):
+    """ffmpeg output arguments for an audio codec and quality (kbps)"""
+    if codec not in OUTPUT_FORMATS:
+        raise FFmpegError(f"Unsupported output codec: {codec}")
+    output = OUTPUT_FORMATS[codec]
+    if remux:
+        return ['-c:a', 'copy', '-f', output['muxer']]
+    return ['-c:a', output['encoder'], '-b:a', f'{quality}k', '-f', output['muxer']]
+
+
+def streamable_format(info):
+    """Return the selected format if it is a single plain-HTTP stream, else None
+
+    Fragmented (DASH/HLS) downloads and formats that need merging still go
+    through yt-dlp's own downloader.
+    """
+    requested = info.get('requested_formats')
+    if requested:
+        if len(requested) != 1:
+            return None
+        fmt = requested[0]
+    else:
+        fmt = info
+    if not fmt.get('url') or fmt.get('protocol') not in STREAMABLE_PROTOCOLS:
+        return None
+    return fmt
+
+
+def transcode_file(src, dest, codec, quality, ffmpeg_location=None, remux=False, start=None, duration=None,
+                   stop_path=None):
+    """Encode (or just remux) src into dest; module-level so it can run in a process pool
+
+    start and duration (seconds) cut out a section, e.g. one chapter. With the
+    original codec the stream is copied into a container picked from dest's
+    extension. If a file appears at stop_path, ffmpeg is killed and
+    InterruptedError raised.
+    """
+    command = [find_ffmpeg(ffmpeg_location), '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if start:
+        # Seeking on the input skips straight to the section instead of decoding up to it
+        command += ['-ss', f'{start:.3f}']
+    command += ['-i', src, '-vn']
+    if duration is not None:
+        command += ['-t', f'{duration:.3f}']
+    if codec == ORIGINAL:
+        command += ['-c:a', 'copy']
+    else:
+        command += encoder_args(codec, quality, remux)
+    command += ['-y', dest]
+    return _run_ffmpeg(command, dest, stop_path)
+
+
+def encode_mp3_segment(src, dest, quality, sample_rate, start_sample, frames=None, ffmpeg_location=None,
+                       stop_path=None):
+    """Encode one segment of a long file as MP3 frames that converter_mp3 can splice together
+
+    Decoding starts at start_sample (at sample_rate) and stops after frames
+    MP3 frames, or at the end of the input. The bit reservoir is off, so no
+    frame borrows bytes from the one before it and frames from neighbouring
+    segments can be joined at any boundary.
+    """
+    command = [find_ffmpeg(ffmpeg_location), '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if start_sample:
+        command += ['-ss', f'{start_sample / sample_rate:.6f}']
+    command += [
+        '-i', src, '-vn', '-ar', str(sample_rate),
+        '-c:a', OUTPUT_FORMATS['mp3']['encoder'], '-b:a', f'{quality}k', '-reservoir', '0',
+        '-id3v2_version', '0', '-f', OUTPUT_FORMATS['mp3']['muxer'],
+    ]
+    if frames is not None:
+        command += ['-frames:a', str(frames)]
+    command += ['-y', dest]
+    return _run_ffmpeg(command, dest, stop_path)
+
+
+def _run_ffmpeg(command, dest, stop_path=None):
+    """Run an ffmpeg command writing dest; dest is removed if it fails or is stopped
+
+    Encodes run in pool processes that cannot see the job's cancel event, so
+    the job asks them to stop by creating the file stop_path.
+    """
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr_file)
+    try:
+        while True:
+            try:
+                returncode = process.wait(timeout=STOP_POLL)
+                break
+            except subprocess.TimeoutExpired:
+                if stop_path and os.path.exists(stop_path):
+                    raise InterruptedError("Stopped")
+        if returncode != 0:
+            raise _ffmpeg_failure(process, stderr_file)
+    except BaseException:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    finally:
+        stderr_file.close()
+    return dest
+
+
+def _open_range(url, headers, start, end):
+    request = urllib.request.Request(url, headers=dict(headers or {}))
+    request.add_header('Range', f'bytes={start}-{end}')
+    return urllib.request.urlopen(request, timeout=HTTP_TIMEOUT)
+
+
+def _total_from_response(response):
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    return None
+
+
+def _ffmpeg_failure(process, stderr_file):
+    """Build an FFmpegError from a failed process and its captured stderr"""
+    returncode = process.wait()
+    stderr_file.seek(0)
+    message = stderr_file.read().decode('utf-8', 'replace').strip()
+    return FFmpegError(f"ffmpeg exited with status {returncode}: {message[-500:]}")
+
+
+def stream_transcode(fmt, dest_path, codec, quality, progress_hook=None, cancel_event=None,
+                     ffmpeg_location=None, remux=False, throttle=None, chunk_size=HTTP_CHUNK_SIZE):
+    """Download fmt['url'] and encode it into dest_path as the bytes arrive
+
+    progress_hook receives yt-dlp style dicts ('downloading' then 'finished').
+    throttle(size, cancel_event), if given, is called before each block is read
+    and may block to hold the download to a rate limit.
+    Raises FFmpegError if the encoder fails; dest_path is removed on any error.
+    """
+    command = [
+        find_ffmpeg(ffmpeg_location), '-hide_banner', '-loglevel', 'error', '-nostdin',
+        '-i', 'pipe:0', '-vn', *encoder_args(codec, quality, remux), '-y', dest_path,
+    ]
+    # stderr goes to a file so a chatty ffmpeg can never fill a pipe and stall
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+
+    headers = fmt.get('http_headers')
+    total = fmt.get('filesize') or fmt.get('filesize_approx')
+    downloaded = 0
+    started = time.time()
+    try:
+        while total is None or downloaded < total:
+            end = downloaded + chunk_size - 1
+            if total:
+                end = min(end, total - 1)
+            try:
+                response = _open_range(fmt['url'], headers, downloaded, end)
+            except urllib.error.HTTPError as e:
+                # 416 means we asked past the end of a stream of unknown length
+                if e.code == 416 and downloaded:
+                    break
+                raise
+            with response:
+                total = _total_from_response(response) or total
+                received = 0
+                while True:
+                    if throttle is not None:
+                        throttle(PIPE_BLOCK_SIZE, cancel_event)
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise InterruptedError("Cancelled")
+                    block = response.read(PIPE_BLOCK_SIZE)
+                    if not block:
+                        break
+                    try:
+                        process.stdin.write(block)
+                    except BrokenPipeError:
+                        raise _ffmpeg_failure(process, stderr_file)
+                    downloaded += len(block)
+                    received += len(block)
+
+                    if progress_hook:
+                        elapsed = max(time.time() - started, 1e-6)
+                        speed = downloaded / elapsed
+                        progress_hook({
+                            'status': 'downloading',
+                            'downloaded_bytes': downloaded,
+                            'total_bytes': total,
+                            'speed': speed,
+                            'eta': int((total - downloaded) / speed) if total else None,
+                            'elapsed': elapsed,
+                        })
+            # A server that ignores Range sends everything in one response
+            if received == 0 or response.status == 200:
+                break
+
+        process.stdin.close()
+        if progress_hook:
+            progress_hook({'status': 'finished', 'downloaded_bytes': downloaded, 'total_bytes': total,
+                           'elapsed': time.time() - started})
+        if process.wait() != 0:
+            raise _ffmpeg_failure(process, stderr_file)
+    except BaseException:
+        process.kill()
+        process.wait()
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        stderr_file.close()
+    return downloaded
@@ -0,0 +1,201 @@
+"""Streaming intake of large URL lists.
+
+URLs are read lazily, line by line, from text files, stdin or a drop folder,
+so a list of tens of thousands of entries never has to fit in memory. Every
+spelling of a video URL (watch?v= with extra parameters, youtu.be, shorts,
+embed, live, m. and music. hosts) is reduced to one canonical watch URL, and
+repeats are skipped as they arrive. Submission blocks while too many of the
+ingester's jobs are still unfinished, so the download queue only ever holds a
+bounded window of the list.
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from converter_engine import FINISHED_STATES, extract_video_id
+
+
+# Unfinished jobs the ingester may have in the queue before it waits
+DEFAULT_MAX_PENDING = 64
+
+# Seconds between checks for room in the queue and for new drop-folder files
+PENDING_POLL = 0.2
+WATCH_POLL = 2.0
+
+# Drop-folder files are picked up by extension and moved here once read
+WATCH_EXTENSIONS = ('.txt', '.list', '.urls')
+PROCESSED_DIR = "processed"
+
+# Hosts serving the same videos as www.youtube.com
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+                 'youtube-nocookie.com', 'www.youtube-nocookie.com')
+SHORT_HOSTS = ('youtu.be', 'www.youtu.be')
+
+# Channel pages: /channel/ID, /c/name, /user/name and /@handle, optionally with a tab
+CHANNEL_PATH_RE = re.compile(
+    r'^/((?:channel/[\w-]+|c/[^/?#]+|user/[^/?#]+|@[^/?#]+)(?:/(?:videos|shorts|streams|playlists|releases))?)'
+)
+
+# Several URLs may share a line, separated by spaces or commas
+URL_SPLIT_RE = re.compile(r'[\s,]+')
+
+
+def canonical_url(url):
+    """One spelling per video, playlist or channel; None if url is not a YouTube URL"""
+    url = url.strip()
+    if not url:
+        return None
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    if host not in YOUTUBE_HOSTS and host not in SHORT_HOSTS:
+        return None
+
+    video_id = extract_video_id(url)
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+    if host in SHORT_HOSTS:
+        return None
+
+    if parts.path.rstrip('/') == '/playlist':
+        playlist = parse_qs(parts.query).get('list')
+        return f"https://www.youtube.com/playlist?list={playlist[0]}" if playlist else None
+    match = CHANNEL_PATH_RE.match(parts.path)
+    if match:
+        return f"https://www.youtube.com/{match.group(1)}"
+    return None
+
+
+def read_lines(path):
+    """Yield the URLs in a text file ('-' for stdin), skipping blanks and # comments"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', errors='replace')
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            for url in URL_SPLIT_RE.split(line):
+                if url:
+                    yield url
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+# Feeds URLs from any source into a DownloadQueue
+class UrlIngester:
+    def __init__(self, download_queue, save_path, max_pending=DEFAULT_MAX_PENDING,
+                 on_submit=None, on_invalid=None):
+        self.download_queue = download_queue
+        self.save_path = save_path
+        self.max_pending = max(1, max_pending)
+        # Callbacks (on the ingesting thread): on_submit(job) and on_invalid(url)
+        self.on_submit = on_submit
+        self.on_invalid = on_invalid
+        self.submitted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        # Canonical URLs seen so far; about 60 bytes each, so millions fit comfortably
+        self._seen = set()
+        self._pending = []
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Make feed() and watch() return at the next URL or poll"""
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stats(self):
+        return {'submitted': self.submitted, 'duplicates': self.duplicates, 'invalid': self.invalid,
+                'pending': len(self._pending)}
+
+    def feed(self, urls):
+        """Submit URLs from any iterable, consuming it lazily; returns how many were queued"""
+        queued = 0
+        for url in urls:
+            if self.stopped:
+                break
+            canonical = canonical_url(url)
+            if canonical is None:
+                self.invalid += 1
+                if self.on_invalid:
+                    self.on_invalid(url)
+                continue
+            if canonical in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(canonical)
+
+            if not self._wait_for_room():
+                break
+            job = self.download_queue.submit(canonical, self.save_path)
+            self._pending.append(job)
+            self.submitted += 1
+            queued += 1
+            if self.on_submit:
+                self.on_submit(job)
+        return queued
+
+    def feed_file(self, path):
+        """Submit every URL in a text file ('-' for stdin)"""
+        return self.feed(read_lines(path))
+
+    def watch(self, directory, poll=WATCH_POLL):
+        """Ingest text files dropped into directory until stop() is called
+
+        A file is read once its size has stopped changing between two polls,
+        then moved into the processed/ subfolder so it is not read again.
+        """
+        processed = os.path.join(directory, PROCESSED_DIR)
+        os.makedirs(processed, exist_ok=True)
+        sizes = {}
+        while not self.stopped:
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError as e:
+                print(f"Error reading drop folder {directory}: {e}")
+                names = []
+            for name in names:
+                path = os.path.join(directory, name)
+                if not name.lower().endswith(WATCH_EXTENSIONS) or not os.path.isfile(path):
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                # Still being written: wait for the next poll
+                if sizes.get(path) != size:
+                    sizes[path] = size
+                    continue
+                del sizes[path]
+                try:
+                    count = self.feed_file(path)
+                    # A file cut short by stop() is read again next time
+                    if self.stopped:
+                        break
+                    shutil.move(path, os.path.join(processed, f"{int(time.time())}_{name}"))
+                    print(f"Ingested {count} URL(s) from {name}")
+                except Exception as e:
+                    print(f"Error ingesting {name}: {e}")
+            self._stop.wait(poll)
+
+    def _wait_for_room(self):
+        """Block until fewer than max_pending of our jobs are unfinished; False if stopped"""
+        while True:
+            if len(self._pending) >= self.max_pending:
+                self._pending = [job for job in self._pending if job.state not in FINISHED_STATES]
+            if len(self._pending) < self.max_pending:
+                return True
+            if self._stop.wait(PENDING_POLL):
+                return False
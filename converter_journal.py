@@ -0,0 +1,103 @@
+"""Crash-safe record of unfinished jobs, so they can be picked up after a restart.
+
+Every submitted job is written to a SQLite journal before it runs and removed
+once it is done, cancelled, or failed for good (an unavailable video, an
+encoder error). Jobs still listed at start-up were interrupted (the app
+closed, the machine crashed, the network went away) and are queued again;
+their per-video scratch directories let them continue where they stopped
+instead of starting from byte zero. Jobs that have been resumed
+MAX_RESUME_ATTEMPTS times are listed by expired() so they can be dropped.
+"""
+import os
+import time
+import sqlite3
+import threading
+
+from converter_engine import SETTINGS_DIR
+
+
+JOURNAL_FILE = os.path.join(SETTINGS_DIR, "journal.db")
+
+# A job that keeps failing is given up after this many resumes
+MAX_RESUME_ATTEMPTS = 3
+
+
+class JobJournal:
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    save_path TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    split_chapters INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Journals written before chapter splitting existed lack the column
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+            if 'split_chapters' not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN split_chapters INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, key, job):
+        """Record a newly submitted job (or a resubmission of a journaled one)"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                """INSERT INTO jobs (key, url, save_path, codec, quality, split_chapters, state, created_at,
+                                     updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET state = excluded.state, error = NULL,
+                                                  updated_at = excluded.updated_at""",
+                (key, job.url, os.path.abspath(job.save_path), job.codec, job.quality, int(job.split_chapters),
+                 job.state, now, now),
+            )
+
+    def update(self, key, job):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE key = ?",
+                (job.state, job.error, time.time(), key),
+            )
+
+    def remove(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+    def pending(self):
+        """Unfinished jobs worth resuming, oldest first"""
+        return self._select("attempts < ?", MAX_RESUME_ATTEMPTS)
+
+    def expired(self):
+        """Jobs that were resumed MAX_RESUME_ATTEMPTS times and are not worth another try"""
+        return self._select("attempts >= ?", MAX_RESUME_ATTEMPTS)
+
+    def _select(self, condition, *params):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, url, save_path, codec, quality, split_chapters, state, error, attempts FROM jobs "
+                f"WHERE {condition} ORDER BY created_at",
+                params,
+            ).fetchall()
+        names = ('key', 'url', 'save_path', 'codec', 'quality', 'split_chapters', 'state', 'error', 'attempts')
+        return [dict(zip(names, row)) for row in rows]
+
+    def mark_resumed(self, key):
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                             (time.time(), key))
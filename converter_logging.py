@@ -0,0 +1,153 @@
+"""Bounded log sink between the engine, yt-dlp and the console widget.
+
+Messages below their source's level are dropped before any formatting. The
+rest go into a ring buffer that the UI drains a few times a second, so a burst
+of output costs one widget update instead of one per line. An optional
+rotating log file is written by a background listener thread.
+"""
+import os
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from converter_engine import SETTINGS_DIR
+
+
+LOG_FILE = os.path.join(SETTINGS_DIR, "converter.log")
+
+# Lines kept in the console widget, and pending lines kept if the UI falls behind
+DEFAULT_MAX_LINES = 2000
+
+# Rotate the log file at this size, keeping this many old files
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Message sources and the lowest level shown for each by default
+SOURCE_APP = "app"
+SOURCE_ENGINE = "engine"
+SOURCE_YTDLP = "yt-dlp"
+DEFAULT_LEVELS = {
+    SOURCE_APP: logging.DEBUG,
+    SOURCE_ENGINE: logging.INFO,
+    SOURCE_YTDLP: logging.INFO,
+}
+
+
+class LogSink:
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, levels=None, log_file=None):
+        self.max_lines = max_lines
+        self.levels = dict(DEFAULT_LEVELS)
+        self.levels.update(levels or {})
+        self.dropped = 0
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._file_logger = None
+        self._listener = None
+        if log_file:
+            self.open_file(log_file)
+
+    def enabled(self, source, level):
+        return level >= self.levels.get(source, logging.INFO)
+
+    def set_level(self, source, level):
+        self.levels[source] = level
+
+    def emit(self, source, level, msg):
+        """Add one message; safe from any thread"""
+        if not self.enabled(source, level):
+            return
+        msg = str(msg).rstrip('\n')
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {msg}" if msg.strip() else msg
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self.dropped += 1
+            self._lines.append(line)
+        if self._file_logger is not None:
+            self._file_logger.log(level, msg, extra={'source': source})
+
+    def drain(self):
+        """Return the lines added since the last drain"""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+    def open_file(self, path=LOG_FILE, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+        """Also write every accepted message to a rotating file, from a background thread"""
+        self.close_file()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(source)s] %(message)s"))
+        records = queue.Queue()
+        self._listener = QueueListener(records, handler)
+        self._listener.start()
+
+        logger = logging.getLogger(f"{__name__}.{id(self)}")
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(QueueHandler(records))
+        self._file_logger = logger
+
+    def close_file(self):
+        """Flush and stop the log file writer, if any"""
+        logger, self._file_logger = self._file_logger, None
+        if logger is not None:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+    @property
+    def file_enabled(self):
+        return self._file_logger is not None
+
+
+# Logger for yt_dlp that feeds a LogSink
+class SinkLogger:
+    def __init__(self, sink, source=SOURCE_YTDLP):
+        self.sink = sink
+        self.source = source
+
+    def debug(self, msg):
+        # yt-dlp sends its regular output through debug() too; real debug lines are prefixed
+        level = logging.DEBUG if msg.startswith('[debug] ') else logging.INFO
+        self.sink.emit(self.source, level, msg)
+
+    def info(self, msg):
+        self.sink.emit(self.source, logging.INFO, msg)
+
+    def warning(self, msg):
+        self.sink.emit(self.source, logging.WARNING, f"Warning: {msg}")
+
+    def error(self, msg):
+        self.sink.emit(self.source, logging.ERROR, f"Error: {msg}")
+
+
+# File-like object that turns print() output into sink lines
+class SinkWriter:
+    def __init__(self, sink, source=SOURCE_APP, level=logging.INFO):
+        self.sink = sink
+        self.source = source
+        self.level = level
+        self._partial = ''
+        self._lock = threading.Lock()
+
+    def write(self, string):
+        with self._lock:
+            lines = (self._partial + string).split('\n')
+            self._partial = lines.pop()
+        for line in lines:
+            self.sink.emit(self.source, self.level, line)
+        return len(string)
+
+    def flush(self):
+        with self._lock:
+            partial, self._partial = self._partial, ''
+        if partial:
+            self.sink.emit(self.source, self.level, partial)
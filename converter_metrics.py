@@ -0,0 +1,162 @@
+"""Aggregate per-job metrics and export them for dashboards.
+
+snapshot() summarises finished jobs as plain dicts (p50/p95 per stage, bytes,
+throughput, retries, failures by class) for JSON APIs. prometheus_text() renders the same data in
+the Prometheus text format, using histograms so percentiles can be computed
+across many runs and scrapes.
+"""
+import math
+
+from converter_engine import FINISHED_STATES, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+from converter_retry import ERROR_LABELS, ERROR_OTHER
+
+
+METRIC_PREFIX = "youtube_mp3"
+
+# Pipeline stages in the order a job passes through them
+STAGES = ('prepare', 'extract', 'fetch', 'encode', 'finalize')
+
+# Histogram bucket bounds: seconds, bytes per second, and seconds of audio per second
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SPEED_BUCKETS = tuple(1024 * 2 ** n for n in range(6, 17, 2))
+ENCODE_SPEED_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'max': None, 'mean': None}
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 0.50), 4),
+        'p95': round(percentile(values, 0.95), 4),
+        'max': round(max(values), 4),
+        'mean': round(sum(values) / len(values), 4),
+    }
+
+
+def measured_jobs(jobs):
+    """Finished jobs that did work of their own (expanded playlists are placeholders)"""
+    return [job for job in jobs if job.state in FINISHED_STATES and not job.children]
+
+
+def job_seconds(job):
+    if job.finished_at is None:
+        return None
+    return job.finished_at - job.created_at
+
+
+def snapshot(jobs):
+    """Summary of the metrics of every finished job"""
+    finished = measured_jobs(jobs)
+    done = [job for job in finished if job.state == JOB_DONE]
+    counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED)}
+    for job in jobs:
+        counts[job.state] += 1
+    failures = {error_class: 0 for error_class in ERROR_LABELS}
+    for job in finished:
+        if job.state == JOB_FAILED:
+            failures[job.error_class or ERROR_OTHER] += 1
+
+    return {
+        'counts': counts,
+        'job_seconds': summarize([job_seconds(job) for job in done]),
+        'stage_seconds': {
+            stage: summarize([job.metrics.stage_seconds.get(stage) for job in finished]) for stage in STAGES
+        },
+        'bytes_downloaded': sum(job.metrics.bytes_downloaded for job in finished),
+        'average_speed': summarize([job.metrics.average_speed() for job in done]),
+        'peak_speed': max((job.metrics.peak_speed for job in finished), default=0.0),
+        'encode_speed': summarize([job.metrics.encode_speed() for job in done]),
+        'retries': sum(job.metrics.retries for job in finished),
+        'failures': failures,
+    }
+
+
+def _escape(value):
+    """Escape a label value as the text format requires"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _metric(lines, name, kind, help_text, samples):
+    """Append one metric family; samples are (labels, value) pairs"""
+    name = f"{METRIC_PREFIX}_{name}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_format_value(value)}")
+
+
+def _histogram(lines, name, help_text, buckets, series):
+    """Append a histogram family; series are (labels, observed values) pairs"""
+    name = f"{METRIC_PREFIX}_{name}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, values in series:
+        values = [value for value in values if value is not None]
+        for bound in buckets:
+            count = sum(1 for value in values if value <= bound)
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {count}")
+        lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {len(values)}")
+        lines.append(f"{name}_sum{_labels(labels)} {_format_value(float(sum(values)))}")
+        lines.append(f"{name}_count{_labels(labels)} {len(values)}")
+
+
+def prometheus_text(jobs, info_cache_stats=None):
+    """Render job (and optionally info cache) metrics in the Prometheus text format"""
+    finished = measured_jobs(jobs)
+    done = [job for job in finished if job.state == JOB_DONE]
+    summary = snapshot(jobs)
+    lines = []
+
+    _metric(lines, 'jobs', 'gauge', "Jobs by state.",
+            [({'state': state}, count) for state, count in summary['counts'].items()])
+    _histogram(lines, 'job_seconds', "Time from submission to completion of successful jobs.",
+               LATENCY_BUCKETS, [({}, [job_seconds(job) for job in done])])
+    _histogram(lines, 'stage_seconds', "Time spent in each pipeline stage.", LATENCY_BUCKETS,
+               [({'stage': stage}, [job.metrics.stage_seconds.get(stage) for job in finished])
+                for stage in STAGES])
+    _metric(lines, 'downloaded_bytes_total', 'counter', "Bytes fetched from the network.",
+            [({}, summary['bytes_downloaded'])])
+    _histogram(lines, 'download_speed_bytes', "Average download speed per job in bytes per second.",
+               SPEED_BUCKETS, [({}, [job.metrics.average_speed() for job in done])])
+    _metric(lines, 'download_peak_speed_bytes', 'gauge', "Highest download speed reported by any job.",
+            [({}, float(summary['peak_speed']))])
+    _histogram(lines, 'encode_speed_ratio', "Seconds of audio encoded per second of encoding time.",
+               ENCODE_SPEED_BUCKETS, [({}, [job.metrics.encode_speed() for job in done])])
+    _metric(lines, 'retries_total', 'counter', "Download retries across all jobs.",
+            [({}, summary['retries'])])
+    _metric(lines, 'failures_total', 'counter', "Failed jobs by error class.",
+            [({'class': error_class}, count) for error_class, count in summary['failures'].items()])
+
+    if info_cache_stats:
+        _metric(lines, 'info_cache_lookups_total', 'counter', "Info cache lookups by result.", [
+            ({'result': 'hit'}, info_cache_stats['hits']),
+            ({'result': 'disk_hit'}, info_cache_stats['disk_hits']),
+            ({'result': 'miss'}, info_cache_stats['misses']),
+        ])
+        _metric(lines, 'info_cache_entries', 'gauge', "Entries held in the in-memory info cache.",
+                [({}, info_cache_stats['entries'])])
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,210 @@
+"""Frame-level MP3 joining, so one long file can be encoded as segments in parallel.
+
+Each segment is encoded by its own ffmpeg with the bit reservoir off, which
+makes every frame self-contained, and starts a few frames early so the
+encoder has settled by the first frame that is kept. The segments are then
+joined by copying whole frames: the pre-roll of each segment is dropped and
+exactly the frames it owns are kept, so the result has the same frame grid
+as a single encode and plays back without gaps. The Info (Xing/LAME) frame
+of the first segment is rewritten with the joined file's frame count, size
+and end padding, so players report the right duration and trim gaplessly.
+
+Frames are streamed one at a time; memory use does not depend on the length
+of the audio.
+"""
+import struct
+
+
+# MPEG-1 Layer III: samples per frame, bitrates (kbps) by index and sample rates by index
+SAMPLES_PER_FRAME = 1152
+BITRATES = (None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, None)
+SAMPLE_RATES = (44100, 48000, 32000, None)
+
+HEADER_SIZE = 4
+
+# Bytes of side information after the header, for stereo and mono frames
+SIDE_INFO_STEREO = 32
+SIDE_INFO_MONO = 17
+
+# Xing header flags, and the sizes of the fields they announce
+XING_FRAMES = 0x1
+XING_BYTES = 0x2
+XING_TOC = 0x4
+XING_QUALITY = 0x8
+XING_TOC_SIZE = 100
+
+# Offsets inside the LAME extension that follows the Xing fields
+LAME_DELAY_PADDING = 21
+LAME_MUSIC_LENGTH = 28
+LAME_MUSIC_CRC = 32
+LAME_TAG_CRC = 34
+LAME_SIZE = 36
+
+ID3V1_SIZE = 128
+
+
+# Raised for data that is not a clean MPEG-1 Layer III stream
+class Mp3Error(Exception):
+    pass
+
+
+def parse_header(header):
+    """(frame length in bytes, sample rate, channels) of an MPEG-1 Layer III header, or None"""
+    if len(header) < HEADER_SIZE or header[0] != 0xFF or (header[1] & 0xFE) != 0xFA:
+        return None
+    bitrate = BITRATES[header[2] >> 4]
+    sample_rate = SAMPLE_RATES[(header[2] >> 2) & 0x3]
+    if bitrate is None or sample_rate is None:
+        return None
+    padding = (header[2] >> 1) & 0x1
+    channels = 1 if header[3] >> 6 == 0x3 else 2
+    return 144000 * bitrate // sample_rate + padding, sample_rate, channels
+
+
+def info_offset(frame):
+    """Offset of the Xing/Info tag in frame, or None if it is an ordinary audio frame"""
+    parsed = parse_header(frame)
+    if parsed is None:
+        return None
+    offset = HEADER_SIZE + (SIDE_INFO_MONO if parsed[2] == 1 else SIDE_INFO_STEREO)
+    # A cleared protection bit means a 16-bit CRC follows the header
+    if not frame[1] & 0x1:
+        offset += 2
+    if frame[offset:offset + 4] in (b'Xing', b'Info'):
+        return offset
+    return None
+
+
+def _skip_id3v2(f):
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b'ID3':
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        f.seek(size, 1)
+    else:
+        f.seek(0)
+
+
+def read_frames(path):
+    """Yield every frame (as bytes) of an MP3 file, the Info frame included"""
+    with open(path, 'rb') as f:
+        _skip_id3v2(f)
+        while True:
+            header = f.read(HEADER_SIZE)
+            if not header:
+                return
+            parsed = parse_header(header)
+            if parsed is None:
+                # An ID3v1 tag may close the file
+                if header[:3] == b'TAG' and len(f.read(ID3V1_SIZE)) == ID3V1_SIZE - HEADER_SIZE:
+                    return
+                raise Mp3Error(f"Lost frame sync at byte {f.tell() - len(header)} of {path}")
+            body = f.read(parsed[0] - HEADER_SIZE)
+            if len(body) < parsed[0] - HEADER_SIZE:
+                raise Mp3Error(f"Truncated frame at the end of {path}")
+            yield header + body
+
+
+def _lame_offset(frame, offset):
+    """Offset of the LAME extension after a Xing/Info tag, or None if the frame has none"""
+    flags = struct.unpack('>I', frame[offset + 4:offset + 8])[0]
+    lame = offset + 8
+    for flag, size in ((XING_FRAMES, 4), (XING_BYTES, 4), (XING_TOC, XING_TOC_SIZE), (XING_QUALITY, 4)):
+        if flags & flag:
+            lame += size
+    return lame if lame + LAME_SIZE <= len(frame) else None
+
+
+def encoder_padding(frame):
+    """Samples of padding the encoder appended, from an Info frame's LAME extension, or None"""
+    offset = info_offset(frame)
+    lame = _lame_offset(frame, offset) if offset is not None else None
+    if lame is None:
+        return None
+    return int.from_bytes(frame[lame + LAME_DELAY_PADDING:lame + LAME_DELAY_PADDING + 3], 'big') & 0xFFF
+
+
+def crc16(data):
+    """CRC-16/ARC, the checksum the LAME extension uses"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def update_info_frame(frame, frames, size, padding=None):
+    """Return a copy of an Info frame describing a stream of frames audio frames and size bytes"""
+    frame = bytearray(frame)
+    offset = info_offset(frame)
+    # Every segment is constant bitrate, and 'Info' is the CBR spelling of the tag
+    frame[offset:offset + 4] = b'Info'
+    flags = struct.unpack('>I', frame[offset + 4:offset + 8])[0]
+    position = offset + 8
+    if flags & XING_FRAMES:
+        frame[position:position + 4] = struct.pack('>I', frames)
+        position += 4
+    if flags & XING_BYTES:
+        frame[position:position + 4] = struct.pack('>I', size)
+        position += 4
+    if flags & XING_TOC:
+        # Constant bitrate: byte position grows linearly with time
+        frame[position:position + XING_TOC_SIZE] = bytes(256 * i // XING_TOC_SIZE for i in range(XING_TOC_SIZE))
+
+    lame = _lame_offset(frame, offset)
+    if lame is not None:
+        if padding is not None:
+            field = lame + LAME_DELAY_PADDING
+            delay = int.from_bytes(frame[field:field + 3], 'big') >> 12
+            frame[field:field + 3] = ((delay << 12) | min(padding, 0xFFF)).to_bytes(3, 'big')
+        frame[lame + LAME_MUSIC_LENGTH:lame + LAME_MUSIC_LENGTH + 4] = struct.pack('>I', size)
+        # The music CRC would take a byte-by-byte pass over the whole file; zero marks it as not computed
+        frame[lame + LAME_MUSIC_CRC:lame + LAME_MUSIC_CRC + 2] = b'\0\0'
+        frame[lame + LAME_TAG_CRC:lame + LAME_TAG_CRC + 2] = struct.pack('>H', crc16(frame[:lame + LAME_TAG_CRC]))
+    return bytes(frame)
+
+
+def join_segments(segments, dest):
+    """Join encoded segments into one MP3 at dest; returns the number of audio frames written
+
+    segments is a list of (path, skip, count): the first skip audio frames of
+    each file are pre-roll and dropped, then count frames are kept (None keeps
+    the rest of the file). The Info frame is taken from the first segment,
+    and the end padding from the last.
+    """
+    frames = 0
+    size = 0
+    info_frame = None
+    padding = None
+    with open(dest, 'wb') as out:
+        for index, (path, skip, count) in enumerate(segments):
+            kept = 0
+            audio_index = 0
+            for frame in read_frames(path):
+                if audio_index == 0 and info_offset(frame) is not None:
+                    if index == 0:
+                        info_frame = frame
+                        # Reserve its place; it is rewritten once the totals are known
+                        out.write(frame)
+                        size += len(frame)
+                    if index == len(segments) - 1:
+                        padding = encoder_padding(frame)
+                    continue
+                audio_index += 1
+                if audio_index <= skip:
+                    continue
+                if count is not None and kept >= count:
+                    break
+                out.write(frame)
+                kept += 1
+                size += len(frame)
+            if count is not None and kept < count:
+                raise Mp3Error(f"Segment {path} has {kept} of its {count} frames")
+            frames += kept
+
+        if info_frame is not None:
+            out.seek(0)
+            out.write(update_info_frame(info_frame, frames, size, padding))
+    return frames
@@ -0,0 +1,313 @@
+"""Shared network budget for all running downloads.
+
+BandwidthGovernor splits one bandwidth limit between the jobs that are
+currently downloading, max-min fair: jobs that cannot use their equal share
+(a slow server, a nearly finished file) give the surplus to the others. Each
+job's share is pushed into its YoutubeDL's 'ratelimit' option while it runs,
+and into a token bucket for streaming downloads.
+
+HostLimiter caps the number of connections open to one host at a time.
+
+HostBreaker pauses requests to a site that has started throttling us: after
+a burst of throttled responses it opens, and new requests wait out a
+cool-down. Then a single request probes the site; if it goes through the
+breaker closes, and if it is throttled again the cool-down doubles.
+"""
+import re
+import time
+import threading
+from collections import defaultdict, deque
+
+
+# Seconds between recomputing the shares
+REBALANCE_INTERVAL = 0.5
+
+# A job counts as unable to use its share below this fraction of it...
+SATISFIED_RATIO = 0.8
+# ...once it has had this long to ramp up; it is then offered its speed plus headroom
+RAMP_UP_SECONDS = 2.0
+DEMAND_HEADROOM = 1.25
+
+# Seconds of traffic the streaming token bucket may send in one burst
+BURST_SECONDS = 0.5
+
+# Default connections to one host at a time
+DEFAULT_MAX_PER_HOST = 6
+
+# Throttled responses from one site within BREAKER_WINDOW seconds that open its breaker,
+# and the first cool-down in seconds (doubled on each failed probe, up to the maximum)
+BREAKER_THRESHOLD = 3
+BREAKER_WINDOW = 60.0
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 600.0
+
+SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$', re.IGNORECASE)
+
+
+def parse_size(text):
+    """Bytes from a size such as '500K', '2M' or '1.5MiB' (binary multiples); None if empty"""
+    if text is None or str(text).strip() == '':
+        return None
+    match = SIZE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' kmg'.index(unit.lower() or ' '))
+
+
+def format_rate(rate):
+    return f"{rate / 1024 / 1024:.2f} MB/s"
+
+
+def fair_shares(limit, demands):
+    """Max-min fair split of limit; demands are the most each party can use (None for no cap)"""
+    shares = [0.0] * len(demands)
+    order = sorted(range(len(demands)), key=lambda i: float('inf') if demands[i] is None else demands[i])
+    remaining = float(limit)
+    for position, index in enumerate(order):
+        equal = remaining / (len(order) - position)
+        demand = demands[index]
+        shares[index] = equal if demand is None else min(demand, equal)
+        remaining -= shares[index]
+    return shares
+
+
+# One running download's slice of the governor's budget
+class BandwidthShare:
+    def __init__(self, governor, job):
+        self.governor = governor
+        self.job = job
+        self.rate = None
+        self.speed = 0.0
+        self.started = time.monotonic()
+        self._appliers = []
+        # Held while rates are applied, so none is applied after release()
+        self._apply_lock = threading.Lock()
+        self._tokens = 0.0
+        self._last_fill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def on_rate(self, apply):
+        """Call apply(rate) now and whenever the share changes, until release(); rate None means unlimited"""
+        with self._apply_lock:
+            self._appliers.append(apply)
+            apply(self.rate)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.job.rate_limit = rate
+        with self._apply_lock:
+            for apply in self._appliers:
+                apply(rate)
+
+    def report(self, speed):
+        """Feed back the download's measured speed"""
+        if speed:
+            self.speed = speed
+        self.governor.maybe_rebalance()
+
+    def throttle(self, size, cancel_event=None):
+        """Token bucket for downloads that do not go through yt-dlp; blocks until size bytes may pass"""
+        while True:
+            rate = self.rate
+            if not rate:
+                return
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(rate * BURST_SECONDS, self._tokens + (now - self._last_fill) * rate)
+                self._last_fill = now
+                if self._tokens >= size or self._tokens >= rate * BURST_SECONDS:
+                    self._tokens -= size
+                    return
+                wait = (size - self._tokens) / rate
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            time.sleep(min(wait, BURST_SECONDS))
+
+    def release(self):
+        with self._apply_lock:
+            self._appliers = []
+        self.governor.release(self)
+
+
+class BandwidthGovernor:
+    def __init__(self, limit=None):
+        # Total bytes per second for all downloads; None for no limit
+        self.limit = limit
+        self._shares = []
+        self._lock = threading.Lock()
+        self._last_rebalance = 0.0
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self.rebalance()
+
+    def acquire(self, job):
+        """Start tracking a job's download and return its BandwidthShare"""
+        share = BandwidthShare(self, job)
+        with self._lock:
+            self._shares.append(share)
+        self.rebalance()
+        return share
+
+    def release(self, share):
+        with self._lock:
+            if share in self._shares:
+                self._shares.remove(share)
+        share.job.rate_limit = None
+        self.rebalance()
+
+    def active(self):
+        with self._lock:
+            return len(self._shares)
+
+    def maybe_rebalance(self):
+        if time.monotonic() - self._last_rebalance >= REBALANCE_INTERVAL:
+            self.rebalance()
+
+    def rebalance(self):
+        """Recompute every share from the limit and the measured speeds"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_rebalance = now
+            shares = list(self._shares)
+            if not self.limit or not shares:
+                rates = [None] * len(shares)
+            else:
+                demands = []
+                for share in shares:
+                    settled = now - share.started >= RAMP_UP_SECONDS
+                    if settled and share.rate and share.speed < share.rate * SATISFIED_RATIO:
+                        demands.append(share.speed * DEMAND_HEADROOM)
+                    else:
+                        demands.append(None)
+                rates = [int(rate) for rate in fair_shares(self.limit, demands)]
+        for share, rate in zip(shares, rates):
+            if rate != share.rate:
+                share.set_rate(rate)
+
+
+class HostLimiter:
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST):
+        self.max_per_host = max_per_host
+        self._open = defaultdict(int)
+        self._changed = threading.Condition()
+
+    def acquire(self, host, count=1, cancel_event=None):
+        """Block until count connections to host are free; returns the number actually taken"""
+        count = max(1, min(count, self.max_per_host))
+        with self._changed:
+            while self._open[host] and self._open[host] + count > self.max_per_host:
+                if cancel_event is not None and cancel_event.is_set():
+                    return 0
+                self._changed.wait(0.5)
+            self._open[host] += count
+        return count
+
+    def release(self, host, count):
+        if not count:
+            return
+        with self._changed:
+            self._open[host] -= count
+            if self._open[host] <= 0:
+                del self._open[host]
+            self._changed.notify_all()
+
+    def open_connections(self):
+        with self._changed:
+            return dict(self._open)
+
+
+def site_of(host):
+    """The part of a host name that throttling applies to, e.g. googlevideo.com for all its media servers"""
+    host = (host or '').lower().rstrip('.')
+    if re.match(r'^[\d.]+$', host) or ':' in host:
+        return host
+    return '.'.join(host.split('.')[-2:])
+
+
+# Circuit breaker per site; see the module docstring
+class HostBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = max(1, int(threshold))
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        # Recent throttled responses per site, as monotonic times
+        self._throttled = defaultdict(deque)
+        # Open breakers: site -> (time the cool-down ends, its length)
+        self._open = {}
+        # Sites with a probe request in flight
+        self._probing = set()
+        self._changed = threading.Condition()
+
+    def wait(self, host, cancel_event=None):
+        """Block while the breaker for host's site is open; returns False if cancelled while waiting"""
+        site = site_of(host)
+        with self._changed:
+            while site in self._open:
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                remaining = self._open[site][0] - time.monotonic()
+                if remaining <= 0 and site not in self._probing:
+                    # Half open: this request probes the site while the others keep waiting
+                    self._probing.add(site)
+                    return True
+                self._changed.wait(min(max(remaining, 0.05), 0.5))
+        return True
+
+    def paused(self, host):
+        """Seconds left in the cool-down for host's site, or 0 if requests may go ahead"""
+        with self._changed:
+            entry = self._open.get(site_of(host))
+            return max(0.0, entry[0] - time.monotonic()) if entry else 0.0
+
+    def record_success(self, host):
+        """Close the breaker after a successful probe; while it is closed, throttling still counts in its window"""
+        site = site_of(host)
+        with self._changed:
+            # A request that started before the breaker opened says nothing about the site now
+            if site not in self._open or (site not in self._probing and time.monotonic() < self._open[site][0]):
+                return
+            self._throttled.pop(site, None)
+            del self._open[site]
+            self._probing.discard(site)
+            self._changed.notify_all()
+
+    def record_throttled(self, host):
+        """Count a throttled response; returns the cool-down in seconds if this opened the breaker, else None"""
+        site = site_of(host)
+        now = time.monotonic()
+        with self._changed:
+            if site in self._probing:
+                self._probing.discard(site)
+                cooldown = min(self.max_cooldown, self._open[site][1] * 2)
+            elif site in self._open:
+                return None
+            else:
+                recent = self._throttled[site]
+                recent.append(now)
+                while recent and recent[0] < now - self.window:
+                    recent.popleft()
+                if len(recent) < self.threshold:
+                    return None
+                recent.clear()
+                cooldown = self.cooldown
+            self._open[site] = (now + cooldown, cooldown)
+            self._changed.notify_all()
+            return cooldown
+
+    def record_failure(self, host):
+        """Any other failure: it neither opens nor closes the breaker, but frees the probe slot"""
+        site = site_of(host)
+        with self._changed:
+            if site in self._probing:
+                self._probing.discard(site)
+                self._changed.notify_all()
+
+    def open_sites(self):
+        """Sites whose breaker is open, with the seconds left in their cool-down"""
+        now = time.monotonic()
+        with self._changed:
+            return {site: round(max(0.0, until - now), 1) for site, (until, _) in self._open.items()}
@@ -0,0 +1,130 @@
+"""Failure classes for jobs, and how long to wait before trying a job again.
+
+classify_error() sorts the exception a job failed with into one of:
+
+    transient    the connection dropped, timed out or hit a server error
+    throttled    the site is rate limiting us (HTTP 429, bot checks)
+    unavailable  the video is private, removed, region locked and so on
+    encoder      ffmpeg (or the MP3 joiner) failed on the audio
+    other        anything else, e.g. a full disk
+
+Transient and throttled failures are worth another try, after a backoff from
+retry_delay(); the others would fail the same way again. yt-dlp wraps the
+original exception in its DownloadError, so the wrapped exception and the
+exception's cause are looked at as well as the message.
+"""
+import re
+import socket
+import random
+import http.client
+import urllib.error
+
+from converter_ffmpeg import FFmpegError
+from converter_mp3 import Mp3Error
+
+
+ERROR_TRANSIENT = "transient"
+ERROR_THROTTLED = "throttled"
+ERROR_UNAVAILABLE = "unavailable"
+ERROR_ENCODER = "encoder"
+ERROR_OTHER = "other"
+
+# Classes a job is retried for
+RETRYABLE_ERRORS = (ERROR_TRANSIENT, ERROR_THROTTLED)
+
+# Short descriptions for people
+ERROR_LABELS = {
+    ERROR_TRANSIENT: "Network error",
+    ERROR_THROTTLED: "Rate limited",
+    ERROR_UNAVAILABLE: "Video unavailable",
+    ERROR_ENCODER: "Encoder error",
+    ERROR_OTHER: "Error",
+}
+
+# Retries per job before a retryable failure is final
+DEFAULT_MAX_RETRIES = 4
+
+# Backoff in seconds before the first retry, doubling on each later one up to RETRY_MAX_DELAY.
+# Throttling starts from a longer wait, since the site has asked us to slow down.
+RETRY_BASE_DELAY = 2.0
+THROTTLE_BASE_DELAY = 15.0
+RETRY_MAX_DELAY = 300.0
+
+# HTTP statuses worth retrying; 403 from a media host usually means an expired stream URL
+TRANSIENT_STATUSES = (403, 408, 500, 502, 503, 504)
+THROTTLED_STATUSES = (429,)
+UNAVAILABLE_STATUSES = (404, 410, 451)
+
+# Checked in this order against the error message
+THROTTLED_RE = re.compile(
+    r"HTTP Error 429|Too Many Requests|rate.?limit|confirm you.re not a bot|unusual traffic", re.IGNORECASE
+)
+UNAVAILABLE_RE = re.compile(
+    r"Video unavailable|Private video|video is private|has been removed|no longer available|"
+    r"not available in your country|confirm your age|members.only|copyright|live event will begin|"
+    r"Premieres in|account .* terminated|HTTP Error (404|410|451)|Unsupported URL|Incomplete YouTube ID",
+    re.IGNORECASE
+)
+TRANSIENT_RE = re.compile(
+    r"HTTP Error (403|408|5\d\d)|timed out|Connection (reset|refused|aborted)|Remote end closed|"
+    r"IncompleteRead|Temporary failure in name resolution|Name or service not known|Network is unreachable|"
+    r"Unable to download (webpage|API page)|EOF occurred in violation of protocol|\bSSL\b",
+    re.IGNORECASE
+)
+
+# Exceptions for a connection that failed; an HTTPError is judged by its status instead
+TRANSIENT_TYPES = (ConnectionError, TimeoutError, socket.timeout, socket.gaierror, http.client.HTTPException,
+                   urllib.error.URLError)
+
+
+def _error_chain(error):
+    """The error, the exception yt-dlp wrapped inside it, and their causes"""
+    seen = []
+    pending = [error]
+    while pending:
+        current = pending.pop(0)
+        if current is None or any(current is e for e in seen):
+            continue
+        seen.append(current)
+        exc_info = getattr(current, 'exc_info', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            pending.append(exc_info[1])
+        pending.extend((current.__cause__, current.__context__))
+    return seen
+
+
+def classify_error(error):
+    """One of the ERROR_* classes for an exception a job failed with"""
+    chain = _error_chain(error)
+    for e in chain:
+        if isinstance(e, (FFmpegError, Mp3Error)):
+            return ERROR_ENCODER
+        if isinstance(e, urllib.error.HTTPError):
+            if e.code in THROTTLED_STATUSES:
+                return ERROR_THROTTLED
+            if e.code in UNAVAILABLE_STATUSES:
+                return ERROR_UNAVAILABLE
+            if e.code in TRANSIENT_STATUSES:
+                return ERROR_TRANSIENT
+
+    message = " ".join(str(e) for e in chain)
+    if THROTTLED_RE.search(message):
+        return ERROR_THROTTLED
+    if UNAVAILABLE_RE.search(message):
+        return ERROR_UNAVAILABLE
+    if any(isinstance(e, TRANSIENT_TYPES) and not isinstance(e, urllib.error.HTTPError) for e in chain):
+        return ERROR_TRANSIENT
+    if TRANSIENT_RE.search(message):
+        return ERROR_TRANSIENT
+    return ERROR_OTHER
+
+
+def retry_delay(attempt, error_class=ERROR_TRANSIENT, rng=random):
+    """Seconds to wait before retry number attempt (0 for the first)
+
+    The backoff doubles with every attempt. Half of it is fixed and half is
+    random, so jobs that failed together do not all come back at once.
+    """
+    base = THROTTLE_BASE_DELAY if error_class == ERROR_THROTTLED else RETRY_BASE_DELAY
+    backoff = min(RETRY_MAX_DELAY, base * 2 ** attempt)
+    return backoff / 2 + rng.uniform(0, backoff / 2)
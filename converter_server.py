@@ -0,0 +1,410 @@
+"""Local HTTP job service for submitting and polling conversions.
+
+    python converter_server.py --port 8765
+    python converter_server.py --stub          # offline, fake downloads and encoding
+    python converter_server.py --watch DIR     # also convert URL lists dropped into DIR
+
+All requests are served from a single asyncio event loop; the conversions
+themselves run on the engine's bounded worker pool, so hundreds of queued jobs
+cost no threads of their own.
+
+API (JSON in, JSON out):
+    POST   /jobs               {"urls": [...], "save_path": "...", "codec": "mp3", "quality": 192,
+                                "split_chapters": false, "priority": 0}
+                               -> 201 {"jobs": [...]}; codec and quality default to -f and -b
+    GET    /jobs[?state=done]  -> {"jobs": [...], "counts": {...}}
+    GET    /jobs/<id>          -> the job, including its latest progress_hook data
+    PATCH  /jobs/<id>          {"priority": 10}; higher runs first     -> 200 job
+    DELETE /jobs/<id>          -> cancel the job                      -> 202 job
+    GET    /files              -> {"files": [...]} finished outputs
+    GET    /stats              -> job counts, info cache and session pool counters, timing summary,
+                                  sites paused for throttling
+    GET    /metrics            -> Prometheus text format metrics
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from converter_archive import DownloadArchive
+from converter_cache import DEFAULT_TTL, INFO_CACHE_DIR, InfoCache
+from converter_engine import (
+    Converter, DownloadQueue, DEFAULT_CODEC, DEFAULT_CONCURRENT_FRAGMENTS, DEFAULT_MAX_WORKERS, DEFAULT_QUALITY, FINISHED_STATES, JOB_DONE,
+    default_save_path, read_settings, warm_up,
+)
+from converter_ffmpeg import HTTP_CHUNK_SIZE, OUTPUT_CODECS
+from converter_ingest import UrlIngester, canonical_url
+from converter_journal import JobJournal
+from converter_metrics import prometheus_text, snapshot
+from converter_network import DEFAULT_MAX_PER_HOST, BandwidthGovernor, HostBreaker, HostLimiter, parse_size
+from converter_retry import DEFAULT_MAX_RETRIES
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Refuse request bodies larger than this
+MAX_BODY_SIZE = 1024 * 1024
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+
+# Bitrates in kbps a submitted job may ask for
+MIN_QUALITY = 8
+MAX_QUALITY = 512
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+# Raised by handlers to send an error response
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class JobServer:
+    def __init__(self, download_queue, save_path):
+        self.download_queue = download_queue
+        self.save_path = save_path
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Serve until cancelled; calls ready(port) once listening"""
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self.handle_client, host, port)
+        bound_port = self._server.sockets[0].getsockname()[1]
+        if ready:
+            ready(bound_port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self, host=DEFAULT_HOST, port=0):
+        """Run the server on a background thread and return the bound port"""
+        started = threading.Event()
+        result = {}
+
+        def ready(bound_port):
+            result['port'] = bound_port
+            started.set()
+
+        def run():
+            try:
+                asyncio.run(self.serve(host, port, ready))
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return result['port']
+
+    def stop(self):
+        """Stop a server started with start()"""
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+            for task in asyncio.all_tasks(self._loop):
+                self._loop.call_soon_threadsafe(task.cancel)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send(writer, 400, {'error': "Malformed request line"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, 400, {'error': "Invalid Content-Length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self.send(writer, 413, {'error': "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception as e:
+                    print(f"Error handling {method} {target}: {e}")
+                    status, payload = 500, {'error': str(e)}
+
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, payload, keep_alive=True):
+        # Handlers return dicts for JSON, or text (e.g. /metrics) as-is
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload).encode('utf-8')
+            content_type = "application/json"
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    def dispatch(self, method, target, body):
+        """Route a request; returns (status, payload)"""
+        parts = urlsplit(target)
+        path = parts.path.rstrip('/') or '/'
+        query = parse_qs(parts.query)
+
+        if path == '/jobs':
+            if method == 'GET':
+                return 200, self.list_jobs(query.get('state', [None])[0])
+            if method == 'POST':
+                return 201, self.submit_jobs(self.parse_json(body))
+            raise HTTPError(405, f"{method} not allowed on {path}")
+
+        if path.startswith('/jobs/'):
+            job = self.find_job(path[len('/jobs/'):])
+            if method == 'GET':
+                return 200, job.to_dict()
+            if method == 'PATCH':
+                priority = self.parse_priority(self.parse_json(body))
+                if priority is None:
+                    raise HTTPError(400, "Expected an integer 'priority'")
+                return 200, self.download_queue.set_priority(job.id, priority).to_dict()
+            if method == 'DELETE':
+                if job.state in FINISHED_STATES:
+                    raise HTTPError(409, f"Job #{job.id} already {job.state}")
+                self.download_queue.cancel(job.id)
+                return 202, job.to_dict()
+            raise HTTPError(405, f"{method} not allowed on {path}")
+
+        if path == '/files' and method == 'GET':
+            return 200, self.list_files()
+
+        if path == '/stats' and method == 'GET':
+            return 200, self.stats()
+
+        if path == '/metrics' and method == 'GET':
+            info_cache = self.download_queue.converter.info_cache
+            return 200, prometheus_text(self.download_queue.jobs(), info_cache.stats() if info_cache else None)
+
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    def parse_json(self, body):
+        try:
+            data = json.loads(body.decode('utf-8') or '{}')
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Expected a JSON object")
+        return data
+
+    @staticmethod
+    def parse_priority(data):
+        """The integer 'priority' of a request body, or None"""
+        priority = data.get('priority') if isinstance(data, dict) else None
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            return None
+        return priority
+
+    def find_job(self, job_id):
+        try:
+            job = self.download_queue.get(int(job_id))
+        except ValueError:
+            job = None
+        if job is None:
+            raise HTTPError(404, f"No job {job_id}")
+        return job
+
+    def submit_jobs(self, data):
+        urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+        if not isinstance(urls, list) or not urls:
+            raise HTTPError(400, "Expected a non-empty 'urls' list")
+        canonical = [canonical_url(url) if isinstance(url, str) else None for url in urls]
+        invalid = [url for url, found in zip(urls, canonical) if found is None]
+        if invalid:
+            raise HTTPError(400, f"Invalid YouTube URL(s): {invalid}")
+
+        codec = data.get('codec')
+        if codec is not None and codec not in OUTPUT_CODECS:
+            raise HTTPError(400, f"'codec' must be one of: {', '.join(OUTPUT_CODECS)}")
+        quality = data.get('quality')
+        if quality is not None and (not isinstance(quality, int) or isinstance(quality, bool)
+                                    or not MIN_QUALITY <= quality <= MAX_QUALITY):
+            raise HTTPError(400, f"'quality' must be a bitrate from {MIN_QUALITY} to {MAX_QUALITY} kbps")
+        split_chapters = data.get('split_chapters')
+        if split_chapters is not None and not isinstance(split_chapters, bool):
+            raise HTTPError(400, "'split_chapters' must be true or false")
+        priority = self.parse_priority(data) if 'priority' in data else 0
+        if priority is None:
+            raise HTTPError(400, "'priority' must be an integer")
+
+        save_path = os.path.abspath(os.path.expanduser(data.get('save_path') or self.save_path))
+        jobs = [self.download_queue.submit(url, save_path, codec=codec, quality=quality,
+                                           split_chapters=split_chapters, priority=priority)
+                for url in canonical]
+        return {'jobs': [job.to_dict() for job in jobs]}
+
+    def list_jobs(self, state=None):
+        jobs = self.download_queue.jobs()
+        if state:
+            jobs = [job for job in jobs if job.state == state]
+        return {'jobs': [job.to_dict() for job in jobs], 'counts': self.download_queue.counts()}
+
+    def stats(self):
+        info_cache = self.download_queue.converter.info_cache
+        breaker = self.download_queue.converter.breaker
+        return {
+            'counts': self.download_queue.counts(),
+            'info_cache': info_cache.stats() if info_cache else None,
+            'sessions': self.download_queue.converter.sessions.stats(),
+            'throttled_sites': breaker.open_sites() if breaker else {},
+            'metrics': snapshot(self.download_queue.jobs()),
+        }
+
+    def list_files(self):
+        files = []
+        for job in self.download_queue.jobs():
+            if job.state == JOB_DONE and job.output_path and os.path.exists(job.output_path):
+                files.append({
+                    'job': job.id,
+                    'url': job.url,
+                    'title': job.title,
+                    'cached': job.cached,
+                    'conversion': job.conversion,
+                    'path': job.output_path,
+                    'size': os.path.getsize(job.output_path),
+                })
+        return {'files': files}
+
+
+def main(argv=None):
+    settings = read_settings()
+    parser = argparse.ArgumentParser(description="Serve the MP3 converter over a local HTTP API.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to bind (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to bind (default: {DEFAULT_PORT})")
+    parser.add_argument('-o', '--output', default=settings.get('save_location') or default_save_path(),
+                        metavar='DIR', help="default save location for submitted jobs")
+    parser.add_argument('-j', '--workers', type=int, default=settings.get('max_workers') or DEFAULT_MAX_WORKERS,
+                        metavar='N', help="number of conversions to run at the same time")
+    parser.add_argument('-q', '--quiet', action='store_true', help="do not print per-job progress")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="always download again, even if a video was already converted")
+    parser.add_argument('-f', '--format', dest='codec', choices=OUTPUT_CODECS,
+                        default=settings.get('codec') or DEFAULT_CODEC,
+                        help="output format; m4a/opus remux without re-encoding when the source allows it")
+    parser.add_argument('-b', '--quality', type=int, default=int(settings.get('quality') or DEFAULT_QUALITY),
+                        metavar='KBPS', help=f"output bitrate when transcoding (default: {DEFAULT_QUALITY})")
+    parser.add_argument('--stream', action='store_true', default=bool(settings.get('streaming')),
+                        help="encode while downloading instead of after the download finishes")
+    parser.add_argument('--split-chapters', action='store_true', default=bool(settings.get('split_chapters')),
+                        help="save videos that have chapters as one file per chapter, in a folder per video")
+    parser.add_argument('--segment-encode', action='store_true', default=bool(settings.get('segment_encoding')),
+                        help="encode long MP3s as segments on every core and join them gaplessly")
+    parser.add_argument('--shortest-first', action='store_true', default=bool(settings.get('shortest_first')),
+                        help="run short videos ahead of long ones queued at about the same time")
+    parser.add_argument('--info-cache-ttl', type=int, default=DEFAULT_TTL, metavar='SECONDS',
+                        help=f"reuse resolved video information for this long; 0 disables (default: {DEFAULT_TTL})")
+    parser.add_argument('--limit-rate', type=parse_size, default=settings.get('bandwidth_limit'), metavar='RATE',
+                        help="total download bandwidth shared fairly by all jobs, e.g. 500K or 4M (bytes/s)")
+    parser.add_argument('--max-host-connections', type=int, default=DEFAULT_MAX_PER_HOST, metavar='N',
+                        help=f"connections open to one host at a time (default: {DEFAULT_MAX_PER_HOST})")
+    parser.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES, metavar='N',
+                        help=f"retries per job after network errors or throttling (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument('--concurrent-fragments', type=int,
+                        default=settings.get('concurrent_fragments') or DEFAULT_CONCURRENT_FRAGMENTS, metavar='N',
+                        help=f"DASH/HLS fragments fetched in parallel per job (default: {DEFAULT_CONCURRENT_FRAGMENTS})")
+    parser.add_argument('--http-chunk-size', type=parse_size,
+                        default=settings.get('http_chunk_size') or HTTP_CHUNK_SIZE, metavar='SIZE',
+                        help="size of each ranged HTTP request, e.g. 10M (default: 10M)")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="do not requeue jobs left unfinished when the server last stopped")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="also convert URLs from text files dropped into DIR")
+    parser.add_argument('--stub', action='store_true',
+                        help="use the offline stand-in extractor instead of yt-dlp (no network)")
+    args = parser.parse_args(argv)
+
+    ydl_class = transcoder = None
+    if args.stub:
+        from converter_stub import StubYoutubeDL, stub_transcode
+        ydl_class, transcoder = StubYoutubeDL, stub_transcode
+    else:
+        # Load yt-dlp while the server starts listening rather than on the first request
+        warm_up()
+
+    archive = None if args.no_archive else DownloadArchive()
+    info_cache = InfoCache(ttl=args.info_cache_ttl, disk_dir=INFO_CACHE_DIR) if args.info_cache_ttl > 0 else None
+    converter = Converter(quiet=args.quiet, ydl_class=ydl_class, transcoder=transcoder, archive=archive,
+                          info_cache=info_cache, streaming=args.stream,
+                          codec=args.codec, quality=args.quality, split_chapters=args.split_chapters,
+                          segment_encoding=args.segment_encode,
+                          governor=BandwidthGovernor(args.limit_rate) if args.limit_rate else None,
+                          host_limiter=HostLimiter(args.max_host_connections),
+                          breaker=HostBreaker(),
+                          concurrent_fragments=args.concurrent_fragments, http_chunk_size=args.http_chunk_size)
+    # Stub runs never touch the real journal
+    journal = None if args.stub else JobJournal()
+    download_queue = DownloadQueue(converter, max_workers=args.workers, journal=journal,
+                                   shortest_first=args.shortest_first, max_retries=args.retries)
+    if not args.no_resume:
+        resumed = download_queue.resume()
+        if resumed:
+            print(f"Resuming {len(resumed)} unfinished job(s)")
+    server = JobServer(download_queue, args.output)
+    if args.watch:
+        ingester = UrlIngester(download_queue, os.path.abspath(os.path.expanduser(args.output)))
+        threading.Thread(target=ingester.watch, args=(args.watch,), name='url-watch', daemon=True).start()
+        print(f"Watching {args.watch} for URL lists")
+
+    def ready(port):
+        print(f"Serving on http://{args.host}:{port}/ (save location: {args.output})")
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        print("Server stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
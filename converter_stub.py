@@ -0,0 +1,137 @@
+"""Offline stand-in for yt_dlp.YoutubeDL.
+
+Implements the small part of the YoutubeDL interface the engine uses. It writes
+synthetic audio bytes and calls progress hooks just like a real download, so the
+server and CLI plumbing can be exercised without any network access. The bytes
+are not decodable audio, so stub_transcode stands in for ffmpeg as well:
+
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode)
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+
+
+# Playlist URLs given to the stub expand into this many entries
+STUB_PLAYLIST_SIZE = 5
+
+
+def stub_video_id(url):
+    """Video ID from a watch/youtu.be URL, or a stable fake one"""
+    match = re.search(r'(?:v=|youtu\.be/|shorts/)([\w-]{11})', url)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:11]
+
+
+def stub_transcode(src, dest, codec, quality, ffmpeg_location=None, remux=False, start=None, duration=None,
+                   stop_path=None):
+    """Stand-in for converter_ffmpeg.transcode_file that copies the source instead of encoding it"""
+    shutil.copyfile(src, dest)
+    return dest
+
+
+class StubYoutubeDL:
+    # Size of every fake download and how fast it "arrives"
+    size = 1024 * 1024
+    chunk_size = 64 * 1024
+    chunk_delay = 0.01
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self._progress_hooks = list(self.params.get('progress_hooks') or [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def add_progress_hook(self, hook):
+        self._progress_hooks.append(hook)
+
+    def extract_info(self, url, download=True, process=True):
+        if self.params.get('extract_flat') and re.search(r'list=|/@|/channel/|/c/|/user/', url):
+            return self._playlist_info(url)
+
+        info = self._video_info(url)
+        if download:
+            self._download(info)
+        return info
+
+    def process_ie_result(self, info, download=True):
+        if download:
+            self._download(info)
+        return info
+
+    @staticmethod
+    def sanitize_info(info):
+        return dict(info)
+
+    def _playlist_info(self, url):
+        entries = []
+        for index in range(STUB_PLAYLIST_SIZE):
+            video_id = stub_video_id(f"{url}#{index}")
+            entries.append({
+                '_type': 'url',
+                'id': video_id,
+                'url': f"https://www.youtube.com/watch?v={video_id}",
+                'title': f"Stub video {video_id}",
+            })
+        return {'_type': 'playlist', 'id': stub_video_id(url), 'title': "Stub playlist", 'entries': entries}
+
+    def _video_info(self, url):
+        video_id = stub_video_id(url)
+        return {
+            'id': video_id,
+            'title': f"Stub video {video_id}",
+            'webpage_url': url,
+            'ext': 'webm',
+            'acodec': 'opus',
+            'duration': 60,
+            'chapters': [
+                {'start_time': 0.0, 'end_time': 20.0, 'title': "Intro"},
+                {'start_time': 20.0, 'end_time': 40.0, 'title': "Part 1/2: Theme"},
+                {'start_time': 40.0, 'end_time': 60.0, 'title': "Part 2/2: Outro"},
+            ],
+            'filesize': self.size,
+        }
+
+    def _hook(self, d):
+        for hook in self._progress_hooks:
+            hook(d)
+
+    def _download(self, info):
+        outtmpl = self.params.get('outtmpl') or '%(title)s.%(ext)s'
+        if isinstance(outtmpl, dict):
+            outtmpl = outtmpl.get('default')
+        filepath = outtmpl % info
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+
+        started = time.time()
+        downloaded = 0
+        with open(filepath + '.part', 'wb') as f:
+            while downloaded < self.size:
+                chunk = min(self.chunk_size, self.size - downloaded)
+                f.write(b'\0' * chunk)
+                downloaded += chunk
+                time.sleep(self.chunk_delay)
+                elapsed = max(time.time() - started, 1e-6)
+                speed = downloaded / elapsed
+                self._hook({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': self.size,
+                    'speed': speed,
+                    'eta': int((self.size - downloaded) / speed),
+                    'filename': filepath,
+                })
+        os.replace(filepath + '.part', filepath)
+        self._hook({'status': 'finished', 'downloaded_bytes': downloaded, 'total_bytes': self.size,
+                    'filename': filepath})
+        info['requested_downloads'] = [{'filepath': filepath}]
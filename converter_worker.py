@@ -0,0 +1,593 @@
+"""Worker mode: several processes, on one machine or many, sharing one durable job queue.
+
+    python converter_worker.py enqueue -i urls.txt -o /shared/music
+    python converter_worker.py work -j 4          # start as many of these as you like
+    python converter_worker.py status
+
+The queue is a SQLite database, ~/.youtube_mp3_converter/work_queue.db unless
+--db points elsewhere; put it on a shared filesystem to spread the work over
+several machines. It uses SQLite's rollback journal rather than WAL, because
+WAL relies on shared memory that network filesystems do not provide.
+
+A worker leases every item it takes and renews the lease with heartbeats while
+the job runs. When a worker crashes or loses the filesystem its leases run out
+and other workers pick the items up again. Leases assume the machines' clocks
+agree to within a few seconds.
+
+Finalizing is fenced: only the current lease holder may enter the finalizing
+state, and it records the output path it reserves before moving the file
+there. A worker that takes over a half-finalized item reuses that path (or
+finds the move already done), so every item ends up as exactly one file, or
+one folder of chapter files when chapters are split. Whether a video is split
+into chapters is chosen per item, when it is queued (enqueue --split-chapters).
+"""
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import contextlib
+
+from converter_archive import DownloadArchive
+from converter_engine import (
+    Converter, DownloadQueue, DEFAULT_CODEC, DEFAULT_MAX_WORKERS, DEFAULT_QUALITY, JOB_CANCELLED, JOB_DONE,
+    JOB_FAILED, FINISHED_STATES, JobCancelled, SETTINGS_DIR, default_save_path, extract_video_id, move_chapters,
+    move_output, read_settings, reserve_dir, reserve_path,
+)
+from converter_ffmpeg import ORIGINAL, OUTPUT_CODECS
+from converter_ingest import canonical_url, read_lines
+from converter_network import HostBreaker
+from converter_retry import DEFAULT_MAX_RETRIES, ERROR_UNAVAILABLE
+
+
+WORK_QUEUE_FILE = os.path.join(SETTINGS_DIR, "work_queue.db")
+
+# Work item states
+ITEM_QUEUED = "queued"
+ITEM_LEASED = "leased"
+ITEM_FINALIZING = "finalizing"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+ITEM_STATES = (ITEM_QUEUED, ITEM_LEASED, ITEM_FINALIZING, ITEM_DONE, ITEM_FAILED)
+
+# States in which a worker holds the item
+HELD_STATES = (ITEM_LEASED, ITEM_FINALIZING)
+
+# Seconds a lease lasts without a heartbeat; heartbeats come this many times per lease
+DEFAULT_LEASE_SECONDS = 60
+HEARTBEATS_PER_LEASE = 3
+
+# Tries per item, across all workers, before it is marked failed. Each try already
+# retries network errors itself, and a video that is unavailable fails on its first.
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before looking for new items again
+IDLE_POLL = 1.0
+
+# Seconds to wait for another process to release the database's write lock
+BUSY_TIMEOUT = 30
+
+# Seconds a stopping worker gives its running jobs to wind down
+SHUTDOWN_TIMEOUT = 10
+
+ITEM_COLUMNS = ('id', 'url', 'save_path', 'codec', 'quality', 'split_chapters', 'state', 'worker', 'lease_until',
+                'attempts', 'final_path', 'output_path', 'error')
+
+
+# Raised in a job whose work item now belongs to another worker
+class LeaseLost(JobCancelled):
+    pass
+
+
+def item_key(url, save_path, codec, quality, split_chapters=False):
+    """One work item per (video, encoding, chapter split, folder), like the engine's own duplicate check"""
+    folder = os.path.normcase(os.path.abspath(save_path))
+    encoding = ORIGINAL if codec == ORIGINAL else f"{codec}-{quality}"
+    if split_chapters:
+        encoding += "-chapters"
+    return '|'.join((extract_video_id(url) or url, encoding, folder))
+
+
+class WorkQueue:
+    def __init__(self, path=WORK_QUEUE_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode; every write opens its own BEGIN IMMEDIATE transaction
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    url TEXT NOT NULL,
+                    save_path TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    split_chapters INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    final_path TEXT,
+                    output_path TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS items_by_state ON items (state, lease_until)")
+            # Queues created before chapter splitting was chosen per item lack the column
+            columns = [row[1] for row in db.execute("PRAGMA table_info(items)")]
+            if 'split_chapters' not in columns:
+                db.execute("ALTER TABLE items ADD COLUMN split_chapters INTEGER NOT NULL DEFAULT 0")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def enqueue(self, url, save_path, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY, split_chapters=False):
+        """Add a job; returns False if it is already queued, running or done (failed ones are retried)"""
+        now = time.time()
+        save_path = os.path.abspath(save_path)
+        split_chapters = bool(split_chapters)
+        with self._transaction() as db:
+            cursor = db.execute(
+                """INSERT INTO items (key, url, save_path, codec, quality, split_chapters, state, created_at,
+                                      updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET state = excluded.state, attempts = 0, error = NULL,
+                                                  updated_at = excluded.updated_at
+                   WHERE items.state = ?""",
+                (item_key(url, save_path, codec, quality, split_chapters), url, save_path, codec, str(quality),
+                 int(split_chapters), ITEM_QUEUED, now, now, ITEM_FAILED),
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease the oldest waiting item, or one whose holder stopped renewing it; None if there is none"""
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    f"SELECT {', '.join(ITEM_COLUMNS)} FROM items "
+                    "WHERE state = ? OR (state IN (?, ?) AND lease_until < ?) ORDER BY id LIMIT 1",
+                    (ITEM_QUEUED, ITEM_LEASED, ITEM_FINALIZING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                item = dict(zip(ITEM_COLUMNS, row))
+                if item['attempts'] >= MAX_ATTEMPTS:
+                    # Its last worker died with it; do not hand it out forever
+                    db.execute("UPDATE items SET state = ?, worker = NULL, lease_until = NULL, updated_at = ?, "
+                               "error = COALESCE(error, ?) WHERE id = ?",
+                               (ITEM_FAILED, now, f"Gave up after {MAX_ATTEMPTS} attempts", item['id']))
+                    continue
+                db.execute("UPDATE items SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                           "updated_at = ? WHERE id = ?",
+                           (ITEM_LEASED, worker, now + lease_seconds, now, item['id']))
+                item.update(state=ITEM_LEASED, worker=worker, attempts=item['attempts'] + 1)
+                return item
+
+    def heartbeat(self, worker, item_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Renew the leases on item_ids; returns the ids this worker still holds"""
+        now = time.time()
+        held = set()
+        with self._transaction() as db:
+            for item_id in item_ids:
+                cursor = db.execute(
+                    "UPDATE items SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND state IN (?, ?)",
+                    (now + lease_seconds, now, item_id, worker) + HELD_STATES,
+                )
+                if cursor.rowcount:
+                    held.add(item_id)
+        return held
+
+    def begin_finalize(self, item_id, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Enter the finalizing state; returns the output path an earlier holder reserved, if any"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE items SET state = ?, lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? "
+                "AND state IN (?, ?)",
+                (ITEM_FINALIZING, now + lease_seconds, now, item_id, worker) + HELD_STATES,
+            )
+            if not cursor.rowcount:
+                raise LeaseLost(f"Work item {item_id} is no longer leased to {worker}")
+            return db.execute("SELECT final_path FROM items WHERE id = ?", (item_id,)).fetchone()[0]
+
+    def set_final_path(self, item_id, worker, path):
+        """Record the reserved output path before the file is moved there"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE items SET final_path = ?, updated_at = ? WHERE id = ? AND worker = ? AND state = ?",
+                (path, time.time(), item_id, worker, ITEM_FINALIZING),
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, item_id, worker, output_path=None):
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE items SET state = ?, output_path = ?, error = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND state IN (?, ?)",
+                (ITEM_DONE, output_path, time.time(), item_id, worker) + HELD_STATES,
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, item_id, worker, error, final=False):
+        """Give a failed item back for another try, or mark it failed if final or out of attempts"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, worker = NULL, "
+                "lease_until = NULL, updated_at = ? WHERE id = ? AND worker = ? AND state IN (?, ?)",
+                (1 if final else MAX_ATTEMPTS, ITEM_FAILED, ITEM_QUEUED, error, time.time(), item_id, worker)
+                + HELD_STATES,
+            )
+            return cursor.rowcount > 0
+
+    def release(self, item_id, worker):
+        """Hand an unfinished item back without counting the attempt (the worker is stopping)"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE items SET state = ?, attempts = MAX(attempts - 1, 0), worker = NULL, lease_until = NULL, "
+                "updated_at = ? WHERE id = ? AND worker = ? AND state IN (?, ?)",
+                (ITEM_QUEUED, time.time(), item_id, worker) + HELD_STATES,
+            )
+            return cursor.rowcount > 0
+
+    def retry_failed(self):
+        """Queue every failed item again; returns how many"""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE items SET state = ?, attempts = 0, error = NULL, updated_at = ? "
+                                "WHERE state = ?", (ITEM_QUEUED, time.time(), ITEM_FAILED))
+            return cursor.rowcount
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        counts = {state: 0 for state in ITEM_STATES}
+        counts.update(rows)
+        return counts
+
+    def outstanding(self):
+        """Items not yet done or failed"""
+        counts = self.counts()
+        return counts[ITEM_QUEUED] + counts[ITEM_LEASED] + counts[ITEM_FINALIZING]
+
+    def items(self, state=None, limit=100):
+        query = f"SELECT {', '.join(ITEM_COLUMNS)} FROM items"
+        params = ()
+        if state:
+            query += " WHERE state = ?"
+            params = (state,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id LIMIT ?", params + (limit,)).fetchall()
+        return [dict(zip(ITEM_COLUMNS, row)) for row in rows]
+
+
+# Converter whose finalize step is fenced by the job's work item lease
+class LeasedConverter(Converter):
+    def __init__(self, worker, **kwargs):
+        super().__init__(**kwargs)
+        self.worker = worker
+
+    def save_output(self, work, filename):
+        item = self.worker.item_for(work.job)
+        if item is None:
+            return super().save_output(work, filename)
+        return self.worker.finalize_item(item, work, filename)
+
+    def save_chapters(self, work, folder_name):
+        item = self.worker.item_for(work.job)
+        if item is None:
+            return super().save_chapters(work, folder_name)
+        return self.worker.finalize_item(item, work, folder_name, chapters=True)
+
+
+# Playlists and channels are expanded into the shared queue, so their entries spread over all workers
+class WorkerDownloadQueue(DownloadQueue):
+    def __init__(self, worker, converter, **kwargs):
+        super().__init__(converter, **kwargs)
+        self.worker = worker
+
+    def _fan_out(self, job):
+        self.converter.log(f"[#{job.id}] Expanding playlist into the work queue: {job.url}")
+        added = total = 0
+        for entry_url in self.converter.expand_collection(job.url):
+            job.check_cancelled()
+            total += 1
+            if self.worker.queue.enqueue(entry_url, job.save_path, job.codec, job.quality, job.split_chapters):
+                added += 1
+        if not total:
+            raise Exception(f"No videos found in playlist: {job.url}")
+        self.converter.log(f"[#{job.id}] Queued {added} of {total} playlist entries")
+
+
+class Worker:
+    def __init__(self, work_queue, max_workers=DEFAULT_MAX_WORKERS, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 worker_id=None, max_retries=DEFAULT_MAX_RETRIES, **converter_options):
+        self.queue = work_queue
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        # One extra item is claimed so the next job's extraction overlaps the current downloads
+        self.capacity = max_workers + 1
+        self.converter = LeasedConverter(self, **converter_options)
+        self.download_queue = WorkerDownloadQueue(self, self.converter, max_workers=max_workers,
+                                                  on_change=self.on_job_changed, max_retries=max_retries)
+        # Running jobs by job id, with the work items each one settles. Items for the same
+        # output (e.g. a video queued again under another URL) share one job.
+        self._items = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.completed = 0
+        self.failed = 0
+
+    def log(self, msg):
+        self.converter.log(f"[worker {self.worker_id}] {msg}")
+
+    def stop(self):
+        self._stop.set()
+
+    def item_for(self, job):
+        """The work item whose lease fences the job's finalize step"""
+        with self._lock:
+            items = self._items.get(job.id)
+            return items[0] if items else None
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._items)
+
+    def run(self, exit_when_empty=False):
+        """Claim and convert items until stop() is called (or, with exit_when_empty, the queue is drained)"""
+        self.log("Started")
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='worker-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                claimed = self._fill()
+                if exit_when_empty and not claimed and not self.in_flight() and not self.queue.outstanding():
+                    break
+                self._stop.wait(0.05 if claimed else IDLE_POLL)
+        finally:
+            self._shutdown()
+            heartbeat.join()
+        self.log(f"Stopped ({self.completed} done, {self.failed} failed)")
+
+    def _fill(self):
+        """Claim items until every slot is busy; returns how many were claimed"""
+        claimed = 0
+        while self.in_flight() < self.capacity and not self._stop.is_set():
+            item = self.queue.claim(self.worker_id, self.lease_seconds)
+            if item is None:
+                break
+            claimed += 1
+            if self._already_finalized(item):
+                continue
+            job = self.download_queue.submit(item['url'], item['save_path'], codec=item['codec'],
+                                             quality=item['quality'], split_chapters=bool(item['split_chapters']))
+            with self._lock:
+                self._items.setdefault(job.id, []).append(item)
+                self._jobs[job.id] = job
+            # The job may have finished (or been a duplicate of a finished one) before it was registered
+            if job.state in FINISHED_STATES:
+                self.on_job_changed(job)
+        return claimed
+
+    def _already_finalized(self, item):
+        """Complete an item whose previous holder moved the output into place but died before recording it"""
+        path = item['final_path']
+        # A chapter folder may be half filled, so a split item is always converted again
+        if not path or not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return False
+        if self.queue.complete(item['id'], self.worker_id, path):
+            self.log(f"Item {item['id']} was already saved to {path}")
+            self.completed += 1
+        return True
+
+    def finalize_item(self, item, work, filename, chapters=False):
+        """Move a job's output (or its folder of chapters) into place, exactly once per work item"""
+        final_path = self.queue.begin_finalize(item['id'], self.worker_id, self.lease_seconds)
+        if not chapters and final_path and os.path.isfile(final_path) and os.path.getsize(final_path) > 0:
+            # An earlier holder finished the move but not the bookkeeping
+            os.remove(work.encoded_path)
+            return final_path
+        if not final_path or not os.path.exists(final_path):
+            final_path = (reserve_dir if chapters else reserve_path)(work.job.save_path, filename)
+            if not self.queue.set_final_path(item['id'], self.worker_id, final_path):
+                (os.rmdir if chapters else os.remove)(final_path)
+                raise LeaseLost(f"Work item {item['id']} was taken over before it was saved")
+        if chapters:
+            # Same-named files left by an earlier holder are replaced, never duplicated
+            move_chapters(work.chapter_outputs, final_path)
+        else:
+            move_output(work.encoded_path, final_path)
+        return final_path
+
+    def on_job_changed(self, job):
+        """Record a finished job in the work queue (any thread)"""
+        if job.state not in FINISHED_STATES:
+            return
+        with self._lock:
+            items = self._items.pop(job.id, None)
+            self._jobs.pop(job.id, None)
+        if items is None:
+            return
+        for item in items:
+            try:
+                if job.state == JOB_DONE:
+                    if self.queue.complete(item['id'], self.worker_id, job.output_path):
+                        self.completed += 1
+                elif job.state == JOB_FAILED:
+                    self.queue.fail(item['id'], self.worker_id, job.error,
+                                    final=job.error_class == ERROR_UNAVAILABLE)
+                    self.failed += 1
+                elif job.state == JOB_CANCELLED:
+                    # Stopping, or the lease was lost; the update is a no-op in the second case
+                    self.queue.release(item['id'], self.worker_id)
+            except Exception as e:
+                self.log(f"Error updating work item {item['id']}: {e}")
+        self.download_queue.forget(job)
+
+    def _heartbeat_loop(self):
+        interval = self.lease_seconds / HEARTBEATS_PER_LEASE
+        while not self._stop.wait(interval):
+            with self._lock:
+                held = {item['id']: job_id for job_id, items in self._items.items() for item in items}
+            if not held:
+                continue
+            try:
+                renewed = self.queue.heartbeat(self.worker_id, list(held), self.lease_seconds)
+            except Exception as e:
+                # Another try comes before the lease runs out
+                self.log(f"Heartbeat failed: {e}")
+                continue
+            lost = [job_id for item_id, job_id in held.items() if item_id not in renewed]
+            for job_id in dict.fromkeys(lost):
+                self._drop_lost_items(job_id, renewed)
+
+    def _drop_lost_items(self, job_id, renewed):
+        """Forget a job's items that another worker took over; the job is cancelled once it holds none"""
+        with self._lock:
+            items = self._items.get(job_id)
+            if not items:
+                return
+            lost = [item['id'] for item in items if item['id'] not in renewed]
+            items[:] = [item for item in items if item['id'] in renewed]
+            cancel = not items
+        for item_id in lost:
+            if cancel:
+                self.log(f"Lost the lease on item {item_id}; cancelling job #{job_id}")
+            else:
+                self.log(f"Lost the lease on item {item_id}; job #{job_id} carries on for its other items")
+        if cancel:
+            self.download_queue.cancel(job_id)
+
+    def _shutdown(self):
+        self._stop.set()
+        with self._lock:
+            running = list(self._jobs)
+        for job_id in running:
+            self.download_queue.cancel(job_id)
+        if running and not self.download_queue.wait(SHUTDOWN_TIMEOUT):
+            self.log("Some jobs did not stop in time; their leases will expire")
+        self.download_queue.close()
+
+
+def build_parser(settings):
+    parser = argparse.ArgumentParser(description="Share conversions between worker processes through one queue.")
+    parser.add_argument('--db', default=WORK_QUEUE_FILE, metavar='FILE',
+                        help="work queue database; put it on a shared filesystem for several machines")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = commands.add_parser('enqueue', help="add URLs to the work queue")
+    enqueue.add_argument('urls', nargs='*', metavar='URL')
+    enqueue.add_argument('-i', '--input', action='append', default=[], metavar='FILE',
+                         help="read URLs from FILE, one per line ('-' for stdin); may be repeated")
+    enqueue.add_argument('-o', '--output', default=settings.get('save_location') or default_save_path(),
+                         metavar='DIR', help="save location; must be the same path on every worker machine")
+    enqueue.add_argument('-f', '--format', dest='codec', choices=OUTPUT_CODECS,
+                         default=settings.get('codec') or DEFAULT_CODEC)
+    enqueue.add_argument('-b', '--quality', type=int, default=int(settings.get('quality') or DEFAULT_QUALITY),
+                         metavar='KBPS')
+    enqueue.add_argument('--split-chapters', action='store_true', default=bool(settings.get('split_chapters')),
+                         help="save videos that have chapters as one file per chapter")
+
+    work = commands.add_parser('work', help="claim and convert queued URLs until interrupted")
+    work.add_argument('-j', '--workers', type=int, default=settings.get('max_workers') or DEFAULT_MAX_WORKERS,
+                      metavar='N', help="conversions this process runs at the same time")
+    work.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS, metavar='SECONDS',
+                      help=f"how long a silent worker keeps its items (default: {DEFAULT_LEASE_SECONDS})")
+    work.add_argument('--worker-id', metavar='NAME', help="name in the queue (default: host:pid)")
+    work.add_argument('--exit-when-empty', action='store_true',
+                      help="stop once every item is done or failed instead of waiting for more")
+    work.add_argument('--stream', action='store_true', default=bool(settings.get('streaming')),
+                      help="encode while downloading")
+    work.add_argument('--segment-encode', action='store_true', default=bool(settings.get('segment_encoding')),
+                      help="encode long MP3s as segments on every core")
+    work.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES, metavar='N',
+                      help=f"retries per try after network errors or throttling (default: {DEFAULT_MAX_RETRIES})")
+    work.add_argument('--no-archive', action='store_true', help="do not reuse or record finished outputs")
+    work.add_argument('--stub', action='store_true', help="use the offline stand-ins for yt-dlp and ffmpeg (no network)")
+    work.add_argument('-q', '--quiet', action='store_true')
+
+    status = commands.add_parser('status', help="show how many items are in each state")
+    status.add_argument('--list', choices=ITEM_STATES, metavar='STATE', help="also list items in STATE")
+
+    commands.add_parser('retry', help="queue failed items again")
+    return parser
+
+
+def main(argv=None):
+    settings = read_settings()
+    parser = build_parser(settings)
+    args = parser.parse_args(argv)
+    work_queue = WorkQueue(args.db)
+
+    if args.command == 'enqueue':
+        save_path = os.path.abspath(os.path.expanduser(args.output))
+        added = skipped = invalid = 0
+        sources = [args.urls] + [read_lines(path) for path in args.input]
+        try:
+            for urls in sources:
+                for url in urls:
+                    canonical = canonical_url(url)
+                    if canonical is None:
+                        print(f"Error: Invalid YouTube URL: {url}", file=sys.stderr)
+                        invalid += 1
+                    elif work_queue.enqueue(canonical, save_path, args.codec, str(args.quality),
+                                            args.split_chapters):
+                        added += 1
+                    else:
+                        skipped += 1
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        print(f"Queued {added} item(s); {skipped} already queued or done, {invalid} invalid")
+        return 1 if invalid else 0
+
+    if args.command == 'status':
+        counts = work_queue.counts()
+        print(", ".join(f"{counts[state]} {state}" for state in ITEM_STATES))
+        if args.list:
+            for item in work_queue.items(args.list, limit=1000):
+                detail = item['error'] or item['output_path'] or item['worker'] or ''
+                print(f"  {item['id']:>6} {item['url']}  {detail}")
+        return 0
+
+    if args.command == 'retry':
+        print(f"Queued {work_queue.retry_failed()} failed item(s) again")
+        return 0
+
+    ydl_class = transcoder = None
+    if args.stub:
+        from converter_stub import StubYoutubeDL, stub_transcode
+        ydl_class, transcoder = StubYoutubeDL, stub_transcode
+    worker = Worker(work_queue, max_workers=max(1, args.workers), lease_seconds=args.lease,
+                    worker_id=args.worker_id, max_retries=args.retries, quiet=args.quiet, ydl_class=ydl_class,
+                    transcoder=transcoder, streaming=args.stream, breaker=HostBreaker(),
+                    segment_encoding=args.segment_encode,
+                    archive=None if args.no_archive else DownloadArchive())
+    try:
+        worker.run(exit_when_empty=args.exit_when_empty)
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""Shared setup: import the flat modules from the repository root, and keep
+every settings, journal, archive and cache file out of the real home folder."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# SETTINGS_DIR is computed when converter_engine is imported, so this must run first
+os.environ['HOME'] = tempfile.mkdtemp(prefix='converter-tests-home-')
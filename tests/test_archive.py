@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+from converter_archive import PLACED_EXISTING, PLACED_HARDLINK, PLACED_REFLINK, DownloadArchive
+from converter_engine import Converter, DownloadQueue, JOB_DONE
+from converter_stub import StubYoutubeDL, stub_transcode
+
+SETTINGS_KEY = 'mp3-192'
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = DownloadArchive(str(tmp_path / 'archive.db'), str(tmp_path / 'store'))
+    yield archive
+    archive.close()
+
+
+def make_output(folder, name, data=b'ID3 audio data'):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def store_files(tmp_path):
+    return [name for _, _, names in os.walk(tmp_path / 'store') for name in names]
+
+
+def test_lookup_prefers_the_output_already_in_the_folder(archive, tmp_path):
+    first = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    second = make_output(str(tmp_path / 'b'), 'Song.mp3')
+    archive.record('video00001', SETTINGS_KEY, first, 'Song')
+    archive.record('video00001', SETTINGS_KEY, second, 'Song')
+
+    entry = archive.lookup('video00001', SETTINGS_KEY, str(tmp_path / 'b'))
+    assert entry['path'] == second and entry['title'] == 'Song'
+    assert archive.place(entry, str(tmp_path / 'b')) == (second, PLACED_EXISTING)
+    assert archive.lookup('video00001', 'mp3-320') is None
+
+
+def test_placing_in_another_folder_links_instead_of_copying(archive, tmp_path):
+    output = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    archive.record('video00001', SETTINGS_KEY, output, 'Song')
+
+    entry = archive.lookup('video00001', SETTINGS_KEY, str(tmp_path / 'b'))
+    os.makedirs(tmp_path / 'b')
+    path, placed = archive.place(entry, str(tmp_path / 'b'))
+    assert path == str(tmp_path / 'b' / 'Song.mp3')
+    assert placed in (PLACED_REFLINK, PLACED_HARDLINK)
+    with open(path, 'rb') as f:
+        assert f.read() == b'ID3 audio data'
+
+
+def test_placing_in_another_folder_keeps_existing_files(archive, tmp_path):
+    output = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    taken = make_output(str(tmp_path / 'b'), 'Song.mp3', b'another song')
+    archive.record('video00001', SETTINGS_KEY, output, 'Song')
+
+    path, _ = archive.place(archive.lookup('video00001', SETTINGS_KEY), str(tmp_path / 'b'))
+    assert path == str(tmp_path / 'b' / 'Song_1.mp3')
+    with open(path, 'rb') as f:
+        assert f.read() == b'ID3 audio data'
+    with open(taken, 'rb') as f:
+        assert f.read() == b'another song'
+
+
+def test_deleted_output_is_restored_from_the_store(archive, tmp_path):
+    output = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    archive.record('video00001', SETTINGS_KEY, output, 'Song')
+    os.remove(output)
+
+    entry = archive.lookup('video00001', SETTINGS_KEY, str(tmp_path / 'a'))
+    assert entry is not None and entry['path'] == entry['blob']
+    path, _ = archive.place(entry, str(tmp_path / 'a'))
+    assert path == output
+    with open(path, 'rb') as f:
+        assert f.read() == b'ID3 audio data'
+
+
+def test_changed_output_is_not_reused(archive, tmp_path):
+    output = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    archive.record('video00001', SETTINGS_KEY, output, 'Song')
+    # Editing a hardlinked output in place changes the stored copy too, so neither may be used
+    with open(output, 'ab') as f:
+        f.write(b' edited')
+
+    assert archive.lookup('video00001', SETTINGS_KEY, str(tmp_path / 'a')) is None
+
+
+def test_store_keeps_one_copy_per_content(archive, tmp_path):
+    first = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    second = make_output(str(tmp_path / 'b'), 'Same song.mp3')
+    other = make_output(str(tmp_path / 'b'), 'Other.mp3', b'other audio')
+    assert archive.record('video00001', SETTINGS_KEY, first) == archive.record('video00002', SETTINGS_KEY, second)
+    archive.record('video00003', SETTINGS_KEY, other)
+
+    assert len(store_files(tmp_path)) == 2
+
+
+def test_prune_drops_stored_copies_no_output_shares(archive, tmp_path):
+    kept = make_output(str(tmp_path / 'a'), 'Kept.mp3')
+    deleted = make_output(str(tmp_path / 'a'), 'Deleted.mp3', b'deleted audio')
+    archive.record('video00001', SETTINGS_KEY, kept)
+    archive.record('video00002', SETTINGS_KEY, deleted)
+    os.remove(deleted)
+
+    archive.prune_store(0)
+    assert archive.lookup('video00002', SETTINGS_KEY) is None
+    assert archive.lookup('video00001', SETTINGS_KEY)['blob'] is not None
+
+
+def test_verify_notices_changed_content(archive, tmp_path):
+    output = make_output(str(tmp_path / 'a'), 'Song.mp3')
+    archive.record('video00001', SETTINGS_KEY, output)
+    entry = archive.lookup('video00001', SETTINGS_KEY)
+    assert archive.verify(entry)
+    with open(output, 'r+b') as f:
+        f.write(b'XXX')
+    assert not archive.verify(entry)
+
+
+def test_repeat_conversion_reuses_the_archived_output(archive, tmp_path):
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode, quiet=True, archive=archive)
+    download_queue = DownloadQueue(converter)
+    url = 'https://www.youtube.com/watch?v=archived001'
+    try:
+        first = download_queue.submit(url, str(tmp_path / 'a'))
+        assert download_queue.wait(30)
+        second = download_queue.submit(url, str(tmp_path / 'b'))
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+
+    assert first.state == second.state == JOB_DONE
+    assert not first.cached and second.cached
+    assert os.path.dirname(second.output_path) == str(tmp_path / 'b')
+    assert os.path.getsize(second.output_path) == StubYoutubeDL.size
+
+
+def test_archive_only_reuses_outputs_in_the_same_format(archive, tmp_path):
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode, quiet=True, archive=archive)
+    download_queue = DownloadQueue(converter)
+    url = 'https://www.youtube.com/watch?v=archived002'
+    try:
+        mp3 = download_queue.submit(url, str(tmp_path / 'a'))
+        assert download_queue.wait(30)
+        m4a = download_queue.submit(url, str(tmp_path / 'b'), codec='m4a')
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+
+    assert mp3.state == m4a.state == JOB_DONE
+    assert not m4a.cached and m4a.output_path.endswith('.m4a')
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from converter_cache import InfoCache
+
+
+# Stands in for time.time so entries can be aged without sleeping
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+def info(video_id):
+    return {'id': video_id, 'title': f"Video {video_id}", 'formats': [{'url': f"https://media/{video_id}"}]}
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = InfoCache(ttl=60)
+    cache.put('video00001', info('video00001'))
+    clock.now += 59
+    assert cache.get('video00001') == info('video00001')
+    clock.now += 2
+    assert cache.get('video00001') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = InfoCache(max_entries=2)
+    cache.put('video00001', info('video00001'))
+    cache.put('video00002', info('video00002'))
+    # Reading the first entry makes the second the least recently used
+    cache.get('video00001')
+    cache.put('video00003', info('video00003'))
+
+    assert cache.get('video00002') is None
+    assert cache.get('video00001') is not None and cache.get('video00003') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cached_info_cannot_be_changed_by_callers(clock):
+    cache = InfoCache()
+    original = info('video00001')
+    cache.put('video00001', original)
+    original['title'] = "Changed"
+    cache.get('video00001')['formats'].clear()
+    assert cache.get('video00001') == info('video00001')
+
+
+def test_disk_tier_is_shared_and_expires(clock, tmp_path):
+    InfoCache(ttl=60, disk_dir=str(tmp_path)).put('video00001', info('video00001'))
+
+    clock.now += 30
+    cache = InfoCache(ttl=60, disk_dir=str(tmp_path))
+    assert cache.get('video00001') == info('video00001')
+    assert cache.stats()['disk_hits'] == 1
+
+    clock.now += 31
+    assert InfoCache(ttl=60, disk_dir=str(tmp_path)).get('video00001') is None
+
+
+def test_invalidate_drops_both_tiers(clock, tmp_path):
+    cache = InfoCache(disk_dir=str(tmp_path))
+    cache.put('video00001', info('video00001'))
+    cache.invalidate('video00001')
+    assert cache.get('video00001') is None
+    assert InfoCache(disk_dir=str(tmp_path)).get('video00001') is None
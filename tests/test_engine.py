@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+import converter_retry
+from converter_engine import Converter, DownloadQueue, JOB_CANCELLED, JOB_DONE, JOB_RUNNING, JobMetrics
+from converter_logging import LogSink, SOURCE_ENGINE
+from converter_stub import StubYoutubeDL, stub_transcode, stub_video_id
+
+BLOCKER_URL = 'https://www.youtube.com/watch?v=blocker0001'
+
+
+# Holds the first download until released, and records the order the others start in
+class GatedYoutubeDL(StubYoutubeDL):
+    gate = threading.Event()
+    order = []
+    durations = {}
+
+    def _video_info(self, url):
+        info = super()._video_info(url)
+        info['duration'] = self.durations.get(info['id'], info['duration'])
+        return info
+
+    def process_ie_result(self, info, download=True):
+        if info['id'] == stub_video_id(BLOCKER_URL):
+            self.gate.wait(30)
+        else:
+            self.order.append(info['id'])
+        return super().process_ie_result(info, download)
+
+
+# Fails the first download of every video half way through with a dropped connection
+class FlakyYoutubeDL(StubYoutubeDL):
+    failed = set()
+    lock = threading.Lock()
+
+    def process_ie_result(self, info, download=True):
+        with self.lock:
+            first = info['id'] not in self.failed
+            self.failed.add(info['id'])
+        if first:
+            for hook in self._progress_hooks:
+                hook({'status': 'downloading', 'downloaded_bytes': self.size // 2, 'total_bytes': self.size})
+            raise ConnectionResetError(104, "Connection reset by peer")
+        return super().process_ie_result(info, download)
+
+
+def slow_transcode(src, dest, codec, quality, ffmpeg_location=None, remux=False, start=None, duration=None,
+                   stop_path=None):
+    """An encode that only ends when the job asks it to stop"""
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if stop_path and os.path.exists(stop_path):
+            raise InterruptedError("Encode stopped")
+        time.sleep(0.02)
+    return stub_transcode(src, dest, codec, quality)
+
+
+@pytest.fixture
+def gated():
+    GatedYoutubeDL.gate.clear()
+    GatedYoutubeDL.order = []
+    GatedYoutubeDL.durations = {}
+    yield GatedYoutubeDL
+    GatedYoutubeDL.gate.set()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def scratch_files(folder):
+    return [name for name in os.listdir(folder) if name.startswith('_temp_youtube_dl_')]
+
+
+def run_behind_blocker(tmp_path, gated, submissions, shortest_first=False):
+    """Queue submissions (url, priority) while one download holds the only fetch worker"""
+    converter = Converter(ydl_class=gated, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, max_workers=1, encode_workers=1, shortest_first=shortest_first)
+    try:
+        download_queue.submit(BLOCKER_URL, str(tmp_path))
+        jobs = [download_queue.submit(url, str(tmp_path), priority=priority) for url, priority in submissions]
+        wait_for(lambda: download_queue.stage_sizes()['fetch'] == len(jobs))
+        gated.gate.set()
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+    assert all(job.state == JOB_DONE for job in jobs)
+    return [stub_video_id(url) for url, _ in submissions]
+
+
+def test_log_without_a_sink_prints_info_and_up(capsys):
+    Converter().log("Progress: 50.0%", logging.DEBUG)
+    Converter().log("Downloading video")
+    Converter(verbose=True).log("Download speed: 1.00 MB/s", logging.DEBUG)
+    Converter(quiet=True).log("Downloading video")
+    assert capsys.readouterr().out == "Downloading video\nDownload speed: 1.00 MB/s\n"
+
+
+def test_log_goes_to_the_sink_under_the_engine_source(capsys):
+    sink = LogSink(levels={SOURCE_ENGINE: logging.DEBUG})
+    Converter(log_sink=sink).log("Progress: 50.0%", logging.DEBUG)
+    assert capsys.readouterr().out == ""
+    assert [line for line in sink.drain() if "Progress: 50.0%" in line]
+
+
+def test_record_progress_counts_downloader_restarts():
+    metrics = JobMetrics()
+    metrics.record_progress({'status': 'downloading', 'downloaded_bytes': 500})
+    metrics.record_progress({'status': 'downloading', 'downloaded_bytes': 100})
+    assert metrics.retries == 1
+
+
+def test_queue_retry_is_counted_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(converter_retry, 'RETRY_BASE_DELAY', 0.05)
+    converter = Converter(ydl_class=FlakyYoutubeDL, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, encode_workers=1)
+    try:
+        job = download_queue.submit('https://www.youtube.com/watch?v=flakyvideo1', str(tmp_path))
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+    assert job.state == JOB_DONE, job.error
+    assert job.attempts == 2
+    assert job.metrics.retries == 1
+    assert job.metrics.bytes_downloaded == StubYoutubeDL.size
+
+
+def test_higher_priority_runs_first(tmp_path, gated):
+    low, high = run_behind_blocker(tmp_path, gated, [
+        ('https://www.youtube.com/watch?v=lowpriority', 0),
+        ('https://www.youtube.com/watch?v=highpriorit', 5),
+    ])
+    assert gated.order == [high, low]
+
+
+def test_equal_priorities_run_the_shorter_job_first(tmp_path, gated):
+    long_url, short_url = 'https://www.youtube.com/watch?v=longvideo01', 'https://www.youtube.com/watch?v=shortvideo1'
+    gated.durations = {stub_video_id(long_url): 3600, stub_video_id(short_url): 30}
+    submissions = [(long_url, 0), (short_url, 0)]
+    long_id, short_id = run_behind_blocker(tmp_path, gated, submissions, shortest_first=True)
+    assert gated.order == [short_id, long_id]
+
+    # Without shortest_first, arrival order decides
+    gated.order = []
+    run_behind_blocker(tmp_path / 'fifo', gated, submissions)
+    assert gated.order == [long_id, short_id]
+
+
+def test_cancelling_a_queued_job(tmp_path, gated):
+    converter = Converter(ydl_class=gated, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, max_workers=1, encode_workers=1)
+    try:
+        download_queue.submit(BLOCKER_URL, str(tmp_path))
+        job = download_queue.submit('https://www.youtube.com/watch?v=cancelled01', str(tmp_path))
+        wait_for(lambda: download_queue.stage_sizes()['fetch'] == 1)
+        download_queue.cancel(job.id)
+        # The job ends without waiting for the worker it was queued for
+        wait_for(lambda: job.state == JOB_CANCELLED, timeout=2)
+        gated.gate.set()
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+    assert stub_video_id(job.url) not in gated.order
+    assert scratch_files(tmp_path) == []
+
+
+@pytest.mark.parametrize('ydl_class, transcoder', [
+    # Cancelled while downloading
+    (type('SlowYoutubeDL', (StubYoutubeDL,), {'chunk_delay': 0.2}), stub_transcode),
+    # Cancelled while encoding in the process pool
+    (StubYoutubeDL, slow_transcode),
+])
+def test_cancelling_a_running_job(tmp_path, ydl_class, transcoder):
+    converter = Converter(ydl_class=ydl_class, transcoder=transcoder, quiet=True)
+    download_queue = DownloadQueue(converter, encode_workers=1)
+    try:
+        job = download_queue.submit('https://www.youtube.com/watch?v=runningjob1', str(tmp_path))
+        if transcoder is slow_transcode:
+            wait_for(lambda: job.metrics.bytes_downloaded == StubYoutubeDL.size and job.state == JOB_RUNNING)
+        else:
+            wait_for(lambda: job.metrics.bytes_downloaded > 0)
+        time.sleep(0.1)
+        cancelled_at = time.time()
+        download_queue.cancel(job.id)
+        assert download_queue.wait(5)
+        assert time.time() - cancelled_at < 3
+    finally:
+        download_queue.close()
+    assert job.state == JOB_CANCELLED
+    assert scratch_files(tmp_path) == []
+
+
+def test_cancelling_a_job_waiting_to_retry(tmp_path, monkeypatch):
+    monkeypatch.setattr(converter_retry, 'RETRY_BASE_DELAY', 30)
+    converter = Converter(ydl_class=FlakyYoutubeDL, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, encode_workers=1)
+    try:
+        job = download_queue.submit('https://www.youtube.com/watch?v=flakyvideo2', str(tmp_path))
+        wait_for(lambda: job.stage == 'retry')
+        download_queue.cancel(job.id)
+        assert job.state == JOB_CANCELLED
+        assert download_queue.wait(5)
+    finally:
+        download_queue.close()
+    assert scratch_files(tmp_path) == []
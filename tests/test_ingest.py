@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from converter_engine import DownloadJob, JOB_DONE
+from converter_ingest import UrlIngester, canonical_url, read_lines
+
+WATCH = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+# Records submissions instead of running them
+class RecordingQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, url, save_path):
+        job = DownloadJob(url, save_path)
+        self.jobs.append(job)
+        return job
+
+
+@pytest.mark.parametrize('url, expected', [
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", WATCH),
+    ("https://youtu.be/dQw4w9WgXcQ", WATCH),
+    ("youtu.be/dQw4w9WgXcQ?t=42", WATCH),
+    ("https://www.youtube.com/shorts/dQw4w9WgXcQ", WATCH),
+    ("https://m.youtube.com/watch?v=dQw4w9WgXcQ", WATCH),
+    ("https://music.youtube.com/watch?v=dQw4w9WgXcQ&feature=share", WATCH),
+    ("https://www.youtube.com/watch?app=desktop&v=dQw4w9WgXcQ", WATCH),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLabc123&index=3", WATCH),
+    ("  https://www.youtube.com/embed/dQw4w9WgXcQ  ", WATCH),
+    ("https://www.youtube.com/playlist?list=PLabc123&si=xyz",
+     "https://www.youtube.com/playlist?list=PLabc123"),
+    ("https://www.youtube.com/channel/UCabc123/videos", "https://www.youtube.com/channel/UCabc123/videos"),
+    ("https://www.youtube.com/@someone", "https://www.youtube.com/@someone"),
+    ("https://www.youtube.com/c/Someone/", "https://www.youtube.com/c/Someone"),
+    ("https://www.youtube.com/playlist", None),
+    ("https://youtu.be/", None),
+    ("https://example.com/watch?v=dQw4w9WgXcQ", None),
+    ("https://www.youtube.com/feed/subscriptions", None),
+    ("not a url", None),
+    ("http://[::1", None),
+    ("", None),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+
+def test_read_lines_skips_comments_and_splits_lines(tmp_path):
+    path = tmp_path / 'urls.txt'
+    path.write_text("# favourites\n\nyoutu.be/aaaaaaaaaaa, youtu.be/bbbbbbbbbbb\n  youtu.be/ccccccccccc  \n")
+    assert list(read_lines(str(path))) == ['youtu.be/aaaaaaaaaaa', 'youtu.be/bbbbbbbbbbb', 'youtu.be/ccccccccccc']
+
+
+def test_duplicates_and_invalid_urls_are_skipped(tmp_path):
+    download_queue = RecordingQueue()
+    invalid = []
+    ingester = UrlIngester(download_queue, str(tmp_path), on_invalid=invalid.append)
+    queued = ingester.feed([
+        "https://youtu.be/dQw4w9WgXcQ",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1",
+        "https://example.com/video",
+        "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+        "https://www.youtube.com/watch?v=aaaaaaaaaaa",
+    ])
+
+    assert queued == 2
+    assert [job.url for job in download_queue.jobs] == [WATCH, "https://www.youtube.com/watch?v=aaaaaaaaaaa"]
+    assert invalid == ["https://example.com/video"]
+    assert ingester.stats() == {'submitted': 2, 'duplicates': 2, 'invalid': 1, 'pending': 2}
+
+
+def test_ingestion_waits_while_max_pending_jobs_are_unfinished(tmp_path):
+    download_queue = RecordingQueue()
+    ingester = UrlIngester(download_queue, str(tmp_path), max_pending=2)
+    urls = [f"https://www.youtube.com/watch?v=pending{n:04d}" for n in range(3)]
+    feeder = threading.Thread(target=ingester.feed, args=(urls,), daemon=True)
+    feeder.start()
+
+    time.sleep(0.5)
+    assert feeder.is_alive()
+    assert len(download_queue.jobs) == 2
+
+    download_queue.jobs[0].state = JOB_DONE
+    feeder.join(5)
+    assert not feeder.is_alive()
+    assert [job.url for job in download_queue.jobs] == urls
+
+
+def test_stop_releases_a_waiting_ingester(tmp_path):
+    download_queue = RecordingQueue()
+    ingester = UrlIngester(download_queue, str(tmp_path), max_pending=1)
+    urls = [f"https://www.youtube.com/watch?v=stopped{n:04d}" for n in range(2)]
+    queued = []
+    feeder = threading.Thread(target=lambda: queued.append(ingester.feed(urls)), daemon=True)
+    feeder.start()
+
+    time.sleep(0.5)
+    assert feeder.is_alive()
+    ingester.stop()
+    feeder.join(5)
+    assert queued == [1]
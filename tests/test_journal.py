@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from converter_engine import Converter, DownloadJob, DownloadQueue, JOB_DONE, JOB_FAILED
+from converter_journal import MAX_RESUME_ATTEMPTS, JobJournal
+from converter_retry import ERROR_TRANSIENT, ERROR_UNAVAILABLE
+from converter_stub import StubYoutubeDL, stub_transcode
+
+
+# Leaves part of a download behind, then fails with the error in the class attribute
+class FailingYoutubeDL(StubYoutubeDL):
+    error = None
+
+    def process_ie_result(self, info, download=True):
+        outtmpl = self.params['outtmpl']
+        if isinstance(outtmpl, dict):
+            outtmpl = outtmpl['default']
+        with open(outtmpl % info + '.part', 'wb') as f:
+            f.write(b'\0' * 1024)
+        raise self.error
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.db'))
+    yield journal
+    journal.close()
+
+
+def run_job(journal, ydl_class, url, save_path):
+    converter = Converter(ydl_class=ydl_class, transcoder=stub_transcode, quiet=True)
+    # Failures are left to the journal rather than retried by the queue
+    download_queue = DownloadQueue(converter, encode_workers=1, journal=journal, max_retries=0)
+    try:
+        job = download_queue.submit(url, save_path)
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+    return job, converter.scratch_dir(job)
+
+
+def test_finished_job_leaves_the_journal(journal, tmp_path):
+    job, scratch_dir = run_job(journal, StubYoutubeDL, 'https://www.youtube.com/watch?v=journaled00',
+                               str(tmp_path / 'out'))
+    assert job.state == JOB_DONE
+    assert not os.path.exists(scratch_dir)
+    assert journal.pending() == []
+
+
+def test_permanent_failure_leaves_nothing_behind(journal, tmp_path):
+    FailingYoutubeDL.error = Exception("ERROR: [youtube] journaled01: Private video")
+    job, scratch_dir = run_job(journal, FailingYoutubeDL, 'https://www.youtube.com/watch?v=journaled01',
+                               str(tmp_path / 'out'))
+    assert job.state == JOB_FAILED
+    assert job.error_class == ERROR_UNAVAILABLE
+    assert not os.path.exists(scratch_dir)
+    assert journal.pending() == []
+
+
+def test_transient_failure_is_kept_for_a_restart(journal, tmp_path):
+    FailingYoutubeDL.error = ConnectionResetError(104, "Connection reset by peer")
+    job, scratch_dir = run_job(journal, FailingYoutubeDL, 'https://www.youtube.com/watch?v=journaled01',
+                               str(tmp_path / 'out'))
+    assert job.state == JOB_FAILED
+    assert job.error_class == ERROR_TRANSIENT
+    assert os.listdir(scratch_dir)
+    [entry] = journal.pending()
+    assert entry['state'] == JOB_FAILED and entry['url'] == job.url
+
+
+def test_jobs_out_of_resumes_are_dropped_with_their_scratch_space(journal, tmp_path):
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, journal=journal)
+    job = DownloadJob('https://www.youtube.com/watch?v=journaled02', str(tmp_path))
+    journal.add('stale', job)
+    for _ in range(MAX_RESUME_ATTEMPTS):
+        journal.mark_resumed('stale')
+    scratch_dir = converter.scratch_dir(job)
+    os.makedirs(scratch_dir)
+    with open(os.path.join(scratch_dir, 'journaled02.webm.part'), 'wb') as f:
+        f.write(b'\0')
+
+    try:
+        assert download_queue.resume() == []
+    finally:
+        download_queue.close()
+    assert not os.path.exists(scratch_dir)
+    assert journal.expired() == [] and journal.pending() == []
@@ -0,0 +1,81 @@
+import converter_metrics
+from converter_engine import DownloadJob, JOB_DONE, JOB_FAILED
+from converter_metrics import prometheus_text, snapshot
+from converter_retry import ERROR_UNAVAILABLE
+
+
+def finished_job(state, seconds, stage_seconds, bytes_downloaded=0, retries=0, error_class=None):
+    job = DownloadJob('https://www.youtube.com/watch?v=metrics0001', '/tmp')
+    job.state = state
+    job.finished_at = job.created_at + seconds
+    job.metrics.stage_seconds = dict(stage_seconds)
+    job.metrics.bytes_downloaded = bytes_downloaded
+    job.metrics.retries = retries
+    job.error_class = error_class
+    return job
+
+
+def sample_jobs():
+    return [
+        finished_job(JOB_DONE, 2.0, {'fetch': 0.5, 'encode': 1.0}, bytes_downloaded=1000),
+        finished_job(JOB_DONE, 4.0, {'fetch': 2.0, 'encode': 1.5}, bytes_downloaded=3000, retries=1),
+        finished_job(JOB_FAILED, 1.0, {'fetch': 0.2}, error_class=ERROR_UNAVAILABLE),
+    ]
+
+
+def test_snapshot_summarises_finished_jobs():
+    summary = snapshot(sample_jobs())
+    assert summary['counts'] == {'queued': 0, 'running': 0, 'done': 2, 'failed': 1, 'cancelled': 0}
+    assert summary['job_seconds']['p50'] == 2.0 and summary['job_seconds']['p95'] == 4.0
+    assert summary['stage_seconds']['fetch']['count'] == 3
+    assert summary['bytes_downloaded'] == 4000
+    assert summary['retries'] == 1
+    assert summary['failures']['unavailable'] == 1 and summary['failures']['transient'] == 0
+
+
+def test_prometheus_text_golden():
+    cache_stats = {'entries': 3, 'hits': 5, 'disk_hits': 2, 'misses': 4}
+    lines = prometheus_text(sample_jobs(), cache_stats).splitlines()
+
+    assert [line for line in lines if line.startswith('# TYPE')] == [
+        '# TYPE youtube_mp3_jobs gauge',
+        '# TYPE youtube_mp3_job_seconds histogram',
+        '# TYPE youtube_mp3_stage_seconds histogram',
+        '# TYPE youtube_mp3_downloaded_bytes_total counter',
+        '# TYPE youtube_mp3_download_speed_bytes histogram',
+        '# TYPE youtube_mp3_download_peak_speed_bytes gauge',
+        '# TYPE youtube_mp3_encode_speed_ratio histogram',
+        '# TYPE youtube_mp3_retries_total counter',
+        '# TYPE youtube_mp3_failures_total counter',
+        '# TYPE youtube_mp3_info_cache_lookups_total counter',
+        '# TYPE youtube_mp3_info_cache_entries gauge',
+    ]
+    for line in [
+        'youtube_mp3_jobs{state="done"} 2',
+        'youtube_mp3_jobs{state="failed"} 1',
+        'youtube_mp3_job_seconds_bucket{le="2.5"} 1',
+        'youtube_mp3_job_seconds_bucket{le="+Inf"} 2',
+        'youtube_mp3_job_seconds_sum 6.0',
+        'youtube_mp3_job_seconds_count 2',
+        'youtube_mp3_stage_seconds_bucket{stage="fetch",le="0.25"} 1',
+        'youtube_mp3_stage_seconds_count{stage="fetch"} 3',
+        'youtube_mp3_stage_seconds_count{stage="prepare"} 0',
+        'youtube_mp3_downloaded_bytes_total 4000',
+        'youtube_mp3_retries_total 1',
+        'youtube_mp3_failures_total{class="unavailable"} 1',
+        'youtube_mp3_failures_total{class="throttled"} 0',
+        'youtube_mp3_info_cache_lookups_total{result="hit"} 5',
+        'youtube_mp3_info_cache_lookups_total{result="disk_hit"} 2',
+        'youtube_mp3_info_cache_lookups_total{result="miss"} 4',
+        'youtube_mp3_info_cache_entries 3',
+    ]:
+        assert line in lines
+
+
+def test_info_cache_metrics_are_optional():
+    assert 'info_cache' not in prometheus_text(sample_jobs())
+
+
+def test_label_values_are_escaped():
+    labels = converter_metrics._labels({'title': 'say "hi"\\\nbye'})
+    assert labels == '{title="say \\"hi\\"\\\\\\nbye"}'
@@ -0,0 +1,221 @@
+import concurrent.futures
+import math
+import os
+import struct
+
+import pytest
+
+import converter_engine
+from converter_engine import SEGMENT_PREROLL_FRAMES, Converter, DownloadJob, JobWork
+from converter_ffmpeg import CONVERSION_TRANSCODE
+from converter_mp3 import (
+    LAME_DELAY_PADDING, LAME_MUSIC_CRC, LAME_MUSIC_LENGTH, LAME_TAG_CRC, SAMPLES_PER_FRAME, XING_BYTES,
+    XING_FRAMES, XING_QUALITY, XING_TOC, XING_TOC_SIZE, Mp3Error, crc16, encoder_padding, info_offset,
+    join_segments, read_frames, update_info_frame,
+)
+from converter_stub import stub_transcode
+
+# 128 kbps at 44.1 kHz without padding: 417-byte frames
+BITRATE_INDEX = 9
+FRAME_SIZE = 417
+INFO_FLAGS = XING_FRAMES | XING_BYTES | XING_TOC | XING_QUALITY
+
+
+def header(mono=False, crc=False):
+    return bytes([0xFF, 0xFA if crc else 0xFB, BITRATE_INDEX << 4, 0xC0 if mono else 0x00])
+
+
+def audio_frame(label, mono=False):
+    """An audio frame whose main data starts with label, so frames can be told apart after a join"""
+    side_info = 17 if mono else 32
+    body = bytes(side_info) + struct.pack('>I', label)
+    return header(mono) + body + bytes(FRAME_SIZE - 4 - len(body))
+
+
+def info_frame(delay=576, padding=0, mono=False, crc=False):
+    """An Info frame with every Xing field and a LAME extension, as ffmpeg writes it"""
+    frame = bytearray(header(mono, crc) + bytes(FRAME_SIZE - 4))
+    offset = 4 + (17 if mono else 32) + (2 if crc else 0)
+    frame[offset:offset + 8] = b'Info' + struct.pack('>I', INFO_FLAGS)
+    lame = lame_offset(offset)
+    frame[lame:lame + 4] = b'LAME'
+    frame[lame + LAME_DELAY_PADDING:lame + LAME_DELAY_PADDING + 3] = ((delay << 12) | padding).to_bytes(3, 'big')
+    return bytes(frame)
+
+
+def lame_offset(offset):
+    return offset + 8 + 4 + 4 + XING_TOC_SIZE + 4
+
+
+def write_mp3(path, labels, info=None, prefix=b'', suffix=b''):
+    with open(path, 'wb') as f:
+        f.write(prefix)
+        if info is not None:
+            f.write(info)
+        for label in labels:
+            f.write(audio_frame(label))
+        f.write(suffix)
+    return str(path)
+
+
+def labels_of(path):
+    """Labels of the audio frames in a file, skipping its Info frame"""
+    return [struct.unpack('>I', frame[36:40])[0] for frame in read_frames(path) if info_offset(frame) is None]
+
+
+def test_crc16_is_crc16_arc():
+    assert crc16(b'123456789') == 0xBB3D
+    assert crc16(b'') == 0
+
+
+def test_info_offset_follows_the_header_layout():
+    assert info_offset(info_frame()) == 36
+    assert info_offset(info_frame(mono=True)) == 21
+    # A CRC-protected header is followed by two checksum bytes
+    assert info_offset(info_frame(crc=True)) == 38
+    assert info_offset(audio_frame(0)) is None
+
+
+@pytest.mark.parametrize('mono, crc', [(False, False), (True, False), (False, True)])
+def test_update_info_frame_rewrites_counts_and_checksum(mono, crc):
+    frame = update_info_frame(info_frame(delay=576, padding=100, mono=mono, crc=crc), 1000, 417000, padding=1234)
+    offset = info_offset(frame)
+    assert frame[offset:offset + 4] == b'Info'
+    assert struct.unpack('>II', frame[offset + 8:offset + 16]) == (1000, 417000)
+    toc = frame[offset + 16:offset + 16 + XING_TOC_SIZE]
+    assert toc[0] == 0 and list(toc) == sorted(toc)
+
+    lame = lame_offset(offset)
+    assert int.from_bytes(frame[lame + LAME_DELAY_PADDING:lame + LAME_DELAY_PADDING + 3], 'big') == (576 << 12) | 1234
+    assert encoder_padding(frame) == 1234
+    assert struct.unpack('>I', frame[lame + LAME_MUSIC_LENGTH:lame + LAME_MUSIC_LENGTH + 4])[0] == 417000
+    assert frame[lame + LAME_MUSIC_CRC:lame + LAME_MUSIC_CRC + 2] == b'\0\0'
+    tag_crc = struct.unpack('>H', frame[lame + LAME_TAG_CRC:lame + LAME_TAG_CRC + 2])[0]
+    assert tag_crc == crc16(frame[:lame + LAME_TAG_CRC])
+    assert len(frame) == FRAME_SIZE
+
+
+def test_update_info_frame_keeps_padding_when_none_is_given():
+    frame = update_info_frame(info_frame(padding=321), 10, 4170)
+    assert encoder_padding(frame) == 321
+
+
+def test_join_drops_preroll_and_keeps_exact_counts(tmp_path):
+    segments = [
+        (write_mp3(tmp_path / 'seg0.mp3', range(0, 7), info_frame(padding=500)), 0, 5),
+        (write_mp3(tmp_path / 'seg1.mp3', range(3, 11), info_frame(padding=600)), 2, 5),
+        (write_mp3(tmp_path / 'seg2.mp3', range(8, 14), info_frame(padding=777)), 2, None),
+    ]
+    dest = str(tmp_path / 'joined.mp3')
+    assert join_segments(segments, dest) == 14
+
+    assert labels_of(dest) == list(range(14))
+    info = next(read_frames(dest))
+    offset = info_offset(info)
+    assert struct.unpack('>II', info[offset + 8:offset + 16]) == (14, os.path.getsize(dest))
+    assert os.path.getsize(dest) == 15 * FRAME_SIZE
+    # End padding comes from the last segment
+    assert encoder_padding(info) == 777
+
+
+def test_join_without_info_frames(tmp_path):
+    segments = [
+        (write_mp3(tmp_path / 'seg0.mp3', range(0, 3)), 0, 3),
+        (write_mp3(tmp_path / 'seg1.mp3', range(2, 5)), 1, None),
+    ]
+    dest = str(tmp_path / 'joined.mp3')
+    assert join_segments(segments, dest) == 5
+    assert labels_of(dest) == list(range(5))
+
+
+def test_short_segment_is_an_error(tmp_path):
+    segments = [
+        (write_mp3(tmp_path / 'seg0.mp3', range(0, 3), info_frame()), 0, 5),
+        (write_mp3(tmp_path / 'seg1.mp3', range(5, 8), info_frame()), 0, None),
+    ]
+    with pytest.raises(Mp3Error, match="3 of its 5 frames"):
+        join_segments(segments, str(tmp_path / 'joined.mp3'))
+
+
+def test_read_frames_skips_id3_tags(tmp_path):
+    # ID3v2 size is a 28-bit syncsafe integer: 0x01 0x7F means 255 bytes of tag body
+    id3v2 = b'ID3\x04\x00\x00\x00\x00\x01\x7F' + bytes(255)
+    id3v1 = b'TAG' + bytes(125)
+    path = write_mp3(tmp_path / 'tagged.mp3', range(3), info_frame(), prefix=id3v2, suffix=id3v1)
+    frames = list(read_frames(path))
+    assert len(frames) == 4 and info_offset(frames[0]) == 36
+    assert labels_of(path) == [0, 1, 2]
+
+
+def test_read_frames_rejects_broken_streams(tmp_path):
+    lost_sync = write_mp3(tmp_path / 'garbage.mp3', range(2), suffix=b'\x00' * 10)
+    with pytest.raises(Mp3Error, match="Lost frame sync"):
+        list(read_frames(lost_sync))
+    truncated = tmp_path / 'truncated.mp3'
+    truncated.write_bytes(audio_frame(0) + audio_frame(1)[:100])
+    with pytest.raises(Mp3Error, match="Truncated frame"):
+        list(read_frames(str(truncated)))
+
+
+def segment_work(tmp_path, duration, asr=44100, codec='mp3'):
+    work = JobWork(DownloadJob('https://www.youtube.com/watch?v=segmented01', str(tmp_path)))
+    work.info = {'duration': duration, 'asr': asr}
+    work.codec = codec
+    work.conversion = CONVERSION_TRANSCODE
+    work.temp_dir = str(tmp_path)
+    return work
+
+
+def test_segment_plan_covers_the_whole_track(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    converter = Converter(quiet=True, segment_encoding=True)
+    sample_rate, starts = converter.segment_plan(segment_work(tmp_path, 3600.5, asr=48000))
+
+    total = math.ceil(3600.5 * 48000 / SAMPLES_PER_FRAME)
+    assert sample_rate == 48000
+    assert len(starts) == 8 and starts[0] == 0
+    bounds = starts + [total]
+    sizes = [end - start for start, end in zip(bounds, bounds[1:])]
+    assert sum(sizes) == total and max(sizes) - min(sizes) <= 1
+
+    # Sample rates MPEG-1 cannot store are resampled
+    assert converter.segment_plan(segment_work(tmp_path, 3600, asr=22050))[0] == 44100
+
+
+def test_segment_plan_leaves_other_encodes_alone(tmp_path):
+    converter = Converter(quiet=True, segment_encoding=True)
+    assert converter.segment_plan(segment_work(tmp_path, 300)) is None
+    assert converter.segment_plan(segment_work(tmp_path, 3600, codec='opus')) is None
+    assert Converter(quiet=True).segment_plan(segment_work(tmp_path, 3600)) is None
+    # A stand-in encoder does not write real MP3 frames to join
+    stubbed = Converter(quiet=True, segment_encoding=True, transcoder=stub_transcode)
+    assert stubbed.segment_plan(segment_work(tmp_path, 3600)) is None
+
+
+def test_encode_segments_joins_every_frame_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    duration = 700
+    total = math.ceil(duration * 44100 / SAMPLES_PER_FRAME)
+    calls = []
+
+    def fake_encode(src, dest, quality, sample_rate, start_sample, frames=None, ffmpeg_location=None,
+                    stop_path=None):
+        # Label every frame with its position in the whole track, as a real encode would place it
+        first = start_sample // SAMPLES_PER_FRAME
+        last = total if frames is None else first + frames
+        calls.append((first, frames))
+        return write_mp3(dest, range(first, last), info_frame(padding=first % 1000))
+
+    monkeypatch.setattr(converter_engine, 'encode_mp3_segment', fake_encode)
+    converter = Converter(quiet=True, segment_encoding=True)
+    work = segment_work(tmp_path, duration)
+    work.source_path = str(tmp_path / 'source.webm')
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        converter.encode(work, executor)
+
+    # Every segment but the first starts SEGMENT_PREROLL_FRAMES early; the last runs to the end
+    calls.sort(key=lambda call: call[0])
+    assert len(calls) == 4 and calls[0][0] == 0 and calls[-1][1] is None
+    assert calls[0][1] == calls[1][0] + SEGMENT_PREROLL_FRAMES
+    assert labels_of(work.encoded_path) == list(range(total))
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(work.encoded_path)]
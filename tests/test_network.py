@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pytest
+
+from converter_engine import Converter, DownloadJob, JobCancelled
+from converter_network import BandwidthGovernor, HostBreaker, HostLimiter, fair_shares, parse_size, site_of
+from converter_stub import StubYoutubeDL, stub_transcode
+
+MEDIA_HOST = 'rr1---sn-test.googlevideo.com'
+
+
+# Stub whose audio format points at a media host, so fetch goes through the breaker
+class MediaHostYoutubeDL(StubYoutubeDL):
+    def _video_info(self, url):
+        info = super()._video_info(url)
+        info.pop('chapters')
+        info['url'] = f'https://{MEDIA_HOST}/videoplayback'
+        info['protocol'] = 'https'
+        return info
+
+
+def tripped_breaker():
+    """A breaker for googlevideo.com whose cool-down has just run out (half open)"""
+    breaker = HostBreaker(threshold=1, cooldown=0.05)
+    assert breaker.record_throttled(MEDIA_HOST) == 0.05
+    time.sleep(0.1)
+    return breaker
+
+
+def test_parse_size():
+    assert parse_size('500K') == 500 * 1024
+    assert parse_size('1.5MiB') == int(1.5 * 1024 ** 2)
+    assert parse_size('2m/s') == 2 * 1024 ** 2
+    assert parse_size('') is None
+    with pytest.raises(ValueError):
+        parse_size('fast')
+
+
+def test_fair_shares_give_slow_downloads_only_what_they_use():
+    assert fair_shares(900, [None, None, None]) == [300, 300, 300]
+    assert fair_shares(900, [100, None, None]) == [100, 400, 400]
+
+
+def test_governor_splits_the_limit_between_running_downloads():
+    governor = BandwidthGovernor(1000)
+    first = governor.acquire(DownloadJob('https://www.youtube.com/watch?v=share000001', '.'))
+    second = governor.acquire(DownloadJob('https://www.youtube.com/watch?v=share000002', '.'))
+    assert first.rate == second.rate == 500
+    second.release()
+    assert first.rate == 1000 and governor.active() == 1
+
+
+def test_host_limiter_caps_connections():
+    limiter = HostLimiter(max_per_host=2)
+    assert limiter.acquire('example.com', 5) == 2
+    cancel_event = threading.Event()
+    cancel_event.set()
+    assert limiter.acquire('example.com', 1, cancel_event) == 0
+    limiter.release('example.com', 2)
+    assert limiter.open_connections() == {}
+
+
+def test_host_limiter_wakes_a_waiter_on_release():
+    limiter = HostLimiter(max_per_host=1)
+    assert limiter.acquire('example.com') == 1
+    taken = []
+    waiter = threading.Thread(target=lambda: taken.append(limiter.acquire('example.com')), daemon=True)
+    waiter.start()
+    time.sleep(0.1)
+    assert waiter.is_alive()
+    limiter.release('example.com', 1)
+    waiter.join(2)
+    assert taken == [1]
+    assert limiter.open_connections() == {'example.com': 1}
+
+
+def test_released_share_no_longer_applies_rates():
+    governor = BandwidthGovernor(1000)
+    share = governor.acquire(DownloadJob('https://www.youtube.com/watch?v=share000003', '.'))
+    applied = []
+    share.on_rate(applied.append)
+    share.release()
+    share.set_rate(500)
+    assert applied == [1000]
+    assert governor.active() == 0
+
+
+def test_fetch_gives_up_its_share_before_the_session_returns_to_the_pool(tmp_path):
+    governor = BandwidthGovernor(10 ** 9)
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode, quiet=True, governor=governor)
+    returned = []
+    release = converter.sessions._release
+
+    def record_release(pooled):
+        returned.append((governor.active(), pooled.ydl.params.get('ratelimit')))
+        release(pooled)
+
+    converter.sessions._release = record_release
+    job = DownloadJob('https://www.youtube.com/watch?v=share000004', str(tmp_path))
+    work = converter.prepare(job)
+    converter.extract(work)
+    converter.fetch(work)
+    # extract's session had no share; fetch's had one, released before the session went back
+    assert returned[-1] == (0, None)
+    converter.cleanup(work)
+
+
+def test_pool_clears_a_stale_rate_limit_on_checkout():
+    converter = Converter(ydl_class=StubYoutubeDL, quiet=True)
+    with converter.sessions.session(StubYoutubeDL, {'quiet': True}) as ydl:
+        pass
+    ydl.params['ratelimit'] = 123
+    with converter.sessions.session(StubYoutubeDL, {'quiet': True}) as reused:
+        assert reused is ydl
+        assert 'ratelimit' not in reused.params
+
+
+def test_site_of_groups_hosts():
+    assert site_of('rr1---sn-abc.googlevideo.com') == 'googlevideo.com'
+    assert site_of('www.youtube.com') == site_of('m.youtube.com') == 'youtube.com'
+    assert site_of('127.0.0.1') == '127.0.0.1'
+
+
+def test_breaker_opens_after_threshold_and_closes_on_probe_success():
+    breaker = HostBreaker(threshold=2, window=5, cooldown=0.2)
+    assert breaker.record_throttled('a.example.com') is None
+    assert breaker.record_throttled('b.example.com') == 0.2
+    assert 'example.com' in breaker.open_sites()
+
+    # A request that started before the breaker opened does not close it
+    breaker.record_success('c.example.com')
+    assert 'example.com' in breaker.open_sites()
+
+    started = time.monotonic()
+    assert breaker.wait('example.com')
+    assert time.monotonic() - started >= 0.15
+    breaker.record_success('example.com')
+    assert breaker.open_sites() == {}
+
+
+def test_throttled_probe_doubles_cooldown_and_holds_other_requests():
+    breaker = HostBreaker(threshold=1, cooldown=0.2, max_cooldown=10)
+    breaker.record_throttled('example.com')
+    assert breaker.wait('example.com')
+
+    waited = []
+    other = threading.Thread(target=lambda: waited.append(breaker.wait('example.com')), daemon=True)
+    other.start()
+    time.sleep(0.1)
+    assert other.is_alive()
+
+    assert breaker.record_throttled('example.com') == 0.4
+    other.join(2)
+    assert waited == [True]
+
+
+def test_wait_returns_false_when_cancelled():
+    breaker = HostBreaker(threshold=1, cooldown=30)
+    breaker.record_throttled('example.com')
+    cancel_event = threading.Event()
+    cancel_event.set()
+    assert breaker.wait('example.com', cancel_event) is False
+
+
+def test_cancel_during_probe_releases_probe_slot(tmp_path):
+    breaker = tripped_breaker()
+    limiter = HostLimiter(max_per_host=1)
+    # Another download holds the only connection, so the probing job blocks in the limiter
+    assert limiter.acquire(MEDIA_HOST) == 1
+    converter = Converter(ydl_class=MediaHostYoutubeDL, quiet=True, breaker=breaker, host_limiter=limiter)
+    job = DownloadJob('https://www.youtube.com/watch?v=probe000001', str(tmp_path))
+    work = converter.prepare(job)
+    converter.extract(work)
+
+    errors = []
+
+    def fetch():
+        try:
+            converter.fetch(work)
+        except Exception as e:
+            errors.append(e)
+
+    fetcher = threading.Thread(target=fetch, daemon=True)
+    fetcher.start()
+    time.sleep(0.3)
+    assert fetcher.is_alive()
+    job.cancel_event.set()
+    fetcher.join(5)
+    assert not fetcher.is_alive()
+    assert isinstance(errors[0], JobCancelled)
+
+    # The next request to the site becomes the probe instead of waiting forever
+    waited = []
+    follower = threading.Thread(target=lambda: waited.append(breaker.wait(MEDIA_HOST)), daemon=True)
+    follower.start()
+    follower.join(2)
+    assert waited == [True]
+    converter.cleanup(work)
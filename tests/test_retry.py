@@ -0,0 +1,79 @@
+import io
+import socket
+import urllib.error
+
+import pytest
+
+from converter_ffmpeg import FFmpegError
+from converter_mp3 import Mp3Error
+from converter_retry import (
+    ERROR_ENCODER, ERROR_OTHER, ERROR_THROTTLED, ERROR_TRANSIENT, ERROR_UNAVAILABLE, RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY, THROTTLE_BASE_DELAY, classify_error, retry_delay,
+)
+
+
+# Shaped like yt-dlp's DownloadError, which carries the original exception in exc_info
+class WrappingError(Exception):
+    def __init__(self, msg, original):
+        super().__init__(msg)
+        self.exc_info = (type(original), original, None)
+
+
+# Always draws the lowest or the highest value
+class FixedRandom:
+    def __init__(self, high):
+        self.high = high
+
+    def uniform(self, a, b):
+        return b if self.high else a
+
+
+def http_error(code):
+    return urllib.error.HTTPError('https://example.com', code, 'status', {}, io.BytesIO())
+
+
+def caused_by(error, cause):
+    error.__cause__ = cause
+    return error
+
+
+@pytest.mark.parametrize('error, expected', [
+    (ConnectionResetError(104, 'Connection reset by peer'), ERROR_TRANSIENT),
+    (socket.timeout('timed out'), ERROR_TRANSIENT),
+    (http_error(503), ERROR_TRANSIENT),
+    (http_error(403), ERROR_TRANSIENT),
+    (http_error(429), ERROR_THROTTLED),
+    (http_error(404), ERROR_UNAVAILABLE),
+    (Exception("ERROR: [youtube] abc: Sign in to confirm you're not a bot"), ERROR_THROTTLED),
+    (Exception("ERROR: [youtube] abc: Private video. Sign in if you've been granted access"), ERROR_UNAVAILABLE),
+    (Exception("ERROR: Unable to download webpage: <urlopen error timed out>"), ERROR_TRANSIENT),
+    (FFmpegError("ffmpeg exited with code 1"), ERROR_ENCODER),
+    (Mp3Error("No MPEG audio frames found"), ERROR_ENCODER),
+    (OSError(28, 'No space left on device'), ERROR_OTHER),
+    (Exception("Something else went wrong"), ERROR_OTHER),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_wrapped_and_chained_errors_are_classified_by_the_original():
+    assert classify_error(WrappingError("ERROR: download failed", http_error(429))) == ERROR_THROTTLED
+    assert classify_error(WrappingError("ERROR: download failed", ConnectionAbortedError())) == ERROR_TRANSIENT
+    assert classify_error(caused_by(Exception("postprocessing failed"), FFmpegError("bad"))) == ERROR_ENCODER
+
+
+def test_unavailable_status_wins_over_a_transient_message():
+    assert classify_error(WrappingError("ERROR: timed out", http_error(410))) == ERROR_UNAVAILABLE
+
+
+def test_retry_delay_doubles_within_its_jitter():
+    for attempt in range(4):
+        backoff = RETRY_BASE_DELAY * 2 ** attempt
+        assert retry_delay(attempt, rng=FixedRandom(False)) == backoff / 2
+        assert retry_delay(attempt, rng=FixedRandom(True)) == backoff
+
+
+def test_retry_delay_waits_longer_when_throttled_and_is_capped():
+    assert retry_delay(0, ERROR_THROTTLED, rng=FixedRandom(False)) == THROTTLE_BASE_DELAY / 2
+    assert retry_delay(30, ERROR_THROTTLED, rng=FixedRandom(True)) == RETRY_MAX_DELAY
+    assert retry_delay(30, rng=FixedRandom(False)) == RETRY_MAX_DELAY / 2
@@ -0,0 +1,164 @@
+import json
+import os
+import socket
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+import pytest
+
+from converter_engine import Converter, DownloadQueue
+from converter_server import JobServer
+from converter_stub import STUB_PLAYLIST_SIZE, StubYoutubeDL, stub_transcode
+
+
+@pytest.fixture
+def service(tmp_path):
+    converter = Converter(ydl_class=StubYoutubeDL, transcoder=stub_transcode, quiet=True)
+    download_queue = DownloadQueue(converter, max_workers=2)
+    server = JobServer(download_queue, str(tmp_path))
+    port = server.start()
+    yield f"http://127.0.0.1:{port}", tmp_path
+    server.stop()
+    download_queue.close()
+
+
+def call(base, method, path, payload=None, body=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else body
+    request = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def raw_status(base, request):
+    """Send request bytes as they are and return the response's status code"""
+    parts = urlsplit(base)
+    with socket.create_connection((parts.hostname, parts.port), timeout=10) as sock:
+        sock.sendall(request)
+        return int(sock.recv(4096).split()[1])
+
+
+def wait_finished(base, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, job = call(base, 'GET', f'/jobs/{job_id}')
+        assert status == 200
+        if job['state'] in ('done', 'failed', 'cancelled'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_stub_job_end_to_end(service):
+    base, save_path = service
+    status, body = call(base, 'POST', '/jobs', {'urls': ['https://www.youtube.com/watch?v=stubvideo01']})
+    assert status == 201
+    job = wait_finished(base, body['jobs'][0]['id'])
+
+    assert job['state'] == 'done', job['error']
+    assert job['title'] == "Stub video stubvideo01"
+    assert job['error'] is None and job['error_class'] is None
+    assert job['output_path'] == os.path.join(str(save_path), "Stub video stubvideo01.mp3")
+    assert os.path.getsize(job['output_path']) == StubYoutubeDL.size
+    assert job['metrics']['bytes_downloaded'] == StubYoutubeDL.size
+    # Scratch space is gone once the job is done
+    assert not [name for name in os.listdir(save_path) if name.startswith('_temp_youtube_dl_')]
+
+    status, files = call(base, 'GET', '/files')
+    assert [entry['path'] for entry in files['files']] == [job['output_path']]
+    status, listing = call(base, 'GET', '/jobs?state=done')
+    assert [entry['id'] for entry in listing['jobs']] == [job['id']]
+    status, stats = call(base, 'GET', '/stats')
+    assert stats['counts']['done'] == 1
+    assert stats['metrics']['job_seconds']['count'] == 1
+    assert stats['metrics']['failures']['other'] == 0
+
+
+def test_stub_split_chapters(service):
+    base, save_path = service
+    status, body = call(base, 'POST', '/jobs', {'urls': ['https://www.youtube.com/watch?v=stubvideo02'],
+                                                'split_chapters': True})
+    job = wait_finished(base, body['jobs'][0]['id'])
+    assert job['state'] == 'done', job['error']
+    assert sorted(os.listdir(job['output_path'])) == [
+        "01 - Intro.mp3", "02 - Part 1_2_ Theme.mp3", "03 - Part 2_2_ Outro.mp3",
+    ]
+
+
+def test_stub_playlist_fans_out(service):
+    base, _ = service
+    status, body = call(base, 'POST', '/jobs', {'urls': ['https://www.youtube.com/playlist?list=PLstub']})
+    playlist = wait_finished(base, body['jobs'][0]['id'])
+    assert len(playlist['children']) == STUB_PLAYLIST_SIZE
+    entries = [wait_finished(base, child) for child in playlist['children']]
+    assert all(entry['state'] == 'done' for entry in entries)
+
+
+def test_duplicate_submission_returns_same_job(service):
+    base, _ = service
+    url = 'https://www.youtube.com/watch?v=stubvideo03'
+    first = call(base, 'POST', '/jobs', {'urls': [url]})[1]['jobs'][0]
+    second = call(base, 'POST', '/jobs', {'urls': [url]})[1]['jobs'][0]
+    assert first['id'] == second['id']
+    wait_finished(base, first['id'])
+
+
+def test_jobs_choose_their_own_format(service):
+    base, save_path = service
+    url = 'https://www.youtube.com/watch?v=stubvideo06'
+    jobs = [call(base, 'POST', '/jobs', {'urls': [url], **options})[1]['jobs'][0]
+            for options in ({}, {'codec': 'opus'}, {'codec': 'm4a', 'quality': 256}, {'codec': 'original'})]
+    # The same video in another format is a separate job, not a duplicate
+    assert len({job['id'] for job in jobs}) == 4
+    jobs = [wait_finished(base, job['id']) for job in jobs]
+
+    assert [(job['codec'], job['quality']) for job in jobs] == [
+        ('mp3', '192'), ('opus', '192'), ('m4a', '256'), ('original', '192'),
+    ]
+    assert [job['conversion'] for job in jobs] == ['transcode', 'remux', 'transcode', 'copy']
+    assert [os.path.splitext(job['output_path'])[1] for job in jobs] == ['.mp3', '.opus', '.m4a', '.webm']
+
+
+def test_invalid_requests(service):
+    base, _ = service
+    assert call(base, 'POST', '/jobs', {'urls': ['https://example.com/x']})[0] == 400
+    assert call(base, 'POST', '/jobs', {'urls': []})[0] == 400
+    assert call(base, 'GET', '/jobs/999')[0] == 404
+    assert call(base, 'PUT', '/jobs')[0] == 405
+    url = 'https://youtu.be/stubvideo04'
+    assert call(base, 'POST', '/jobs', {'urls': [url], 'codec': 'wav'})[0] == 400
+    for quality in ('high', 0, 1000, True):
+        assert call(base, 'POST', '/jobs', {'urls': [url], 'quality': quality})[0] == 400
+    assert call(base, 'POST', '/jobs', {'urls': [url], 'split_chapters': 'yes'})[0] == 400
+    for priority in ('high', 1.5, True):
+        assert call(base, 'POST', '/jobs', {'urls': [url], 'priority': priority})[0] == 400
+
+
+def test_priority_can_be_changed(service):
+    base, _ = service
+    job = call(base, 'POST', '/jobs', {'urls': ['https://youtu.be/stubvideo07'], 'priority': 3})[1]['jobs'][0]
+    assert job['priority'] == 3
+    status, changed = call(base, 'PATCH', f"/jobs/{job['id']}", {'priority': 10})
+    assert status == 200 and changed['priority'] == 10
+    assert call(base, 'PATCH', f"/jobs/{job['id']}", {'priority': 'urgent'})[0] == 400
+    assert call(base, 'PATCH', '/jobs/999', {'priority': 1})[0] == 404
+    wait_finished(base, job['id'])
+
+
+def test_body_must_be_a_json_object(service):
+    base, _ = service
+    assert call(base, 'POST', '/jobs', body=b'{"urls": [')[0] == 400
+    assert call(base, 'POST', '/jobs', ['https://youtu.be/stubvideo05'])[0] == 400
+    assert call(base, 'POST', '/jobs', "https://youtu.be/stubvideo05")[0] == 400
+
+
+def test_bad_content_length_is_answered(service):
+    base, _ = service
+    for length in (b'abc', b'-5'):
+        request = b'POST /jobs HTTP/1.1\r\nHost: localhost\r\nContent-Length: ' + length + b'\r\n\r\n{}'
+        assert raw_status(base, request) == 400
@@ -0,0 +1,112 @@
+import os
+import random
+import re
+import stat
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import converter_ffmpeg
+from converter_engine import Converter, DownloadQueue, JOB_DONE
+from converter_ffmpeg import stream_transcode
+from converter_stub import StubYoutubeDL
+
+DATA = random.Random(8).randbytes(300 * 1000)
+CHUNK_SIZE = 100 * 1000
+
+# Stands in for ffmpeg: copies what is piped in to the output file, the last argument
+FAKE_FFMPEG = """#!{python}
+import shutil, sys
+with open(sys.argv[-1], 'wb') as f:
+    shutil.copyfileobj(sys.stdin.buffer, f)
+"""
+
+
+# Serves DATA, honouring Range, and records every range asked for
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        start, end = (int(n) for n in re.match(r'bytes=(\d+)-(\d+)', self.headers['Range']).groups())
+        body = DATA[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{start + len(body) - 1}/{len(DATA)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def media_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/audio", server.requests
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(tmp_path, monkeypatch):
+    path = tmp_path / 'ffmpeg'
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(converter_ffmpeg, 'find_ffmpeg', lambda location=None: str(path))
+
+
+# Offers one plain HTTP audio format, served by media_url
+class MediaYoutubeDL(StubYoutubeDL):
+    url = None
+
+    def _video_info(self, url):
+        info = super()._video_info(url)
+        info.update(url=self.url, protocol='http', filesize=len(DATA))
+        return info
+
+
+def test_ranged_reads_reach_the_encoder_in_order(media_url, tmp_path):
+    url, requests = media_url
+    dest = str(tmp_path / 'out.mp3')
+    progress = []
+    downloaded = stream_transcode({'url': url}, dest, 'mp3', '192', progress_hook=progress.append,
+                                  chunk_size=CHUNK_SIZE)
+
+    assert downloaded == len(DATA)
+    with open(dest, 'rb') as f:
+        assert f.read() == DATA
+    assert requests == ['bytes=0-99999', 'bytes=100000-199999', 'bytes=200000-299999']
+    assert progress[-1]['status'] == 'finished' and progress[-1]['downloaded_bytes'] == len(DATA)
+    assert all(d['total_bytes'] == len(DATA) for d in progress)
+
+
+def test_cancelling_stops_the_download(media_url, tmp_path):
+    url, requests = media_url
+    dest = str(tmp_path / 'out.mp3')
+    cancel_event = threading.Event()
+
+    with pytest.raises(InterruptedError):
+        stream_transcode({'url': url, 'filesize': len(DATA)}, dest, 'mp3', '192',
+                         progress_hook=lambda d: cancel_event.set(), cancel_event=cancel_event,
+                         chunk_size=CHUNK_SIZE)
+    assert requests == ['bytes=0-99999']
+    assert not os.path.exists(dest)
+
+
+def test_streaming_job_encodes_while_downloading(media_url, tmp_path):
+    MediaYoutubeDL.url, requests = media_url
+    converter = Converter(ydl_class=MediaYoutubeDL, quiet=True, streaming=True, http_chunk_size=CHUNK_SIZE)
+    download_queue = DownloadQueue(converter)
+    try:
+        job = download_queue.submit('https://www.youtube.com/watch?v=streamed001', str(tmp_path / 'out'))
+        assert download_queue.wait(30)
+    finally:
+        download_queue.close()
+
+    assert job.state == JOB_DONE, job.error
+    assert len(requests) == 3
+    with open(job.output_path, 'rb') as f:
+        assert f.read() == DATA
@@ -0,0 +1,167 @@
+import os
+
+import pytest
+
+import converter_worker
+from converter_stub import StubYoutubeDL, stub_transcode
+from converter_worker import (
+    ITEM_DONE, ITEM_FAILED, ITEM_FINALIZING, ITEM_LEASED, ITEM_QUEUED, MAX_ATTEMPTS, LeaseLost, Worker, WorkQueue,
+)
+
+URL = 'https://www.youtube.com/watch?v=queueditem1'
+
+
+# Downloads slowly enough that a second claim finds the first job still running
+class SlowYoutubeDL(StubYoutubeDL):
+    chunk_delay = 0.05
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / 'queue.db'))
+    yield work_queue
+    work_queue.close()
+
+
+def make_worker(work_queue, ydl_class=StubYoutubeDL, **kwargs):
+    return Worker(work_queue, worker_id='test-worker', ydl_class=ydl_class, transcoder=stub_transcode,
+                  quiet=True, **kwargs)
+
+
+def item_state(work_queue):
+    return work_queue.items()[0]['state']
+
+
+def test_claim_leases_each_item_to_one_worker(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    item = work_queue.claim('a')
+    assert item['url'] == URL and item['state'] == ITEM_LEASED and item['attempts'] == 1
+    assert work_queue.claim('b') is None
+    assert work_queue.heartbeat('a', [item['id']]) == {item['id']}
+    assert work_queue.heartbeat('b', [item['id']]) == set()
+
+
+def test_expired_lease_is_taken_over(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    item = work_queue.claim('a', lease_seconds=-1)
+
+    taken = work_queue.claim('b')
+    assert taken['id'] == item['id'] and taken['attempts'] == 2
+    # The old holder can neither renew, finalize nor complete the item any more
+    assert work_queue.heartbeat('a', [item['id']]) == set()
+    with pytest.raises(LeaseLost):
+        work_queue.begin_finalize(item['id'], 'a')
+    assert not work_queue.complete(item['id'], 'a', '/elsewhere.mp3')
+
+    assert work_queue.begin_finalize(item['id'], 'b') is None
+    assert item_state(work_queue) == ITEM_FINALIZING
+    assert work_queue.complete(item['id'], 'b', '/out.mp3')
+    assert item_state(work_queue) == ITEM_DONE
+
+
+def test_failed_item_is_requeued_until_out_of_attempts(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        item = work_queue.claim('a')
+        assert item['attempts'] == attempt
+        assert work_queue.fail(item['id'], 'a', "Network error")
+    assert item_state(work_queue) == ITEM_FAILED
+    assert work_queue.claim('a') is None
+
+    assert work_queue.retry_failed() == 1
+    assert work_queue.claim('a')['attempts'] == 1
+
+
+def test_final_failure_is_not_retried(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    item = work_queue.claim('a')
+    work_queue.fail(item['id'], 'a', "Video unavailable", final=True)
+    assert item_state(work_queue) == ITEM_FAILED
+
+
+def test_released_item_keeps_its_attempts(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    item = work_queue.claim('a')
+    assert work_queue.release(item['id'], 'a')
+    assert work_queue.claim('b')['attempts'] == 1
+
+
+def test_item_whose_holders_keep_dying_is_given_up(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    for _ in range(MAX_ATTEMPTS):
+        work_queue.claim('a', lease_seconds=-1)
+    assert work_queue.claim('b') is None
+    item = work_queue.items()[0]
+    assert item['state'] == ITEM_FAILED and item['error'] == f"Gave up after {MAX_ATTEMPTS} attempts"
+
+
+def test_enqueue_skips_items_for_the_same_output(work_queue, tmp_path):
+    save_path = str(tmp_path)
+    assert work_queue.enqueue(URL, save_path)
+    assert not work_queue.enqueue('https://youtu.be/queueditem1', save_path + os.sep)
+    # Other encodings, folders or chapter splitting make other outputs
+    assert work_queue.enqueue(URL, save_path, 'mp3', '320')
+    assert work_queue.enqueue(URL, str(tmp_path / 'other'))
+    assert work_queue.enqueue(URL, save_path, split_chapters=True)
+    assert [item['split_chapters'] for item in work_queue.items()] == [0, 0, 0, 1]
+
+
+def test_enqueue_requeues_a_failed_item_but_not_a_done_one(work_queue, tmp_path):
+    work_queue.enqueue(URL, str(tmp_path))
+    for _ in range(MAX_ATTEMPTS):
+        work_queue.fail(work_queue.claim('a')['id'], 'a', "Video unavailable")
+    assert item_state(work_queue) == ITEM_FAILED
+    assert work_queue.enqueue(URL, str(tmp_path))
+    item = work_queue.items()[0]
+    assert item['state'] == ITEM_QUEUED and item['attempts'] == 0 and item['error'] is None
+
+    work_queue.complete(work_queue.claim('a')['id'], 'a', '/out.mp3')
+    assert not work_queue.enqueue(URL, str(tmp_path))
+
+
+def test_worker_converts_queued_items(work_queue, tmp_path):
+    save_path = str(tmp_path / 'out')
+    work_queue.enqueue(URL, save_path)
+    work_queue.enqueue('https://www.youtube.com/watch?v=queueditem2', save_path, 'm4a', '128')
+    work_queue.enqueue('https://www.youtube.com/watch?v=chapterized', save_path, split_chapters=True)
+
+    worker = make_worker(work_queue)
+    worker.run(exit_when_empty=True)
+
+    mp3, m4a, split = work_queue.items()
+    assert mp3['state'] == m4a['state'] == split['state'] == ITEM_DONE
+    assert os.path.getsize(mp3['output_path']) == StubYoutubeDL.size
+    assert m4a['output_path'].endswith('.m4a')
+    assert os.path.isdir(split['output_path']) and len(os.listdir(split['output_path'])) == 3
+    assert worker.completed == 3
+
+
+def test_items_sharing_a_job_are_all_settled(work_queue, tmp_path, monkeypatch):
+    # Tell the two spellings of one URL apart, so they become two items for the same output
+    monkeypatch.setattr(converter_worker, 'item_key', lambda url, *args: url)
+    save_path = str(tmp_path / 'out')
+    assert work_queue.enqueue('https://www.youtube.com/watch?v=sharedjob01', save_path)
+    assert work_queue.enqueue('https://youtu.be/sharedjob01', save_path)
+
+    worker = make_worker(work_queue, ydl_class=SlowYoutubeDL, max_workers=2)
+    worker.run(exit_when_empty=True)
+
+    items = work_queue.items()
+    assert [item['state'] for item in items] == [ITEM_DONE, ITEM_DONE]
+    assert items[0]['output_path'] == items[1]['output_path']
+    assert os.listdir(save_path) == [os.path.basename(items[0]['output_path'])]
+    assert worker.completed == 2
+
+
+def test_job_is_only_cancelled_once_it_holds_no_item(work_queue):
+    worker = make_worker(work_queue)
+    cancelled = []
+    worker.download_queue.cancel = cancelled.append
+    worker._items[7] = [{'id': 1}, {'id': 2}]
+    try:
+        worker._drop_lost_items(7, {2})
+        assert worker._items[7] == [{'id': 2}] and cancelled == []
+        worker._drop_lost_items(7, set())
+        assert cancelled == [7]
+    finally:
+        worker.download_queue.close()
@@ -1,74 +1,77 @@
+import time
+
+# Taken before the other imports so --startup-timing can include their cost
+STARTED_AT = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import os
-import threading
-import yt_dlp
 import sys
-import io
-from datetime import datetime
 import re
-import shutil
-import time
 import json
+import argparse
+import threading
 import os.path
 
+from converter_archive import DownloadArchive
+from converter_cache import InfoCache
+from converter_engine import (
+    Converter, DownloadQueue, FINISHED_STATES, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING,
+    ProgressBus, SETTINGS_DIR, SETTINGS_FILE, default_save_path, warm_up, yt_dlp_import_seconds,
+)
+from converter_ffmpeg import ORIGINAL, OUTPUT_CODECS
+from converter_ingest import UrlIngester, canonical_url
+from converter_journal import JobJournal
+from converter_logging import LOG_FILE, LogSink, SinkLogger, SinkWriter
+from converter_network import BandwidthGovernor, HostBreaker, HostLimiter
+from converter_retry import ERROR_LABELS, ERROR_OTHER
 
-# Custom logger class for yt_dlp that redirects to text widget
-class CustomLogger:
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
-        
-    def format_message(self, msg):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        if msg.strip():  # Only add timestamp for non-empty lines
-            return f"[{timestamp}] {msg}"
-        return msg
-    
-    def debug(self, msg):
-        self._write_to_widget(msg)
-    
-    def info(self, msg):
-        self._write_to_widget(msg)
-    
-    def warning(self, msg):
-        self._write_to_widget(f"Warning: {msg}")
-    
-    def error(self, msg):
-        self._write_to_widget(f"Error: {msg}")
-    
-    def _write_to_widget(self, msg):
-        self.text_widget.config(state=tk.NORMAL)
-        formatted_msg = self.format_message(msg)
-        self.text_widget.insert(tk.END, f"{formatted_msg}\n")
-        self.text_widget.see(tk.END)
-        self.text_widget.config(state=tk.DISABLED)
 
-# Custom stdout redirection class to capture console output
-class ConsoleRedirector(io.StringIO):
-    def __init__(self, text_widget):
-        super().__init__()
-        self.text_widget = text_widget
-        
-    def write(self, string):
-        self.text_widget.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Format the output with timestamp
-        if string.strip():  # Only add timestamp for non-empty lines
-            self.text_widget.insert(tk.END, f"[{timestamp}] {string}")
-        else:
-            self.text_widget.insert(tk.END, string)
-            
-        self.text_widget.see(tk.END)
-        self.text_widget.config(state=tk.DISABLED)
-        return len(string)
-        
-    def flush(self):
-        pass
+# Output formats offered in the options menu: (label, codec, quality in kbps)
+OUTPUT_FORMAT_CHOICES = [
+    ("MP3 128 kbps", "mp3", "128"),
+    ("MP3 192 kbps", "mp3", "192"),
+    ("MP3 320 kbps", "mp3", "320"),
+    ("M4A (AAC) 192 kbps", "m4a", "192"),
+    ("Opus 160 kbps", "opus", "160"),
+    ("Original (no conversion)", ORIGINAL, None),
+]
+
+# Total download bandwidth choices in the options menu, in MB/s (None for unlimited)
+BANDWIDTH_CHOICES = [None, 1, 2, 5, 10, 20]
+
+# Milliseconds between UI refreshes from the progress bus (about 15 frames a second)
+UI_FRAME_MS = 66
+
+# Milliseconds between console widget updates from the log sink
+LOG_FLUSH_MS = 250
+
+
+# Start-up milestones for --startup-timing, in seconds since the process started importing
+class StartupTimer:
+    def __init__(self, started_at=STARTED_AT):
+        self.started_at = started_at
+        self.marks = {}
+
+    def mark(self, name):
+        """Record a milestone the first time it is reached"""
+        self.marks.setdefault(name, time.perf_counter() - self.started_at)
+
+    def report(self):
+        lines = ["Startup timing (since launch):"]
+        for name, seconds in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f"  {name:<14} {seconds * 1000:8.1f} ms")
+        if yt_dlp_import_seconds() is not None:
+            lines.append(f"  yt_dlp import took {yt_dlp_import_seconds() * 1000:.1f} ms in the background")
+        return "\n".join(lines)
+
 
 class ModernYouTubeDownloader:
-    def __init__(self, root):
+    def __init__(self, root, startup_timer=None):
         self.root = root
+        self.startup_timer = startup_timer
+        self.started = False
+        self.warm_up_thread = None
         self.root.title("YouTube to MP3 Converter")
         self.root.geometry("900x600")
         self.root.minsize(800, 550)
@@ -111,7 +114,7 @@ class ModernYouTubeDownloader:
         self.content_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
         
         # YouTube URL input with label
-        self.url_frame = self.create_input_group(self.content_frame, "Enter YouTube URL:")
+        self.url_frame = self.create_input_group(self.content_frame, "Enter YouTube URL(s):")
         self.link_entry = tk.Entry(
             self.url_frame, 
             font=("Arial", 12),
@@ -145,8 +148,7 @@ class ModernYouTubeDownloader:
         self.save_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
         # Default save location is Downloads folder
-        downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-        self.save_entry.insert(0, downloads_path)
+        self.save_entry.insert(0, default_save_path())
         
         self.browse_button = self.create_button(
             self.location_inner_frame, 
@@ -214,6 +216,17 @@ class ModernYouTubeDownloader:
         )
         self.convert_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        # Cancel Button, enabled while the current batch has unfinished jobs
+        self.cancel_button = self.create_button(
+            self.button_frame,
+            "Cancel",
+            self.cancel_conversion,
+            self.colors['accent_secondary'],
+            width=100
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+        self.cancel_button.config(state=tk.DISABLED)
+        
         # Console output frame (right side, initially hidden)
         self.console_frame = tk.Frame(self.main_frame, bg=self.colors['console_header_bg'], width=300)
         self.console_visible = False
@@ -240,25 +253,90 @@ class ModernYouTubeDownloader:
         self.console_output.pack(fill=tk.BOTH, expand=True)
         self.console_output.config(state=tk.DISABLED)
         
-        # Create custom logger for yt-dlp
-        self.custom_logger = CustomLogger(self.console_output)
+        # Log output from yt-dlp, the engine and print() is buffered in a bounded sink
+        # and written to the console widget in batches by flush_console()
+        self.log_sink = LogSink()
+        self.custom_logger = SinkLogger(self.log_sink)
         
         # Redirect stdout to our console widget
-        self.stdout_redirector = ConsoleRedirector(self.console_output)
+        self.stdout_redirector = SinkWriter(self.log_sink)
         self.original_stdout = sys.stdout
         
         # Animation variables
         self.animate_progress_id = None
         
+        # Conversion queue; jobs submitted since the queue was last idle form the current batch.
+        # Engine callbacks run on worker threads, so they only publish to the progress bus
+        # and the Tk main loop applies the updates in drain_progress().
+        # The archive, info cache and journal are opened by finish_startup() once the window is up
+        self.progress_bus = ProgressBus()
+        self.converter = Converter(
+            logger=self.custom_logger,
+            on_status=self.on_job_status,
+            on_progress=self.on_job_progress,
+            verbose=True,
+            log_sink=self.log_sink,
+            governor=BandwidthGovernor(),
+            host_limiter=HostLimiter(),
+            breaker=HostBreaker(),
+        )
+        self.download_queue = DownloadQueue(self.converter, on_change=self.on_job_changed)
+        self.batch_jobs = {}
+        # URL list import running on a background thread, and the jobs it queued
+        # that drain_progress() has not yet added to the batch
+        self.ingester = None
+        self.imported_job_ids = set()
+        self.root.after(UI_FRAME_MS, self.drain_progress)
+        self.root.after(LOG_FLUSH_MS, self.flush_console)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # Initialize with console hidden
         self.console_visible = False
         print("Application started.")
         print(f"Python executable: {sys.executable}")
         print("Console ready for output.")
         
-        # Load settings after all UI elements are created
+        # Load settings after all UI elements are created; they are applied before the
+        # first paint so the window does not flash the default theme
         self.load_settings()
         
+        # Everything else waits until the window has been drawn
+        if self.startup_timer:
+            self.root.bind('<Expose>', lambda event: self.startup_timer.mark('first paint'), add='+')
+            self.startup_timer.mark('window built')
+        self.root.after_idle(lambda: self.root.after(0, self.finish_startup))
+    
+    def finish_startup(self):
+        """Open the archive, info cache and journal, resume jobs and load yt-dlp in the background"""
+        if self.started:
+            return
+        self.started = True
+        self.converter.archive = DownloadArchive()
+        self.converter.info_cache = InfoCache()
+        self.download_queue.journal = JobJournal()
+        self.warm_up_thread = warm_up(on_ready=self.on_yt_dlp_ready)
+        
+        # Pick up jobs that were still running when the app last closed
+        self.resume_jobs()
+        
+        if self.startup_timer:
+            self.startup_timer.mark('interactive')
+            self.root.after(UI_FRAME_MS, self.report_startup)
+    
+    def on_yt_dlp_ready(self):
+        # Runs on the warm-up thread
+        if self.startup_timer:
+            self.startup_timer.mark('yt_dlp ready')
+        print(f"yt-dlp loaded in {yt_dlp_import_seconds():.2f}s")
+    
+    def report_startup(self):
+        """Print the start-up timings once yt-dlp has loaded, then close (--startup-timing)"""
+        if self.warm_up_thread.is_alive():
+            self.root.after(UI_FRAME_MS, self.report_startup)
+            return
+        self.original_stdout.write(self.startup_timer.report() + "\n")
+        self.on_close()
+        
     def get_light_theme(self):
         """Return light theme colors"""
         return {
@@ -366,6 +444,7 @@ class ModernYouTubeDownloader:
         # Button frame
         self.button_frame.configure(bg=self.colors['bg_secondary'])
         self.convert_button.configure(bg=self.colors['accent'], fg="white")
+        self.cancel_button.configure(bg=self.colors['accent_secondary'], fg="white")
         
         # Console frame
         if self.console_visible:
@@ -464,6 +543,58 @@ class ModernYouTubeDownloader:
         console_text = "Hide Console" if self.console_visible else "Show Console"
         popup.add_command(label=console_text, command=self.toggle_console)
         
+        # Add log file toggle
+        log_file_text = "✓ Write Log File" if self.log_sink.file_enabled else "   Write Log File"
+        popup.add_command(label=log_file_text, command=self.toggle_log_file)
+        
+        # Add streaming conversion toggle
+        streaming_text = "✓ Streaming Conversion" if self.converter.streaming else "   Streaming Conversion"
+        popup.add_command(label=streaming_text, command=self.toggle_streaming)
+        
+        # Add chapter splitting toggle
+        chapters_text = "✓ Split Chapters" if self.converter.split_chapters else "   Split Chapters"
+        popup.add_command(label=chapters_text, command=self.toggle_split_chapters)
+        
+        # Add segmented encoding toggle
+        segment_text = "✓ Parallel MP3 Encoding" if self.converter.segment_encoding else "   Parallel MP3 Encoding"
+        popup.add_command(label=segment_text, command=self.toggle_segment_encoding)
+        
+        # Add shortest-first scheduling toggle
+        shortest_text = "✓ Shortest Jobs First" if self.download_queue.shortest_first else "   Shortest Jobs First"
+        popup.add_command(label=shortest_text, command=self.toggle_shortest_first)
+        
+        # Add output format submenu
+        format_menu = tk.Menu(popup, tearoff=0, bg=self.colors['bg_secondary'], fg=self.colors['text_primary'],
+                              activebackground=self.colors['accent'], activeforeground="white")
+        for label, codec, quality in OUTPUT_FORMAT_CHOICES:
+            selected = codec == self.converter.codec and (codec == ORIGINAL or quality == self.converter.quality)
+            format_menu.add_command(label=f"✓ {label}" if selected else f"   {label}",
+                                    command=lambda c=codec, q=quality: self.set_output_format(c, q))
+        popup.add_cascade(label="Output Format", menu=format_menu)
+        
+        # Add parallel downloads submenu
+        workers_menu = tk.Menu(popup, tearoff=0, bg=self.colors['bg_secondary'], fg=self.colors['text_primary'],
+                               activebackground=self.colors['accent'], activeforeground="white")
+        for count in (1, 2, 3, 4, 6, 8):
+            label = f"✓ {count}" if count == self.download_queue.max_workers else f"   {count}"
+            workers_menu.add_command(label=label, command=lambda c=count: self.set_max_workers(c))
+        popup.add_cascade(label="Parallel Downloads", menu=workers_menu)
+        
+        # Add bandwidth limit submenu
+        bandwidth_menu = tk.Menu(popup, tearoff=0, bg=self.colors['bg_secondary'], fg=self.colors['text_primary'],
+                                 activebackground=self.colors['accent'], activeforeground="white")
+        current_limit = self.converter.governor.limit
+        for mbps in BANDWIDTH_CHOICES:
+            limit = mbps * 1024 * 1024 if mbps else None
+            label = f"{mbps} MB/s" if mbps else "Unlimited"
+            bandwidth_menu.add_command(label=f"✓ {label}" if limit == current_limit else f"   {label}",
+                                       command=lambda l=limit: self.set_bandwidth_limit(l))
+        popup.add_cascade(label="Bandwidth Limit", menu=bandwidth_menu)
+        
+        # Add URL list import (or stop the one in progress)
+        import_text = "Stop Importing URLs" if self.ingester is not None else "Import URL List..."
+        popup.add_command(label=import_text, command=self.import_url_list)
+        
         # Display the menu
         try:
             x = self.menu_button.winfo_rootx()
@@ -473,19 +604,126 @@ class ModernYouTubeDownloader:
             # Make sure to release the grab
             popup.grab_release()
 
+    def set_output_format(self, codec, quality):
+        """Change the output codec and bitrate for newly started jobs"""
+        self.converter.codec = codec
+        self.converter.quality = str(quality)
+        self.convert_button.config(text=self.convert_button_text())
+        print(f"Output format set to: {codec}" + ("" if codec == ORIGINAL else f" {quality} kbps"))
+        #save settings
+        self.save_settings()
+    
+    def convert_button_text(self):
+        if self.converter.codec == ORIGINAL:
+            return "Download Audio"
+        return f"Convert to {self.converter.codec.upper()}"
+    
+    def toggle_log_file(self):
+        """Start or stop copying console output to a rotating log file"""
+        if self.log_sink.file_enabled:
+            self.log_sink.close_file()
+            print("Log file disabled")
+        else:
+            try:
+                self.log_sink.open_file(LOG_FILE)
+                print(f"Writing log file: {LOG_FILE}")
+            except Exception as e:
+                print(f"Error opening log file: {e}")
+        #save settings
+        self.save_settings()
+    
+    def flush_console(self):
+        """Append buffered log lines to the console widget in one update"""
+        try:
+            lines = self.log_sink.drain()
+            if lines:
+                self.console_output.config(state=tk.NORMAL)
+                self.console_output.insert(tk.END, "\n".join(lines) + "\n")
+                # Keep only the newest lines so the widget never grows without bound
+                line_count = int(self.console_output.index('end-1c').split('.')[0])
+                excess = line_count - self.log_sink.max_lines
+                if excess > 0:
+                    self.console_output.delete('1.0', f'{excess + 1}.0')
+                self.console_output.see(tk.END)
+                self.console_output.config(state=tk.DISABLED)
+        except Exception as e:
+            self.original_stdout.write(f"Error updating console: {e}\n")
+        finally:
+            self.root.after(LOG_FLUSH_MS, self.flush_console)
+    
+    def on_close(self):
+        """Flush the log file and close the window"""
+        sys.stdout = self.original_stdout
+        if self.ingester is not None:
+            self.ingester.stop()
+        self.log_sink.close_file()
+        self.download_queue.close()
+        self.root.destroy()
+    
+    def toggle_streaming(self):
+        """Switch between encoding while downloading and encoding afterwards"""
+        self.converter.streaming = not self.converter.streaming
+        print(f"Streaming conversion {'enabled' if self.converter.streaming else 'disabled'}")
+        #save settings
+        self.save_settings()
+    
+    def toggle_split_chapters(self):
+        """Switch between one file per video and one file per chapter"""
+        self.converter.split_chapters = not self.converter.split_chapters
+        print(f"Chapter splitting {'enabled' if self.converter.split_chapters else 'disabled'}")
+        #save settings
+        self.save_settings()
+    
+    def toggle_segment_encoding(self):
+        """Switch between encoding long MP3s on one core and on all of them"""
+        self.converter.segment_encoding = not self.converter.segment_encoding
+        print(f"Parallel MP3 encoding {'enabled' if self.converter.segment_encoding else 'disabled'}")
+        #save settings
+        self.save_settings()
+    
+    def toggle_shortest_first(self):
+        """Switch between running jobs in the order they were queued and shortest first"""
+        self.download_queue.shortest_first = not self.download_queue.shortest_first
+        print(f"Shortest jobs first {'enabled' if self.download_queue.shortest_first else 'disabled'}")
+        #save settings
+        self.save_settings()
+    
+    def set_max_workers(self, count):
+        """Change how many conversions run at the same time"""
+        self.download_queue.set_max_workers(count)
+        print(f"Parallel downloads set to: {count}")
+        #save settings
+        self.save_settings()
+
+    def set_bandwidth_limit(self, limit):
+        """Change the download bandwidth shared by all running jobs"""
+        self.converter.governor.set_limit(limit)
+        print("Bandwidth limit: " + (f"{limit / 1024 / 1024:.0f} MB/s" if limit else "unlimited"))
+        #save settings
+        self.save_settings()
 
     def save_settings(self):
         """Save current settings to a JSON file"""
         settings = {
             'dark_mode': self.dark_mode,
             'console_visible': self.console_visible,
-            'save_location': self.save_entry.get()
+            'save_location': self.save_entry.get(),
+            'max_workers': self.download_queue.max_workers,
+            'bandwidth_limit': self.converter.governor.limit,
+            'concurrent_fragments': self.converter.concurrent_fragments,
+            'http_chunk_size': self.converter.http_chunk_size,
+            'streaming': self.converter.streaming,
+            'split_chapters': self.converter.split_chapters,
+            'segment_encoding': self.converter.segment_encoding,
+            'shortest_first': self.download_queue.shortest_first,
+            'codec': self.converter.codec,
+            'quality': self.converter.quality,
+            'log_to_file': self.log_sink.file_enabled
         }
         
         # Save to a settings file in user's home directory
-        settings_dir = os.path.join(os.path.expanduser("~"), ".youtube_mp3_converter")
-        os.makedirs(settings_dir, exist_ok=True)
-        settings_file = os.path.join(settings_dir, "settings.json")
+        os.makedirs(SETTINGS_DIR, exist_ok=True)
+        settings_file = SETTINGS_FILE
         
         try:
             with open(settings_file, 'w') as f:
@@ -496,7 +734,7 @@ class ModernYouTubeDownloader:
 
     def load_settings(self):
         """Load settings from JSON file"""
-        settings_file = os.path.join(os.path.expanduser("~"), ".youtube_mp3_converter", "settings.json")
+        settings_file = SETTINGS_FILE
         
         if not os.path.exists(settings_file):
             print("No saved settings found, using defaults")
@@ -522,6 +760,38 @@ class ModernYouTubeDownloader:
             if 'save_location' in settings and settings['save_location']:
                 self.save_entry.delete(0, tk.END)
                 self.save_entry.insert(0, settings['save_location'])
+            
+            if settings.get('codec') in OUTPUT_CODECS:
+                self.converter.codec = settings['codec']
+                self.converter.quality = str(settings.get('quality') or self.converter.quality)
+                self.convert_button.config(text=self.convert_button_text())
+            
+            if 'streaming' in settings:
+                self.converter.streaming = bool(settings['streaming'])
+            
+            if 'split_chapters' in settings:
+                self.converter.split_chapters = bool(settings['split_chapters'])
+            
+            if 'segment_encoding' in settings:
+                self.converter.segment_encoding = bool(settings['segment_encoding'])
+            
+            if 'shortest_first' in settings:
+                self.download_queue.shortest_first = bool(settings['shortest_first'])
+            
+            if 'max_workers' in settings and settings['max_workers']:
+                self.download_queue.set_max_workers(settings['max_workers'])
+            
+            if 'bandwidth_limit' in settings:
+                self.converter.governor.set_limit(settings['bandwidth_limit'])
+            
+            if settings.get('concurrent_fragments'):
+                self.converter.concurrent_fragments = int(settings['concurrent_fragments'])
+            
+            if settings.get('http_chunk_size'):
+                self.converter.http_chunk_size = int(settings['http_chunk_size'])
+            
+            if settings.get('log_to_file') and not self.log_sink.file_enabled:
+                self.log_sink.open_file(LOG_FILE)
                 
             print("Settings loaded successfully")
         except Exception as e:
@@ -564,203 +834,149 @@ class ModernYouTubeDownloader:
         
         animate_to(current, target)
     
-    def progress_hook(self, d):
-        """Progress hook for yt-dlp"""
-        if d['status'] == 'downloading':
-            # Print detailed info to console
-            if 'speed' in d and d['speed'] is not None:
-                speed_mb = d['speed'] / 1024 / 1024
-                eta = d.get('eta', 'unknown')
-                print(f"Download speed: {speed_mb:.2f} MB/s | ETA: {eta} seconds")
-                
-            # Update status with basic info
-            self.update_status(f"Downloading... Please wait")
-                
-            # Update progress bar
-            if 'total_bytes' in d and d['total_bytes']:
-                percent = d['downloaded_bytes'] / d['total_bytes'] * 100
-                self.update_progress_bar(percent)
-                print(f"Progress: {percent:.1f}%")
-            elif 'total_bytes_estimate' in d and d['total_bytes_estimate']:
-                percent = d['downloaded_bytes'] / d['total_bytes_estimate'] * 100
-                self.update_progress_bar(percent)
-                print(f"Progress: {percent:.1f}% (estimated)")
-                
-        elif d['status'] == 'finished':
-            print("Download complete. Converting to MP3...")
-            self.update_status("Processing audio... Please wait")
-            self.update_progress_bar(100)
+    def on_job_status(self, job, text):
+        """Status callback from the conversion engine (worker thread)"""
+        self.progress_bus.publish(job, status=text)
+    
+    def on_job_progress(self, job, d):
+        """Progress callback from the conversion engine (worker thread)"""
+        self.progress_bus.publish(job)
+    
+    def on_job_changed(self, job):
+        """Called by the download queue whenever a job changes state (any thread)"""
+        self.progress_bus.publish(job, changed=True)
     
-    def download_mp3(self):
-        """Download YouTube video as MP3"""
+    def drain_progress(self):
+        """Apply everything published since the last frame, then schedule the next one"""
         try:
-            url = self.link_entry.get()
-            save_path = self.save_entry.get()
-            final_mp3_path = None
-            temp_dir = None
-            
-            if not url:
-                self.update_status("Error: Please enter a YouTube URL")
-                print("Error: No YouTube URL provided")
-                return
-            
-            # Validate URL
-            if not re.match(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+$', url):
-                self.update_status("Error: Invalid YouTube URL")
-                print(f"Error: Invalid YouTube URL: {url}")
-                return
-            
-            # Make sure save path exists
-            if not os.path.exists(save_path):
-                try:
-                    os.makedirs(save_path)
-                    print(f"Created save directory: {save_path}")
-                except Exception as e:
-                    self.update_status(f"Error: Cannot create save directory")
-                    print(f"Error creating save directory: {e}")
-                    return
-            
-            # Check write permissions
-            if not os.access(save_path, os.W_OK):
-                self.update_status("Error: No write permission to save location")
-                print(f"Error: No write permission to save location: {save_path}")
-                return
-                
-            print(f"Starting download from: {url}")
-            print(f"Save location: {save_path}")
-            
-            self.update_status("Getting video information...")
-            print("Retrieving video information...")
-            
-            # Reset progress bar
-            self.update_progress_bar(0)
-            
+            events = self.progress_bus.drain()
+            if events:
+                self.apply_progress(events)
+        except Exception as e:
+            print(f"Error updating progress: {e}")
+        finally:
+            self.root.after(UI_FRAME_MS, self.drain_progress)
+    
+    def apply_progress(self, events):
+        """Update the status line, progress bar and batch from one frame of bus events"""
+        finished = False
+        for event in events:
+            job = event['job']
+            # Entries of an expanded playlist join the batch of their playlist
+            if job.parent is not None and job.parent.id in self.batch_jobs:
+                self.batch_jobs.setdefault(job.id, job)
+            if job.id in self.imported_job_ids:
+                self.imported_job_ids.discard(job.id)
+                self.batch_jobs.setdefault(job.id, job)
+            if event['changed'] and job.state in FINISHED_STATES:
+                finished = True
+        
+        # Only the newest message is visible anyway
+        latest = events[-1]
+        if latest['changed']:
+            text = self.describe_job(latest['job'])
+        else:
+            text = latest['status']
+        if text:
+            self.update_status(text)
+        self.update_progress_bar(self.batch_percent())
+        
+        unfinished = any(job.state not in FINISHED_STATES for job in self.batch_jobs.values())
+        self.cancel_button.config(state=tk.NORMAL if unfinished or self.ingester is not None else tk.DISABLED)
+        
+        if finished and self.batch_jobs and self.download_queue.is_idle() and self.ingester is None:
+            batch = list(self.batch_jobs.values())
+            self.batch_jobs = {}
+            self.root.after(500, lambda: self.show_batch_result(batch))
+    
+    def describe_job(self, job):
+        """Status line for a job that just changed state"""
+        counts = self.download_queue.counts()
+        summary = (f"{counts[JOB_RUNNING]} running, {counts[JOB_QUEUED]} queued, "
+                   f"{counts[JOB_DONE]} done, {counts[JOB_FAILED]} failed")
+        
+        if job.state == JOB_DONE and job.children:
+            return f"Playlist expanded into {len(job.children)} jobs ({summary})"
+        elif job.state == JOB_DONE:
+            return f"✓ Saved {os.path.basename(job.output_path)} ({summary})"
+        elif job.state == JOB_FAILED:
+            return f"Error in job #{job.id}: {job.error} ({summary})"
+        elif job.state == JOB_RUNNING:
+            return f"Converting... {summary}"
+        return job.status_text
+    
+    def batch_percent(self):
+        """Average progress over the jobs in the current batch"""
+        # Expanded playlists are only placeholders for their entries
+        jobs = [job for job in self.batch_jobs.values() if not job.children]
+        if not jobs:
+            return 0
+        total = 0
+        for job in jobs:
+            total += 100 if job.state in FINISHED_STATES else job.percent
+        return total / len(jobs)
+    
+    def show_batch_result(self, batch):
+        """Report the outcome of a finished batch of jobs"""
+        succeeded = [job for job in batch if job.state == JOB_DONE and job.output_path]
+        failed = [job for job in batch if job.state == JOB_FAILED]
+        
+        if failed:
+            details = "\n".join(f"{ERROR_LABELS[job.error_class or ERROR_OTHER]} - {job.url}: {job.error}"
+                                for job in failed[:10])
+            if len(failed) > 10:
+                details += f"\n... and {len(failed) - 10} more"
+            messagebox.showerror(
+                "Error",
+                f"{len(failed)} of {len(succeeded) + len(failed)} conversion(s) failed:\n{details}"
+            )
+        
+        if not succeeded:
+            return
+        
+        if len(succeeded) == 1:
+            final_mp3_path = succeeded[0].output_path
+            message = f"File saved to:\n{final_mp3_path}\n\nWould you like to open the file location?"
+        else:
+            final_mp3_path = succeeded[-1].output_path
+            message = (f"{len(succeeded)} files saved to:\n{os.path.dirname(final_mp3_path)}"
+                       f"\n\nWould you like to open the file location?")
+        folder_path = os.path.dirname(final_mp3_path)
+        
+        # Ask if user wants to open the file location
+        response = messagebox.askquestion("Success", message, icon='info')
+        
+        if response == 'yes':
             try:
-                # Create a temporary directory for download
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                temp_dir = os.path.join(save_path, f"_temp_youtube_dl_{timestamp}")
-                os.makedirs(temp_dir, exist_ok=True)
-                print(f"Created temporary directory: {temp_dir}")
-                
-                # Configure yt-dlp options
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                    'progress_hooks': [self.progress_hook],
-                    'verbose': True,
-                    'logger': self.custom_logger,
-                }
-                
-                # Download and convert the video
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=True)
-                    video_title = info_dict.get('title', 'Unknown')
-                    print(f"Downloaded: {video_title}")
+                # Open file explorer and select the specific file
+                if sys.platform == 'win32':
+                    # This opens Explorer and selects the specific file
+                    os.system(f'explorer /select,"{final_mp3_path}"')
+                elif sys.platform == 'darwin':  # macOS
+                    os.system(f'open -R "{final_mp3_path}"')
+                else:  # Linux
+                    # For Linux, we'll just open the folder as file selection varies by desktop environment
+                    os.system(f'xdg-open "{folder_path}"')
                     
-                    # Clean title for filename
-                    clean_title = re.sub(r'[^\w\s.-]', '_', video_title)
-                    clean_title = re.sub(r'\s+', ' ', clean_title).strip()
-                    
-                    # Find the mp3 file in the temp directory
-                    temp_mp3_path = None
-                    for file in os.listdir(temp_dir):
-                        if file.endswith('.mp3'):
-                            temp_mp3_path = os.path.join(temp_dir, file)
-                            print(f"Found MP3 file: {temp_mp3_path}")
-                            break
-                    
-                    if not temp_mp3_path:
-                        raise FileNotFoundError(f"MP3 file not found in temporary directory: {temp_dir}")
-                    
-                    # Final mp3 path in the output directory
-                    mp3_filename = f"{clean_title}.mp3"
-                    final_mp3_path = os.path.join(save_path, mp3_filename)
-                    
-                    # Check if file already exists
-                    counter = 1
-                    base_name, ext = os.path.splitext(mp3_filename)
-                    while os.path.exists(final_mp3_path):
-                        final_mp3_path = os.path.join(save_path, f"{base_name}_{counter}{ext}")
-                        counter += 1
-                        print(f"File already exists, will save as: {final_mp3_path}")
-                    
-                    # Copy the file from temp to final destination
-                    try:
-                        shutil.copy2(temp_mp3_path, final_mp3_path)
-                        print(f"Successfully copied MP3 file to: {final_mp3_path}")
-                        
-                        # Verify the file exists and has a non-zero size
-                        if not os.path.exists(final_mp3_path) or os.path.getsize(final_mp3_path) == 0:
-                            raise Exception(f"File copy verification failed for {final_mp3_path}")
-                            
-                    except Exception as e:
-                        print(f"Error copying file: {e}")
-                        raise Exception(f"Failed to copy MP3 file: {e}")
-            
-            finally:
-                # Clean up the temporary directory - but only after we're sure we have the file
-                if temp_dir and os.path.exists(temp_dir) and final_mp3_path and os.path.exists(final_mp3_path):
-                    try:
-                        time.sleep(1)  # Small delay to ensure file operations are complete
-                        shutil.rmtree(temp_dir)
-                        print(f"Removed temporary directory: {temp_dir}")
-                    except Exception as e:
-                        print(f"Warning: Could not clean up temp files: {e}")
-            
-            # Final success check
-            if final_mp3_path and os.path.exists(final_mp3_path):
-                print(f"✓ Conversion completed successfully!")    
-                self.update_status(f"✓ Success! MP3 file saved")
-                
-                # Keep at 100% for a moment before showing success message
-                def show_success():
-                    # Open file explorer to show the file
-                    folder_path = os.path.dirname(final_mp3_path)
-                    file_name = os.path.basename(final_mp3_path)
-                    
-                    # Ask if user wants to open the file location
-                    response = messagebox.askquestion(
-                        "Success", 
-                        f"MP3 file saved to:\n{final_mp3_path}\n\nWould you like to open the file location?",
-                        icon='info'
-                    )
-                    
-                    if response == 'yes':
-                        try:
-                            # Open file explorer and select the specific file
-                            if sys.platform == 'win32':
-                                # This opens Explorer and selects the specific file
-                                os.system(f'explorer /select,"{final_mp3_path}"')
-                            elif sys.platform == 'darwin':  # macOS
-                                os.system(f'open -R "{final_mp3_path}"')
-                            else:  # Linux
-                                # For Linux, we'll just open the folder as file selection varies by desktop environment
-                                os.system(f'xdg-open "{folder_path}"')
-                                
-                            # Play a notification sound (Windows only)
-                            if sys.platform == 'win32':
-                                import winsound
-                                winsound.MessageBeep(winsound.MB_ICONINFORMATION)
-                        except Exception as e:
-                            print(f"Error opening file location: {e}")
-                
-                self.root.after(500, show_success)
-            else:
-                raise Exception(f"MP3 file not found at expected location: {final_mp3_path}")
-            
-        except Exception as e:
-            err_msg = str(e)
-            print(f"Error: {err_msg}")
-            self.update_status(f"Error: {err_msg}")
-            messagebox.showerror("Error", f"An error occurred:\n{err_msg}")
+                # Play a notification sound (Windows only)
+                if sys.platform == 'win32':
+                    import winsound
+                    winsound.MessageBeep(winsound.MB_ICONINFORMATION)
+            except Exception as e:
+                print(f"Error opening file location: {e}")
+    
+    def resume_jobs(self):
+        """Requeue unfinished jobs from the journal as a new batch"""
+        resumed = self.download_queue.resume()
+        if not resumed:
+            return
+        for job in resumed:
+            self.batch_jobs.setdefault(job.id, job)
+        self.update_status(f"Resuming {len(resumed)} unfinished job(s)")
+        print(f"Resuming {len(resumed)} unfinished job(s) from the last session")
     
     def start_conversion(self):
-        """Start conversion in a separate thread to keep UI responsive"""
+        """Queue every URL in the input box for conversion"""
         # Show pulsing animation on button
         original_bg = self.convert_button.cget("bg")
         self.convert_button.config(bg=self.colors['accent_secondary'])
@@ -770,23 +986,100 @@ class ModernYouTubeDownloader:
         
         self.root.after(200, reset_button)
         
-        # Disable the convert button during conversion
-        self.convert_button.config(state=tk.DISABLED)
+        # Several URLs may be pasted at once, separated by spaces or commas
+        urls = [u for u in re.split(r'[\s,]+', self.link_entry.get()) if u]
+        save_path = self.save_entry.get()
         
-        # Start conversion in a new thread
-        thread = threading.Thread(target=self.download_mp3)
-        thread.start()
+        if not urls:
+            self.update_status("Error: Please enter a YouTube URL")
+            print("Error: No YouTube URL provided")
+            return
         
-        # Check if thread is still running and re-enable button when done
-        def check_thread():
-            if thread.is_alive():
-                self.root.after(100, check_thread)
-            else:
-                self.convert_button.config(state=tk.NORMAL)
+        # Validate URLs; every spelling of a video URL is reduced to one canonical form
+        canonical = []
+        for url in urls:
+            if canonical_url(url) is None:
+                self.update_status("Error: Invalid YouTube URL")
+                print(f"Error: Invalid YouTube URL: {url}")
+                return
+            canonical.append(canonical_url(url))
+        
+        # A new batch starts whenever the queue had gone idle
+        if self.download_queue.is_idle():
+            self.batch_jobs = {}
+            self.update_progress_bar(0)
         
-        check_thread()
+        for url in canonical:
+            job = self.download_queue.submit(url, save_path)
+            # Duplicates of an unfinished job come back as that same job
+            self.batch_jobs.setdefault(job.id, job)
+            print(f"Queued job #{job.id}: {url}")
+        
+        # Clear the input so the next URLs can be pasted right away
+        self.link_entry.delete(0, tk.END)
+    
+    def cancel_conversion(self):
+        """Cancel every unfinished job in the current batch and stop any URL import"""
+        if self.ingester is not None:
+            self.ingester.stop()
+        cancelled = 0
+        for job in list(self.batch_jobs.values()):
+            if job.state not in FINISHED_STATES:
+                self.download_queue.cancel(job.id)
+                cancelled += 1
+        self.cancel_button.config(state=tk.DISABLED)
+        self.update_status(f"Cancelling {cancelled} job(s)...")
+        print(f"Cancelling {cancelled} job(s)")
+    
+    def import_url_list(self):
+        """Queue every URL in a text file; the file is read lazily on a background thread"""
+        if self.ingester is not None:
+            self.ingester.stop()
+            print("Stopping URL import")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="Import URL List",
+            filetypes=[("URL lists", "*.txt *.list *.urls"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        if self.download_queue.is_idle():
+            self.batch_jobs = {}
+            self.update_progress_bar(0)
+        
+        ingester = UrlIngester(self.download_queue, self.save_entry.get(), on_submit=self.on_job_imported,
+                               on_invalid=lambda url: print(f"Skipping invalid URL: {url}"))
+        self.ingester = ingester
+        
+        def run():
+            try:
+                ingester.feed_file(path)
+            except Exception as e:
+                print(f"Error importing {path}: {e}")
+            stats = ingester.stats()
+            print(f"Imported {stats['submitted']} URL(s) from {os.path.basename(path)} "
+                  f"({stats['duplicates']} repeated, {stats['invalid']} invalid)")
+            self.ingester = None
+        
+        threading.Thread(target=run, name='url-import', daemon=True).start()
+        self.update_status(f"Importing URLs from {os.path.basename(path)}...")
+    
+    def on_job_imported(self, job):
+        """Called by the URL importer for each job it queues (import thread)"""
+        self.imported_job_ids.add(job.id)
+        self.progress_bus.publish(job, changed=True)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouTube to MP3 Converter")
+    parser.add_argument('--startup-timing', action='store_true',
+                        help="print how long start-up took (imports, first paint, yt-dlp warm-up) and exit")
+    args = parser.parse_args()
+    startup_timer = StartupTimer() if args.startup_timing else None
+    if startup_timer:
+        startup_timer.mark('imports')
     root = tk.Tk()
     root.tk.call('wm', 'iconphoto', root._w, tk.PhotoImage(data='''
     R0lGODlhIAAgAOeJAAAAAAEBAQICAgMDAwQEBAUFBQYGBgcHBwgICAkJCQoKCgsLCwwMDA0NDQ4O
@@ -815,5 +1108,5 @@ if __name__ == "__main__":
     WBBBBB7YgAUQpBbUq0C5EiQFsQP9CqxAwxJkrLHH2nCEQaQaa+yxBVWK0A8abauttggh5MMXsNK6
     bRMDBQQAOw==
     '''))
-    app = ModernYouTubeDownloader(root)
+    app = ModernYouTubeDownloader(root, startup_timer=startup_timer)
     root.mainloop()
\ No newline at end of file